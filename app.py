@@ -7,19 +7,51 @@ Last Updated: 2026-02-26
 """
 
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
 import numpy as np
 from datetime import datetime, date
+from collections import OrderedDict, defaultdict, deque
 import hashlib
 import hmac
+import secrets
+import uuid
 import io
 import os
 import json
 import base64
+import html
+import http.cookies
+import threading
+import contextlib
+import tracemalloc
+import queue
+import bisect
+import time
+import pickle
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import glob
+import re
+import math
+import functools
+import sqlite3
+import unicodedata
+import yaml
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+import openpyxl
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import warnings
+
+try:
+    from streamlit.web.server.websocket_headers import _get_websocket_headers
+except ImportError:
+    _get_websocket_headers = None
 warnings.filterwarnings('ignore')
 
 # =============================================================================
@@ -288,12 +320,16 @@ def init_session_state():
         'username': None,
         'user_email': None,
         'login_time': None,
+        'login_user': None,
+        'auth_token': None,
+        'data_scope': None,
+        'cookie_action': None,
         'current_page': 'Dashboard',
         'data_cache': {},
         'last_refresh': datetime.now(),
         'filters': {},
         'notifications': [],
-        'audit_log': []
+        'session_id': uuid.uuid4().hex
     }
     
     for key, value in defaults.items():
@@ -307,91 +343,3588 @@ init_session_state()
 # =============================================================================
 
 class Authentication:
-    """Handle user authentication and session management"""
-    
-    def __init__(self):
-        self.users = {
-            'admin': {
-                'password': self._hash_password('admin123'),
-                'role': 'admin',
-                'name': 'System Administrator',
-                'email': 'admin@sgs.edu.my',
-                'department': 'Administration',
-                'avatar': '👨‍💼'
-            },
-            'principal': {
-                'password': self._hash_password('principal123'),
-                'role': 'principal',
-                'name': 'Dr. Elizabeth Warren',
-                'email': 'principal@sgs.edu.my',
-                'department': 'Leadership',
-                'avatar': '👩‍🏫'
-            },
-            'james.chen': {
-                'password': self._hash_password('teacher123'),
-                'role': 'teacher',
-                'name': 'Mr. James Chen',
-                'email': 'j.chen@sgs.edu.my',
-                'department': 'Mathematics',
-                'avatar': '👨‍🏫'
-            },
-            'sarah.lim': {
-                'password': self._hash_password('teacher123'),
-                'role': 'teacher',
-                'name': 'Ms. Sarah Lim',
-                'email': 's.lim@sgs.edu.my',
-                'department': 'Languages',
-                'avatar': '👩‍🏫'
-            },
-            'linda.tan': {
-                'password': self._hash_password('staff123'),
-                'role': 'staff',
-                'name': 'Ms. Linda Tan',
-                'email': 'l.tan@sgs.edu.my',
-                'department': 'Administration',
-                'avatar': '👩‍💼'
+    """Handle user authentication and session management
+    
+    Users are read from the credentials in config.yaml. Passwords are kept
+    as PBKDF2-SHA256 hashes ("pbkdf2_sha256$<iterations>$<salt>$<hash>");
+    plain-text passwords still in the file are hashed once on load. After
+    login a session carries a token signed with the cookie key, so reruns
+    check an HMAC instead of hashing the password again.
+    """
+    
+    def __init__(self, credentials, cookie, kdf_iterations=600000):
+        self.kdf_iterations = kdf_iterations
+        self.cookie_name = cookie.get('name', 'st_georges_auth')
+        self.cookie_key = str(cookie.get('key') or secrets.token_hex(32)).encode()
+        self.expiry_seconds = int(cookie.get('expiry_days', 30) * 86400)
+        self.users = {}
+        for username, info in (credentials.get('usernames') or {}).items():
+            password = str(info.get('password', ''))
+            if not password.startswith('pbkdf2_sha256$'):
+                password = self._hash_password(password)
+            self.users[username] = {
+                'password': password,
+                'role': info.get('role', 'staff'),
+                'name': info.get('name', username),
+                'email': info.get('email', ''),
+                'department': info.get('department', ''),
+                'avatar': info.get('avatar', '👤'),
+                'teacher_id': parse_id('TeacherID', info['teacher_id']) if info.get('teacher_id') else None
             }
-        }
-    
-    def _hash_password(self, password):
-        """Simple password hashing (use bcrypt in production)"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        # Unknown usernames are checked against this so they take as long as known ones
+        self._dummy_hash = self._hash_password(secrets.token_hex(16))
+    
+    def _hash_password(self, password, salt=None, iterations=None):
+        """Derive a PBKDF2-SHA256 hash; hashlib releases the GIL while it runs"""
+        salt = salt or secrets.token_bytes(16)
+        iterations = iterations or self.kdf_iterations
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+        return '$'.join([
+            'pbkdf2_sha256', str(iterations),
+            base64.b64encode(salt).decode(), base64.b64encode(digest).decode()
+        ])
+    
+    def _verify_password(self, password, encoded):
+        _, iterations, salt, _ = encoded.split('$')
+        candidate = self._hash_password(password, base64.b64decode(salt), int(iterations))
+        return hmac.compare_digest(candidate.encode(), encoded.encode())
     
     def authenticate(self, username, password):
         """Authenticate user credentials"""
-        if username in self.users:
-            hashed_input = self._hash_password(password)
-            if hashed_input == self.users[username]['password']:
-                return True, self.users[username]
+        user = self.users.get(username)
+        valid = self._verify_password(password, user['password'] if user else self._dummy_hash)
+        if user and valid:
+            return True, user
         return False, None
     
+    def _sign(self, payload):
+        return base64.urlsafe_b64encode(
+            hmac.new(self.cookie_key, payload.encode(), hashlib.sha256).digest()
+        ).decode().rstrip('=')
+    
+    def issue_token(self, username):
+        """Signed session token for a verified user, valid for the cookie expiry
+        
+        The signature also covers the user's password hash, so changing a
+        password ends that user's sessions.
+        """
+        expires = int(time.time()) + self.expiry_seconds
+        payload = f"{username}:{expires}"
+        signature = self._sign(f"{payload}:{self.users[username]['password']}")
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=') + '.' + signature
+    
+    def verify_token(self, token):
+        """Return the username a token was issued to, or None if forged or expired"""
+        try:
+            encoded, signature = str(token).split('.')
+            payload = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)).decode()
+            username, expires = payload.rsplit(':', 1)
+            expires = int(expires)
+        except ValueError:
+            return None
+        user = self.users.get(username)
+        if user is None or expires < time.time():
+            return None
+        if not hmac.compare_digest(signature, self._sign(f"{payload}:{user['password']}")):
+            return None
+        return username
+    
     def get_user_info(self, username):
         """Get user information"""
         return self.users.get(username, None)
 
+def start_session(auth, username, token=None):
+    """Mark this session as signed in and queue the session cookie"""
+    user_info = auth.get_user_info(username)
+    st.session_state.authenticated = True
+    st.session_state.user_role = user_info['role']
+    st.session_state.username = user_info['name']
+    st.session_state.user_email = user_info['email']
+    st.session_state.login_user = username
+    st.session_state.login_time = datetime.now()
+    st.session_state.auth_token = token or auth.issue_token(username)
+    st.session_state.cookie_action = None if token else 'set'
+    st.session_state.data_scope = DataScope(user_info['role'], user_info['teacher_id'])
+
+def end_session():
+    """Sign this session out and queue removal of the session cookie"""
+    st.session_state.authenticated = False
+    st.session_state.user_role = None
+    st.session_state.username = None
+    st.session_state.login_user = None
+    st.session_state.auth_token = None
+    st.session_state.data_scope = None
+    st.session_state.cookie_action = 'clear'
+
+def read_cookie(name):
+    """Value of a cookie the browser sent when this session connected"""
+    if _get_websocket_headers is None:
+        return None
+    try:
+        headers = _get_websocket_headers() or {}
+    except RuntimeError:
+        # Not connected through a browser websocket, e.g. under test
+        return None
+    morsel = http.cookies.SimpleCookie(headers.get('Cookie', '')).get(name)
+    return morsel.value if morsel else None
+
+def write_cookie(name, value, max_age):
+    """Set a cookie in the browser, or clear it with max_age 0"""
+    cookie = f"{name}={value}; max-age={int(max_age)}; path=/; SameSite=Strict"
+    components.html(f"<script>window.parent.document.cookie = {json.dumps(cookie)};</script>", height=0)
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+@st.cache_resource
+def load_config():
+    """Load config.yaml once per process"""
+    config_path = os.path.join(APP_DIR, 'config.yaml')
+    if not os.path.exists(config_path):
+        return {}
+    with open(config_path) as f:
+        return yaml.safe_load(f) or {}
+
+@st.cache_resource
+def get_authentication():
+    """Return the process-wide authenticator, built from config.yaml once"""
+    config = load_config()
+    return Authentication(
+        config.get('credentials', {}),
+        config.get('cookie', {}),
+        config.get('auth', {}).get('kdf_iterations', 600000)
+    )
+
+# =============================================================================
+# DATA SCHEMA
+# =============================================================================
+
+LEVELS = ['Year 1', 'Year 2', 'Year 3', 'Year 4', 'Year 5', 'Year 6',
+          'Year 7', 'Year 8', 'Year 9', 'Year 10', 'Year 11']
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+
+LEVEL_DTYPE = pd.CategoricalDtype(LEVELS, ordered=True)
+DAY_DTYPE = pd.CategoricalDtype(DAYS, ordered=True)
+
+# Integer ID columns and how they are displayed: prefix and zero-padded width
+ID_FORMATS = {
+    'StudentID': ('STU', 4),
+    'ParentID': ('PAR', 4),
+    'TeacherID': ('TCH', 3),
+    'StaffID': ('STF', 3)
+}
+
+# Tables whose rows are identified by an allocated ID
+ID_COLUMNS = {
+    'students': 'StudentID',
+    'parents': 'ParentID',
+    'teachers': 'TeacherID',
+    'staff': 'StaffID'
+}
+
+# Tables keeping the rows another table retires, under the same IDs; graduates move to alumni
+ARCHIVE_TABLES = {
+    'students': 'alumni'
+}
+
+# In-memory dtypes per table; columns not listed keep their inferred dtype
+TABLE_SCHEMAS = {
+    'students': {
+        'StudentID': 'int32',
+        'DOB': 'datetime64[ns]',
+        'Gender': 'category',
+        'CurrentLevel': LEVEL_DTYPE,
+        'Class': 'category',
+        'ParentID': 'int32',
+        'AvgScore': 'float32',
+        'Attendance%': 'float32',
+        'PromotionStatus': 'category',
+        'NextLevel': 'category'
+    },
+    'parents': {
+        'ParentID': 'int32',
+        'Address': 'category',
+        'Occupation': 'category'
+    },
+    'teachers': {
+        'TeacherID': 'int16',
+        'SubjectSpecialty': 'category',
+        'EmploymentStatus': 'category',
+        'AssignedPeriods': 'int16',
+        'WorkloadStatus': 'category'
+    },
+    'staff': {
+        'StaffID': 'int16',
+        'Role': 'category',
+        'EmploymentStatus': 'category'
+    },
+    'results': {
+        'StudentID': 'int32',
+        'Year': 'int16',
+        'Level': LEVEL_DTYPE,
+        'Class': 'category',
+        'AverageScore': 'float32',
+        'Attendance%': 'float32'
+    },
+    'timetable': {
+        'Class': 'category',
+        'Subject': 'category',
+        'TeacherID': 'int16',
+        'Day': DAY_DTYPE,
+        'Period': 'int8',
+        'Room': 'category'
+    }
+}
+TABLE_SCHEMAS['alumni'] = dict(TABLE_SCHEMAS['students'], GraduationYear='int16')
+
+def parse_dates(values, errors='raise'):
+    """Parse ISO dates, then read whatever is left as day-first"""
+    parsed = pd.to_datetime(values, format='ISO8601', errors='coerce')
+    other = parsed.isna() & values.notna()
+    if other.any():
+        parsed[other] = pd.to_datetime(values[other], format='mixed', dayfirst=True, errors=errors)
+    return parsed
+
+def apply_schema(name, df):
+    """Cast a table to its compact in-memory schema
+    
+    Legacy formatted values ("STU0001", "87%", "31/01/2010") are parsed too,
+    so stores written before the schema existed still load.
+    """
+    df = df.copy(deep=False)
+    for column, dtype in TABLE_SCHEMAS.get(name, {}).items():
+        if column not in df.columns:
+            continue
+        values = df[column]
+        if values.dtype == object:
+            if column in ID_FORMATS:
+                values = values.astype(str).str.replace(r'\D', '', regex=True).astype('int64')
+            elif column.endswith('%'):
+                values = values.astype(str).str.rstrip('%').astype(float)
+            elif dtype == 'datetime64[ns]':
+                values = parse_dates(values)
+        df[column] = values.astype(dtype)
+    return df
+
+def empty_archive(name, table):
+    """An archive table with no rows yet, shaped like the table it archives"""
+    return apply_schema(name, table.iloc[:0].assign(GraduationYear=0))
+
+def format_ids(df):
+    """Return a copy of df with integer ID columns shown as e.g. STU0001"""
+    df = df.copy()
+    for column, (prefix, width) in ID_FORMATS.items():
+        if column in df.columns and pd.api.types.is_integer_dtype(df[column]):
+            df[column] = prefix + df[column].astype(str).str.zfill(width)
+    return df
+
+def format_id(column, value):
+    """Format a single integer ID for display"""
+    prefix, width = ID_FORMATS[column]
+    return f"{prefix}{str(int(value)).zfill(width)}"
+
+def parse_id(column, text):
+    """Turn 'STU0012', 'stu12' or '12' into the integer ID, or None"""
+    prefix, _ = ID_FORMATS[column]
+    match = re.fullmatch(rf'(?:{prefix})?\s*(\d+)', str(text).strip(), re.IGNORECASE)
+    return int(match.group(1)) if match else None
+
+# =============================================================================
+# ACCESS CONTROL
+# =============================================================================
+
+# Pages each role may open; roles not listed may open every page
+ROLE_PAGES = {
+    'staff': ['Dashboard', 'Students', 'Teachers', 'Timetable', 'Reports']
+}
+
+# Pages only administrators may open
+ADMIN_PAGES = ['Diagnostics']
+
+# Columns holding academic records, hidden from non-academic roles
+ACADEMIC_COLUMNS = {
+    'students': ['AvgScore', 'Attendance%', 'PromotionStatus', 'NextLevel'],
+    'alumni': ['AvgScore', 'Attendance%', 'PromotionStatus', 'NextLevel']
+}
+
+# Reports built from academic records
+ACADEMIC_REPORTS = [
+    "Student Performance Report",
+    "Attendance Summary",
+    "Promotion Summary",
+    "School Statistics"
+]
+
+def class_codes(levels, classes):
+    """Timetable class names ('7B') for level and class columns ('Year 7', 'B')"""
+    return levels.astype(str).str.replace('Year ', '', regex=False) + classes.astype(str)
+
+class DataScope:
+    """The rows and columns one login may see
+    
+    Teachers see the classes they teach in the timetable, with those
+    classes' students, parents and results; staff see everything except
+    academic records. The rules are compiled into one boolean row mask per
+    restricted table, which the data manager caches per data version.
+    """
+    
+    def __init__(self, role, teacher_id=None):
+        self.role = role
+        self.teacher_id = teacher_id
+    
+    @property
+    def key(self):
+        return (self.role, self.teacher_id)
+    
+    @property
+    def unrestricted(self):
+        return self.role not in ('teacher', 'staff')
+    
+    @property
+    def academic(self):
+        """Whether results and academic columns are visible"""
+        return self.role != 'staff'
+    
+    def pages(self, pages):
+        allowed = ROLE_PAGES.get(self.role)
+        return [
+            page for page in pages
+            if (allowed is None or page in allowed) and (self.role == 'admin' or page not in ADMIN_PAGES)
+        ]
+    
+    def reports(self, reports):
+        return [report for report in reports if self.academic or report not in ACADEMIC_REPORTS]
+    
+    def hidden_columns(self, name):
+        return [] if self.academic else ACADEMIC_COLUMNS.get(name, [])
+    
+    def compile(self, tables):
+        """Boolean row mask per restricted table; tables left out are visible in full"""
+        masks = {}
+        if self.role == 'teacher':
+            timetable = tables['timetable']
+            taught = timetable.loc[timetable['TeacherID'] == self.teacher_id, 'Class'].astype(str).unique()
+            masks['timetable'] = timetable['Class'].isin(taught).to_numpy()
+            students = tables['students']
+            masks['students'] = class_codes(students['CurrentLevel'], students['Class']).isin(taught).to_numpy()
+            results = tables['results']
+            masks['results'] = class_codes(results['Level'], results['Class']).isin(taught).to_numpy()
+            parent_ids = students['ParentID'].to_numpy()[masks['students']]
+            masks['parents'] = tables['parents']['ParentID'].isin(parent_ids).to_numpy()
+            masks['alumni'] = np.zeros(len(tables['alumni']), dtype=bool)
+        elif not self.academic:
+            masks['results'] = np.zeros(len(tables['results']), dtype=bool)
+        return masks
+    
+    def apply(self, name, df, mask=None):
+        """The part of one table this scope may see"""
+        if mask is not None:
+            df = df[mask]
+        hidden = self.hidden_columns(name)
+        return df.drop(columns=hidden) if hidden else df
+
+# =============================================================================
+# COLUMNAR STORAGE
+# =============================================================================
+
+class ColumnarStore:
+    """Persist each table as a directory of Arrow IPC (Feather v2) chunks
+    
+    Chunks are written uncompressed so reads can memory-map them and numeric
+    columns come back without a copy. Appends add a new chunk instead of
+    rewriting the table, and edits rewrite only the chunks holding the
+    edited rows; compact() folds the chunks back into files of CHUNK_ROWS
+    rows, and runs by itself once a table has MAX_CHUNKS smaller chunks.
+    """
+    
+    MAX_CHUNKS = 64
+    CHUNK_ROWS = 1 << 14
+    
+    def __init__(self, root, data_files):
+        self.root = root
+        self.data_files = data_files
+    
+    def _table_dir(self, name):
+        return os.path.join(self.root, self.data_files[name])
+    
+    def _chunks(self, name):
+        return sorted(glob.glob(os.path.join(self._table_dir(name), 'part-*.arrow')))
+    
+    def _write_chunk(self, path, table):
+        """Write a chunk atomically so readers never see a partial file"""
+        tmp_path = path + '.tmp'
+        feather.write_feather(table, tmp_path, compression='uncompressed')
+        os.replace(tmp_path, path)
+    
+    def _chunk_rows(self, chunks):
+        """Rows in each chunk, read from the memory-mapped file footers"""
+        return [feather.read_table(path, memory_map=True).num_rows for path in chunks]
+    
+    def _schema(self, name):
+        chunks = self._chunks(name)
+        if not chunks:
+            return None
+        with pa.memory_map(chunks[0]) as source:
+            return pa.ipc.open_file(source).schema
+    
+    def has_table(self, name):
+        """True when a table has at least one chunk on disk"""
+        return bool(self._chunks(name))
+    
+    def exists(self):
+        """True when every table has at least one chunk on disk
+        
+        Archive tables are left out, so stores written before one existed
+        still load; the archive starts empty.
+        """
+        return all(self.has_table(name) for name in self.data_files if name not in ARCHIVE_TABLES.values())
+    
+    def read_table(self, name):
+        """Read a table by memory-mapping all of its chunks"""
+        chunks = [feather.read_table(path, memory_map=True) for path in self._chunks(name)]
+        if not chunks:
+            raise FileNotFoundError(f"No data on disk for table: {name}")
+        return apply_schema(name, pa.concat_tables(chunks).to_pandas())
+    
+    def write_table(self, name, df):
+        """Replace a table with chunks of CHUNK_ROWS rows"""
+        table_dir = self._table_dir(name)
+        os.makedirs(table_dir, exist_ok=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        old_chunks = self._chunks(name)
+        written = set()
+        for number, start in enumerate(range(0, max(len(df), 1), self.CHUNK_ROWS)):
+            path = os.path.join(table_dir, f'part-{str(number).zfill(5)}.arrow')
+            self._write_chunk(path, table.slice(start, self.CHUNK_ROWS))
+            written.add(path)
+        for path in old_chunks:
+            if path not in written:
+                os.remove(path)
+    
+    def update(self, name, df, positions, key_column):
+        """Save edits to the rows at positions of df, rewriting only the chunks holding them"""
+        schema = self._schema(name)
+        chunks = self._chunks(name)
+        bounds = np.cumsum([0] + self._chunk_rows(chunks))
+        if schema is None or bounds[-1] != len(df):
+            self.write_table(name, df)
+            return
+        for number in np.unique(np.searchsorted(bounds, positions, 'right') - 1):
+            rows = df.iloc[bounds[number]:bounds[number + 1]]
+            self._write_chunk(
+                chunks[number], pa.Table.from_pandas(rows[schema.names], schema=schema, preserve_index=False)
+            )
+    
+    def append(self, name, df):
+        """Append rows as a new chunk, cast to the table's existing schema"""
+        schema = self._schema(name)
+        if schema is None:
+            self.write_table(name, df)
+            return
+        table = pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+        last = os.path.basename(self._chunks(name)[-1])
+        next_index = int(last[len('part-'):-len('.arrow')]) + 1
+        self._write_chunk(
+            os.path.join(self._table_dir(name), f'part-{str(next_index).zfill(5)}.arrow'),
+            table
+        )
+        chunks = self._chunks(name)
+        if len(chunks) >= self.MAX_CHUNKS and sum(
+            rows < self.CHUNK_ROWS for rows in self._chunk_rows(chunks)
+        ) >= self.MAX_CHUNKS:
+            self.compact(name)
+    
+    def compact(self, name):
+        """Merge all chunks of a table into as few files as CHUNK_ROWS allows"""
+        if len(self._chunks(name)) > 1:
+            self.write_table(name, self.read_table(name))
+    
+    def read_sequences(self):
+        """Next free ID per table, as last saved"""
+        path = os.path.join(self.root, 'sequences.json')
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+    
+    def write_sequence(self, name, next_id):
+        """Save a table's next free ID, replacing the file atomically"""
+        sequences = self.read_sequences()
+        sequences[name] = int(next_id)
+        path = os.path.join(self.root, 'sequences.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(sequences, f)
+        os.replace(path + '.tmp', path)
+
+# =============================================================================
+# SQLITE STORAGE
+# =============================================================================
+
+# Columns matched by the search boxes: (name column, ID column)
+SEARCH_COLUMNS = {
+    'students': ('FullName', 'StudentID'),
+    'teachers': ('Name', 'TeacherID')
+}
+
+class SQLiteStore:
+    """Keep tables in SQLite so page filters run as indexed queries
+    
+    Names are searched through an FTS5 index of their normalized tokens,
+    the same folding SearchIndex uses, kept in sync by triggers. IDs are
+    looked up through their B-tree index.
+    """
+    
+    INDEXES = {
+        'students': ['StudentID', 'CurrentLevel', 'Class', 'PromotionStatus'],
+        'teachers': ['TeacherID', 'SubjectSpecialty'],
+        'results': ['StudentID'],
+        'timetable': ['TeacherID']
+    }
+    
+    # Sort expressions for columns whose text order is not their natural order
+    SORT_KEYS = {
+        'CurrentLevel': 'CAST(SUBSTR("CurrentLevel", 6) AS INTEGER)',
+        'Level': 'CAST(SUBSTR("Level", 6) AS INTEGER)'
+    }
+    
+    def __init__(self, path, data_files):
+        self.path = path
+        self.data_files = data_files
+        self._local = threading.local()
+    
+    def _connect(self):
+        """Return this thread's connection; Streamlit runs sessions on separate threads"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.create_function('search_text', 1, self.search_text, deterministic=True)
+            self._local.conn = conn
+        return conn
+    
+    @staticmethod
+    def search_text(name):
+        """Name tokens as the search index sees them, for the FTS triggers"""
+        return ' '.join(SearchIndex.normalize(name))
+    
+    def has_table(self, name):
+        """True when a table has been created"""
+        return self._connect().execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.data_files[name],)
+        ).fetchone() is not None
+    
+    def exists(self):
+        """True when every table but the archives has been created"""
+        return all(self.has_table(name) for name in self.data_files if name not in ARCHIVE_TABLES.values())
+    
+    def read_table(self, name):
+        """Read a whole table in insertion order
+        
+        Databases saved before names were normalized get their search
+        index rebuilt on the first read.
+        """
+        conn = self._connect()
+        table = self.data_files[name]
+        if name in SEARCH_COLUMNS and conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?", (f'{table}_fts_update',)
+        ).fetchone() is None:
+            with conn:
+                self._index_names(conn, name)
+        return apply_schema(name, pd.read_sql_query(
+            f'SELECT * FROM "{table}" ORDER BY rowid', conn
+        ))
+    
+    def write_table(self, name, df):
+        """Replace a table and rebuild its indexes and search index"""
+        conn = self._connect()
+        table = self.data_files[name]
+        with conn:
+            conn.execute(f'DROP TABLE IF EXISTS "{table}_fts"')
+            df.to_sql(table, conn, if_exists='replace', index=False)
+            for column in self.INDEXES.get(name, []):
+                conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS "idx_{table}_{column}" ON "{table}"("{column}")'
+                )
+            if name in SEARCH_COLUMNS:
+                self._index_names(conn, name)
+    
+    def _index_names(self, conn, name):
+        """(Re)build a table's name search index and the triggers that keep it current"""
+        table = self.data_files[name]
+        name_column = SEARCH_COLUMNS[name][0]
+        conn.execute(f'DROP TABLE IF EXISTS "{table}_fts"')
+        for event in ('insert', 'delete', 'update'):
+            conn.execute(f'DROP TRIGGER IF EXISTS "{table}_fts_{event}"')
+        conn.execute(f'CREATE VIRTUAL TABLE "{table}_fts" USING fts5("{name_column}", content=\'\')')
+        conn.execute(
+            f'INSERT INTO "{table}_fts"(rowid, "{name_column}") '
+            f'SELECT rowid, search_text("{name_column}") FROM "{table}"'
+        )
+        insert = (
+            f'INSERT INTO "{table}_fts"(rowid, "{name_column}") '
+            f'VALUES (new.rowid, search_text(new."{name_column}"));'
+        )
+        delete = (
+            f'INSERT INTO "{table}_fts"("{table}_fts", rowid, "{name_column}") '
+            f'VALUES (\'delete\', old.rowid, search_text(old."{name_column}"));'
+        )
+        conn.execute(f'CREATE TRIGGER "{table}_fts_insert" AFTER INSERT ON "{table}" BEGIN {insert} END')
+        conn.execute(f'CREATE TRIGGER "{table}_fts_delete" AFTER DELETE ON "{table}" BEGIN {delete} END')
+        conn.execute(
+            f'CREATE TRIGGER "{table}_fts_update" AFTER UPDATE OF "{name_column}" ON "{table}" '
+            f'BEGIN {delete} {insert} END'
+        )
+    
+    def append(self, name, df):
+        """Insert rows; triggers keep the search index current"""
+        conn = self._connect()
+        with conn:
+            df.to_sql(self.data_files[name], conn, if_exists='append', index=False)
+    
+    def update(self, name, df, positions, key_column):
+        """Save edits to the rows at positions of df with one UPDATE matched on their key
+        
+        The rows go through a scratch table so their values are stored
+        exactly as write_table stores them.
+        """
+        table = self.data_files[name]
+        keys = [key_column] if isinstance(key_column, str) else list(key_column)
+        rows = df.iloc[positions]
+        assignments = ', '.join(f'"{column}" = edits."{column}"' for column in rows.columns if column not in keys)
+        match = ' AND '.join(f'"{table}"."{key}" = edits."{key}"' for key in keys)
+        conn = self._connect()
+        with conn:
+            rows.to_sql(f'_edits_{table}', conn, if_exists='replace', index=False)
+            conn.execute(f'UPDATE "{table}" SET {assignments} FROM "_edits_{table}" AS edits WHERE {match}')
+            conn.execute(f'DROP TABLE "_edits_{table}"')
+    
+    def compact(self, name):
+        """Reclaim free pages; SQLite appends in place so there is nothing to merge"""
+        self._connect().execute('VACUUM')
+    
+    def read_sequences(self):
+        """Next free ID per table, as last saved"""
+        conn = self._connect()
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS "_sequences" (name TEXT PRIMARY KEY, next_id INTEGER)')
+        return dict(conn.execute('SELECT name, next_id FROM "_sequences"').fetchall())
+    
+    def write_sequence(self, name, next_id):
+        """Save a table's next free ID"""
+        conn = self._connect()
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS "_sequences" (name TEXT PRIMARY KEY, next_id INTEGER)')
+            conn.execute(
+                'INSERT INTO "_sequences" VALUES (?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET next_id = excluded.next_id',
+                (name, int(next_id))
+            )
+    
+    def _where(self, name, filters, search):
+        """Build a WHERE clause that every index can serve"""
+        table = self.data_files[name]
+        clauses, params = [], []
+        for column, value in (filters or {}).items():
+            clauses.append(f'"{column}" = ?')
+            params.append(value)
+        if search:
+            id_column = SEARCH_COLUMNS[name][1]
+            search_clauses, params_search = [], []
+            search_id = parse_id(id_column, search)
+            if search_id is not None:
+                search_clauses.append(f'"{id_column}" = ?')
+                params_search.append(search_id)
+            tokens = SearchIndex.normalize(search)
+            if tokens:
+                search_clauses.append(
+                    f'rowid IN (SELECT rowid FROM "{table}_fts" WHERE "{table}_fts" MATCH ?)'
+                )
+                params_search.append(' '.join(f'"{token}"*' for token in tokens))
+            clauses.append('(' + (' OR '.join(search_clauses) or '0') + ')')
+            params.extend(params_search)
+        where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+        return where, params
+    
+    def query(self, name, filters=None, search=None, limit=None, offset=0,
+              sort_by=None, ascending=True):
+        """Return one page of matching rows and the total match count"""
+        table = self.data_files[name]
+        where, params = self._where(name, filters, search)
+        conn = self._connect()
+        total = conn.execute(f'SELECT COUNT(*) FROM "{table}"{where}', params).fetchone()[0]
+        order = 'rowid'
+        if sort_by:
+            direction = 'ASC' if ascending else 'DESC'
+            sort_key = self.SORT_KEYS.get(sort_by, f'"{sort_by}"')
+            order = f'{sort_key} {direction}, rowid'
+        page_sql = f'SELECT * FROM "{table}"{where} ORDER BY {order}'
+        page_params = list(params)
+        if limit is not None:
+            page_sql += ' LIMIT ? OFFSET ?'
+            page_params += [limit, offset]
+        return apply_schema(name, pd.read_sql_query(page_sql, conn, params=page_params)), total
+    
+    def summarize(self, name, group_column, mean_column, filters=None, search=None):
+        """Count matches per group and average one column in a single grouped query"""
+        table = self.data_files[name]
+        where, params = self._where(name, filters, search)
+        rows = self._connect().execute(
+            f'SELECT "{group_column}", COUNT(*), SUM("{mean_column}") '
+            f'FROM "{table}"{where} GROUP BY "{group_column}"',
+            params
+        ).fetchall()
+        total = sum(row[1] for row in rows)
+        return {
+            'total': total,
+            'counts': {row[0]: row[1] for row in rows},
+            'mean': sum(row[2] or 0 for row in rows) / total if total else float('nan')
+        }
+
+# =============================================================================
+# RESULTS HISTORY
+# =============================================================================
+
+# Terms in a school year
+TERMS = [1, 2, 3]
+
+class ResultsStore:
+    """Per-subject term scores for every year, one Arrow file per (year, term)
+    
+    Partitions live at <root>/<year>/term<term>.arrow, sorted by StudentID and
+    written uncompressed so they are memory-mapped rather than loaded. A
+    query opens only the partitions inside its year range, so current-term
+    reads never touch history. A student's rows in a partition are found by
+    binary search on the sorted StudentID column, which is how transcripts
+    avoid scanning whole terms.
+    """
+    
+    COLUMNS = ['StudentID', 'Level', 'Class', 'Subject', 'Score', 'Attendance%']
+    
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.version = 0
+        self._lock = threading.Lock()
+        self._open_partitions = {}
+    
+    def _path(self, year, term):
+        return os.path.join(self.root, str(year), f'term{term}.arrow')
+    
+    def partitions(self, start_year=None, end_year=None):
+        """(year, term) of every stored partition in a year range, oldest first"""
+        found = []
+        for year_dir in os.listdir(self.root):
+            if not year_dir.isdigit():
+                continue
+            year = int(year_dir)
+            if (start_year is not None and year < start_year) or (end_year is not None and year > end_year):
+                continue
+            for filename in os.listdir(os.path.join(self.root, year_dir)):
+                match = re.fullmatch(r'term(\d+)\.arrow', filename)
+                if match:
+                    found.append((year, int(match.group(1))))
+        return sorted(found)
+    
+    def years(self):
+        return sorted({year for year, _ in self.partitions()})
+    
+    def current(self):
+        """The latest (year, term) with scores, or None for an empty store"""
+        partitions = self.partitions()
+        return partitions[-1] if partitions else None
+    
+    def _open(self, year, term):
+        """Memory-map a partition, once per write of it"""
+        with self._lock:
+            key = (year, term)
+            if key not in self._open_partitions:
+                table = feather.read_table(self._path(year, term), memory_map=True)
+                self._open_partitions[key] = (table, table['StudentID'].to_numpy())
+            return self._open_partitions[key]
+    
+    def write_term(self, year, term, df):
+        """Replace one term's scores; rows are sorted by StudentID for lookups"""
+        df = df[self.COLUMNS].sort_values(['StudentID', 'Subject'], kind='stable')
+        df = df.astype({
+            'StudentID': 'int32', 'Level': 'category', 'Class': 'category',
+            'Subject': 'category', 'Score': 'float32', 'Attendance%': 'float32'
+        })
+        path = self._path(year, term)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        feather.write_feather(
+            pa.Table.from_pandas(df, preserve_index=False), path + '.tmp', compression='uncompressed'
+        )
+        with self._lock:
+            os.replace(path + '.tmp', path)
+            self._open_partitions.pop((year, term), None)
+            self.version += 1
+    
+    def record_scores(self, year, term, rows):
+        """Add or replace (StudentID, Subject) scores in one term"""
+        if (year, term) in self.partitions(year, year):
+            existing = self.query(year, year, terms=[term]).drop(columns=['Year', 'Term'])
+            keys = pd.MultiIndex.from_frame(rows[['StudentID', 'Subject']].astype({'Subject': str}))
+            kept = ~pd.MultiIndex.from_frame(
+                existing[['StudentID', 'Subject']].astype({'Subject': str})
+            ).isin(keys)
+            rows = pd.concat([existing[kept], rows[self.COLUMNS]], ignore_index=True)
+        self.write_term(year, term, rows)
+    
+    @staticmethod
+    def _positions(ids, student_ids):
+        """Row positions of the given students in a partition sorted by StudentID"""
+        wanted = np.unique(np.asarray(student_ids, dtype=ids.dtype))
+        starts = np.searchsorted(ids, wanted, 'left')
+        lengths = np.searchsorted(ids, wanted, 'right') - starts
+        offsets = np.cumsum(lengths) - lengths
+        return np.arange(lengths.sum()) - np.repeat(offsets, lengths) + np.repeat(starts, lengths)
+    
+    def query(self, start_year=None, end_year=None, terms=None, student_ids=None, columns=None):
+        """Scores in a year range, with Year and Term columns added
+        
+        Only partitions in the range are opened, and with student_ids only
+        those students' rows are read from them.
+        """
+        columns = columns or self.COLUMNS
+        frames = []
+        for year, term in self.partitions(start_year, end_year):
+            if terms is not None and term not in terms:
+                continue
+            table, ids = self._open(year, term)
+            if student_ids is not None:
+                table = table.take(self._positions(ids, student_ids))
+            df = table.select(columns).to_pandas()
+            df.insert(0, 'Year', np.int16(year))
+            df.insert(1, 'Term', np.int8(term))
+            frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=['Year', 'Term'] + columns)
+        # Categories differ between partitions; union them so they stay categorical
+        for column in ['Level', 'Class', 'Subject']:
+            if column in columns:
+                categories = sorted(set().union(*(frame[column].cat.categories for frame in frames)), key=str)
+                if column == 'Level':
+                    categories = [level for level in LEVELS if level in categories]
+                for frame in frames:
+                    frame[column] = frame[column].cat.set_categories(categories)
+        return pd.concat(frames, ignore_index=True)
+    
+    def transcript(self, student_id, start_year=None, end_year=None):
+        """Every score one student has, oldest first"""
+        return self.query(start_year, end_year, student_ids=[student_id])
+    
+    def yearly_results(self, start_year=None, end_year=None, student_ids=None):
+        """One row per student per year, shaped like the results table"""
+        scores = self.query(start_year, end_year, student_ids=student_ids)
+        return scores.groupby(['StudentID', 'Year'], observed=True, sort=True).agg(
+            Level=('Level', 'last'),
+            Class=('Class', 'last'),
+            AverageScore=('Score', 'mean'),
+            **{'Attendance%': ('Attendance%', 'mean')}
+        ).reset_index()
+    
+    def seed(self, results, years=3, current_term=len(TERMS), seed=2025):
+        """Fill an empty store with term scores around each student's results
+        
+        The current year's scores are centred on the results table; earlier
+        years are drawn at the level each student was in then.
+        """
+        rng = np.random.RandomState(seed)
+        subjects = list(SUBJECT_PERIODS)
+        current_year = int(results['Year'].max())
+        results = results[results['Year'] == current_year]
+        level_index = results['Level'].map(LEVELS.index).to_numpy()
+        for years_back in range(years):
+            year = current_year - years_back
+            at_school = level_index >= years_back
+            students = results[at_school]
+            n = len(students)
+            terms = TERMS[:current_term] if years_back == 0 else TERMS
+            noise = rng.normal(0, 8, (n, len(terms), len(subjects)))
+            attendance_noise = rng.normal(0, 3, (n, len(terms)))
+            if years_back == 0:
+                noise -= noise.mean(axis=(1, 2), keepdims=True)
+                attendance_noise -= attendance_noise.mean(axis=1, keepdims=True)
+            else:
+                noise += rng.normal(0, 5, (n, 1, 1))
+            base = students['AverageScore'].to_numpy(dtype='float64')
+            base_attendance = students['Attendance%'].to_numpy(dtype='float64')
+            for t, term in enumerate(terms):
+                self.write_term(year, term, pd.DataFrame({
+                    'StudentID': np.repeat(students['StudentID'].to_numpy(), len(subjects)),
+                    'Level': np.repeat(np.array(LEVELS)[level_index[at_school] - years_back], len(subjects)),
+                    'Class': np.repeat(students['Class'].astype(str).to_numpy(), len(subjects)),
+                    'Subject': np.tile(subjects, n),
+                    'Score': np.clip(base[:, None] + noise[:, t, :], 0, 100).ravel(),
+                    'Attendance%': np.repeat(
+                        np.clip(base_attendance + attendance_noise[:, t], 0, 100), len(subjects)
+                    )
+                }))
+
+# =============================================================================
+# GRADING
+# =============================================================================
+
+# Lowest score of each label, per scheme; used when config.yaml has no grading section
+DEFAULT_GRADE_SCHEMES = {
+    'Grade': {
+        'column': 'AverageScore',
+        'bands': {'A': 80, 'B': 70, 'C': 60, 'D': 50, 'E': 40, 'F': 0}
+    },
+    'Performance Band': {
+        'column': 'AverageScore',
+        'bands': {
+            '<40%': 0, '40-50%': 40, '50-60%': 50, '60-70%': 60,
+            '70-80%': 70, '80-90%': 80, '90-100%': 90
+        }
+    },
+    'Attendance Band': {
+        'column': 'Attendance%',
+        'bands': {'<70%': 0, '70-80%': 70, '80-85%': 80, '85-90%': 85, '90-95%': 90, '95-100%': 95}
+    }
+}
+
+class GradeScheme:
+    """Labels for ranges of one score column, each label starting at its lowest score"""
+    
+    def __init__(self, name, column, bands):
+        self.name = name
+        self.column = column
+        ordered = sorted(bands.items(), key=lambda band: band[1])
+        self.labels = [label for label, _ in ordered]
+        self.lows = np.array([low for _, low in ordered], dtype='float64')
+    
+    def assign(self, values):
+        """Label every value with one binary search over the band edges"""
+        values = np.asarray(values, dtype='float64')
+        codes = np.searchsorted(self.lows, values, side='right') - 1
+        # Scores below the lowest band fall in it; missing scores get no label
+        codes = np.where(np.isnan(values), -1, np.maximum(codes, 0))
+        return pd.Categorical.from_codes(codes, categories=self.labels, ordered=True)
+
+class GradeBook:
+    """Grades, ranks and percentiles of one school year's results
+    
+    Every grade scheme labels its score column once, and class, level and
+    school ranks come from one rank pass per grouping, so pages read these
+    columns instead of binning or sorting scores themselves. Ranks put the
+    best score first and share the best position on ties; Percentile is
+    the share of the level scoring at or below the student.
+    """
+    
+    COLUMNS = ['ClassRank', 'LevelRank', 'SchoolRank', 'Percentile', 'Passed', 'Distinction']
+    
+    def __init__(self, results, schemes, pass_mark=50, distinction=80):
+        scores = results['AverageScore'].to_numpy(dtype='float64')
+        table = results[['StudentID', 'Year']].reset_index(drop=True)
+        for scheme in schemes:
+            table[scheme.name] = scheme.assign(results[scheme.column])
+        
+        # One sort by score serves every grouping; class letters repeat across levels
+        by_score = np.argsort(-scores, kind='stable')
+        level_codes = results['Level'].cat.codes.to_numpy().astype('int64') + 1
+        class_codes = (
+            level_codes * (len(results['Class'].cat.categories) + 1)
+            + results['Class'].cat.codes.to_numpy() + 1
+        )
+        level_rank, level_size = self._ranks(scores, by_score, level_codes)
+        table['ClassRank'] = self._ranks(scores, by_score, class_codes)[0]
+        table['LevelRank'] = level_rank
+        table['SchoolRank'] = self._ranks(scores, by_score, np.zeros(len(scores), 'int64'))[0]
+        table['Percentile'] = np.round(
+            (level_size - level_rank.to_numpy('float64', na_value=np.nan) + 1) / level_size * 100, 1
+        )
+        table['Passed'] = scores >= pass_mark
+        table['Distinction'] = scores >= distinction
+        self.table = table
+    
+    @staticmethod
+    def _ranks(scores, by_score, groups):
+        """Rank within each group, best first and tied scores sharing the best rank
+        
+        by_score orders the rows best first; a stable sort by group keeps
+        that order inside each group, so a rank is the row's offset from
+        the first row of its group with the same score. Returns the ranks,
+        missing where the score is, and each row's group size.
+        """
+        order = by_score[np.argsort(groups[by_score], kind='stable')]
+        sorted_groups, sorted_scores = groups[order], scores[order]
+        positions = np.arange(len(order))
+        group_start = np.r_[True, sorted_groups[1:] != sorted_groups[:-1]]
+        score_start = group_start | np.r_[True, sorted_scores[1:] != sorted_scores[:-1]]
+        ranks = np.empty(len(order), dtype='int32')
+        ranks[order] = (
+            np.maximum.accumulate(np.where(score_start, positions, 0))
+            - np.maximum.accumulate(np.where(group_start, positions, 0)) + 1
+        )
+        return pd.arrays.IntegerArray(ranks, np.isnan(scores)), np.bincount(groups)[groups]
+
+class GradingEngine:
+    """Grade books per school year, rebuilt only when that year's results change
+    
+    Books are built from the whole school's results before any login's
+    scope is applied, so a teacher sees a student's true place in the level.
+    """
+    
+    def __init__(self, schemes=None, pass_mark=50, distinction=80):
+        self.schemes = [
+            GradeScheme(name, settings.get('column', 'AverageScore'), settings['bands'])
+            for name, settings in (schemes or DEFAULT_GRADE_SCHEMES).items()
+        ]
+        self.pass_mark = pass_mark
+        self.distinction = distinction
+        self._books = {}
+        self._lock = threading.Lock()
+    
+    def scheme(self, name):
+        """The grade scheme with this name"""
+        return next(scheme for scheme in self.schemes if scheme.name == name)
+    
+    @property
+    def columns(self):
+        """Columns a grade book adds to results"""
+        return [scheme.name for scheme in self.schemes] + GradeBook.COLUMNS
+    
+    def book(self, year, version, load):
+        """The year's grade book, built from load() when the year's version has moved on"""
+        with self._lock:
+            cached = self._books.get(year)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+        # Built outside the lock; two sessions missing together both build
+        with profile('grade book'):
+            book = GradeBook(load(), self.schemes, self.pass_mark, self.distinction)
+        with self._lock:
+            self._books[year] = (version, book)
+        return book
+
+# =============================================================================
+# PROMOTION
+# =============================================================================
+
+# Decisions a student can have; Pending until their results for the year are in
+PROMOTION_STATUSES = ['Promoted', 'Retained', 'Pending']
+
+# NextLevel of a student promoted out of the final level
+GRADUATED = 'Graduated'
+
+class PromotionRules:
+    """Thresholds for moving up a level, and manual decisions that override them
+    
+    Levels may set their own thresholds in place of the school-wide ones.
+    Overrides and the school year being decided are kept in a small JSON
+    file so they survive restarts; without a path they live in memory.
+    """
+    
+    def __init__(self, min_score=50, min_attendance=80, levels=None, state_path=None):
+        self.min_score = min_score
+        self.min_attendance = min_attendance
+        self.levels = levels or {}
+        self.state_path = state_path
+        self.year = None
+        self.overrides = {}
+        if state_path and os.path.exists(state_path):
+            with open(state_path) as f:
+                state = json.load(f)
+            self.year = state.get('year')
+            self.overrides = {int(student_id): status for student_id, status in state['overrides'].items()}
+    
+    def thresholds(self, level_codes):
+        """Minimum score and attendance for each level code; code -1 gets the school-wide ones"""
+        rules = [self.levels.get(level, {}) for level in LEVELS] + [{}]
+        min_scores = np.array([rule.get('min_score', self.min_score) for rule in rules], dtype='float64')
+        min_attendance = np.array(
+            [rule.get('min_attendance', self.min_attendance) for rule in rules], dtype='float64'
+        )
+        return min_scores[level_codes], min_attendance[level_codes]
+    
+    def set_override(self, student_id, status):
+        """Fix one student's decision, or hand it back to the rules with status None
+        
+        The dict is replaced rather than changed, so readers iterating the
+        old one are unaffected.
+        """
+        overrides = dict(self.overrides)
+        if status is None:
+            overrides.pop(int(student_id), None)
+        else:
+            overrides[int(student_id)] = status
+        self.overrides = overrides
+        self._save()
+    
+    def start_year(self, year):
+        """Begin deciding a new school year; last year's overrides no longer apply"""
+        self.year = year
+        self.overrides = {}
+        self._save()
+    
+    def _save(self):
+        if not self.state_path:
+            return
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        with open(self.state_path + '.tmp', 'w') as f:
+            json.dump({'year': self.year, 'overrides': self.overrides}, f)
+        os.replace(self.state_path + '.tmp', self.state_path)
+
+class PromotionEngine:
+    """Promotion decisions for every student, kept in step with each write
+    
+    A student's level and the score and attendance of their results row
+    for the year being decided are held in arrays aligned with the students
+    table. Building the engine applies the rules to every student at once;
+    afterwards a write to some students or results re-evaluates only those
+    students.
+    """
+    
+    def __init__(self, rules, students, results):
+        self.rules = rules
+        if rules.year is not None:
+            self.year = rules.year
+        else:
+            self.year = int(results['Year'].max()) if len(results) else date.today().year
+        self.student_ids = students['StudentID'].to_numpy(dtype='int64')
+        self._index = pd.Index(self.student_ids)
+        self.level_codes = students['CurrentLevel'].cat.codes.to_numpy().astype('int16')
+        self.scores = np.full(len(students), np.nan)
+        self.attendance = np.full(len(students), np.nan)
+        self.status_codes = np.empty(len(students), dtype='int8')
+        self.next_codes = np.empty(len(students), dtype='int16')
+        self._set_results(results)
+        self._evaluate(np.arange(len(students)))
+    
+    def _set_results(self, results):
+        """Take each student's score and attendance from their row for the year"""
+        results = results[results['Year'] == self.year]
+        positions = self._index.get_indexer(results['StudentID'])
+        found = positions >= 0
+        self.scores[positions[found]] = results['AverageScore'].to_numpy(dtype='float64')[found]
+        self.attendance[positions[found]] = results['Attendance%'].to_numpy(dtype='float64')[found]
+        return np.unique(positions[found])
+    
+    def _evaluate(self, positions):
+        """Apply the rules and overrides to the students at these positions"""
+        levels = self.level_codes[positions]
+        min_scores, min_attendance = self.rules.thresholds(levels)
+        scores = self.scores[positions]
+        passed = (scores >= min_scores) & (self.attendance[positions] >= min_attendance)
+        status = np.where(np.isnan(scores), 2, np.where(passed, 0, 1)).astype('int8')
+        if self.rules.overrides:
+            overridden = pd.Series(self.rules.overrides).map(PROMOTION_STATUSES.index)
+            forced = overridden.reindex(self.student_ids[positions]).to_numpy()
+            status = np.where(np.isnan(forced), status, forced).astype('int8')
+        # Codes past the last level mean graduated; -1 means no next level yet
+        self.status_codes[positions] = status
+        self.next_codes[positions] = np.where(
+            (status == 2) | (levels < 0), -1, np.where(status == 0, levels + 1, levels)
+        )
+    
+    def refresh(self, student_ids):
+        """Re-evaluate some students, e.g. after their override changed"""
+        positions = self._index.get_indexer(np.asarray(student_ids, dtype='int64'))
+        self._evaluate(positions[positions >= 0])
+    
+    def add_students(self, rows):
+        """Extend the arrays with newly appended students"""
+        start = len(self.student_ids)
+        self.student_ids = np.concatenate([self.student_ids, rows['StudentID'].to_numpy(dtype='int64')])
+        self._index = pd.Index(self.student_ids)
+        self.level_codes = np.concatenate([
+            self.level_codes, rows['CurrentLevel'].cat.codes.to_numpy().astype('int16')
+        ])
+        self.scores = np.concatenate([self.scores, np.full(len(rows), np.nan)])
+        self.attendance = np.concatenate([self.attendance, np.full(len(rows), np.nan)])
+        self.status_codes = np.concatenate([self.status_codes, np.empty(len(rows), dtype='int8')])
+        self.next_codes = np.concatenate([self.next_codes, np.empty(len(rows), dtype='int16')])
+        self._evaluate(np.arange(start, len(self.student_ids)))
+    
+    def update_students(self, rows):
+        """Pick up level changes of edited students"""
+        positions = self._index.get_indexer(rows['StudentID'])
+        found = positions >= 0
+        self.level_codes[positions[found]] = rows['CurrentLevel'].cat.codes.to_numpy()[found]
+        self._evaluate(positions[found])
+    
+    def update_results(self, rows):
+        """Re-evaluate the students whose results rows were added or edited
+        
+        Returns False when the rows start a later year than the one being
+        decided and no year is fixed, so the engine must be rebuilt.
+        """
+        if self.rules.year is None and len(rows) and int(rows['Year'].max()) > self.year:
+            return False
+        self._evaluate(self._set_results(rows))
+        return True
+    
+    def _labels(self, positions):
+        """PromotionStatus and NextLevel of the students at positions, as categoricals"""
+        next_labels = LEVELS + [GRADUATED, '']
+        return (
+            pd.Categorical.from_codes(self.status_codes[positions], categories=PROMOTION_STATUSES),
+            pd.Categorical.from_codes(self.next_codes[positions] % len(next_labels), categories=next_labels)
+        )
+    
+    def decisions(self, positions=None):
+        """StudentID, PromotionStatus, NextLevel and the reason for each decision"""
+        if positions is None:
+            positions = np.arange(len(self.student_ids))
+        status, next_level = self._labels(positions)
+        min_scores, min_attendance = self.rules.thresholds(self.level_codes[positions])
+        scores, attendance = self.scores[positions], self.attendance[positions]
+        overridden = np.isin(self.student_ids[positions], list(self.rules.overrides))
+        reason = np.select(
+            [overridden, np.isnan(scores), scores < min_scores, attendance < min_attendance],
+            ['Manual override', f'No {self.year} results', 'Score below threshold', 'Attendance below threshold'],
+            default='Met every threshold'
+        )
+        return pd.DataFrame({
+            'StudentID': self.student_ids[positions],
+            'PromotionStatus': status,
+            'NextLevel': next_level,
+            'Reason': reason
+        })
+    
+    def diff(self, students):
+        """Students whose recorded status or next level differ from the rules, for a dry run"""
+        positions = self._index.get_indexer(students['StudentID'])
+        students = students[positions >= 0]
+        positions = positions[positions >= 0]
+        status, next_level = self._labels(positions)
+        # Compared as category codes; labels missing from the table count as changed
+        changed = np.zeros(len(positions), dtype=bool)
+        for column, decided in (('PromotionStatus', status), ('NextLevel', next_level)):
+            recorded = students[column].astype('category')
+            lookup = pd.Index(decided.categories).get_indexer(recorded.cat.categories.astype(str))
+            codes = recorded.cat.codes.to_numpy()
+            changed |= np.where(codes >= 0, lookup[codes], -1) != decided.codes
+        students = students[changed]
+        positions = positions[changed]
+        decided = self.decisions(positions)
+        return pd.DataFrame({
+            'StudentID': students['StudentID'].to_numpy(),
+            'FullName': students['FullName'].to_numpy(),
+            'CurrentLevel': students['CurrentLevel'].to_numpy(),
+            'Score': self.scores[positions].round(1),
+            'Attendance': self.attendance[positions].round(1),
+            'Status': students['PromotionStatus'].to_numpy(),
+            'New Status': decided['PromotionStatus'].to_numpy(),
+            'New Next Level': decided['NextLevel'].to_numpy(),
+            'Reason': decided['Reason'].to_numpy()
+        })
+    
+    def apply(self, students):
+        """The students table with every decision written into it"""
+        status, next_level = self._labels(np.arange(len(self.student_ids)))
+        return students.assign(PromotionStatus=status, NextLevel=next_level)
+    
+    def rollover(self, students):
+        """The students table for next year, its graduates, and how many students moved, stayed or left
+        
+        Promoted students move to their next level and graduates leave the
+        table for the alumni archive, keeping their final level and
+        decision; retained and pending students stay where they are.
+        Everyone starts the new year Pending.
+        """
+        graduated = self.next_codes == len(LEVELS)
+        moved = (self.next_codes >= 0) & ~graduated & (self.next_codes != self.level_codes)
+        level_codes = np.where(moved, self.next_codes, self.level_codes)[~graduated]
+        next_year = students[~graduated].assign(
+            CurrentLevel=pd.Categorical.from_codes(level_codes, dtype=LEVEL_DTYPE),
+            PromotionStatus='Pending',
+            NextLevel=''
+        )
+        graduates = students[graduated].assign(GraduationYear=self.year)
+        return next_year, graduates, {
+            'promoted': int(moved.sum()),
+            'graduated': int(graduated.sum()),
+            'stayed': int(len(next_year) - moved.sum())
+        }
+
+# =============================================================================
+# ATTENDANCE REGISTER
+# =============================================================================
+
+# First and last day (MM-DD) of each term; school days are the weekdays inside them
+DEFAULT_TERM_DATES = [('01-06', '04-11'), ('04-21', '08-08'), ('08-18', '11-21')]
+
+class AttendanceRegister:
+    """Per-period attendance for every student and school day, as bitmaps
+    
+    Each school year is two arrays of one small integer per student per
+    school day, with bit p set for period p+1: `marked` for periods whose
+    register was taken and `present` for periods the student attended. A
+    year of five-period days is under 500 bytes per student. Percentages
+    count set bits with a lookup table over whole arrays, two bytes at a
+    time, and a day counts as absent when its register was taken and no
+    period was attended.
+    Years are stored at <root>/<year>.npz. Taking a register appends only
+    the cells it changed to <root>/<year>.journal, which loading replays;
+    once the journal passes compact_bytes it is folded into the .npz.
+    """
+    
+    # One changed cell of a year's bitmaps
+    JOURNAL_DTYPE = np.dtype([('student', '<i4'), ('day', '<i2'), ('marked', '<u2'), ('present', '<u2')])
+    
+    def __init__(self, root, periods=5, term_dates=None, compact_bytes=1 << 20):
+        if periods > 16:
+            raise ValueError("At most 16 periods a day are supported")
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.compact_bytes = compact_bytes
+        self.periods = periods
+        self.term_dates = term_dates or DEFAULT_TERM_DATES
+        self.dtype = np.dtype('uint8' if periods <= 8 else 'uint16')
+        self.version = 0
+        # Set bits of every 16-bit value
+        self._popcount = np.array([bin(value).count('1') for value in range(1 << 16)], dtype='uint8')
+        self._lock = threading.Lock()
+        self._years = {}
+    
+    def _path(self, year):
+        return os.path.join(self.root, f'{year}.npz')
+    
+    def _journal_path(self, year):
+        return os.path.join(self.root, f'{year}.journal')
+    
+    def years(self):
+        return sorted({
+            int(name.split('.')[0]) for name in os.listdir(self.root)
+            if re.fullmatch(r'\d+\.(npz|journal)', name)
+        })
+    
+    def school_days(self, year):
+        """Dates of the year's school days, in order"""
+        days = [
+            pd.bdate_range(f'{year}-{start}', f'{year}-{end}').to_numpy(dtype='datetime64[D]')
+            for start, end in self.term_dates
+        ]
+        return np.concatenate(days)
+    
+    def day_index(self, day):
+        """(year, position among the year's school days) of a date, or None if school is out"""
+        day = np.datetime64(pd.Timestamp(day).date(), 'D')
+        year = int(str(day)[:4])
+        days = self.school_days(year)
+        position = int(np.searchsorted(days, day))
+        if position < len(days) and days[position] == day:
+            return year, position
+        return None
+    
+    def _load(self, year):
+        """A year's bitmaps, read once and kept in memory"""
+        if year not in self._years:
+            n_days = len(self.school_days(year))
+            if os.path.exists(self._path(year)):
+                with np.load(self._path(year)) as saved:
+                    ids, marked, present = saved['student_ids'], saved['marked'], saved['present']
+            else:
+                ids = np.empty(0, dtype='int32')
+                marked = present = np.zeros((0, n_days), dtype=self.dtype)
+            bitmaps = {'ids': ids, 'index': pd.Index(ids), 'marked': marked, 'present': present}
+            self._replay(year, bitmaps)
+            self._years[year] = bitmaps
+        return self._years[year]
+    
+    def _replay(self, year, bitmaps):
+        """Apply the cells journalled since the year's bitmaps were last saved"""
+        if not os.path.exists(self._journal_path(year)):
+            return
+        with open(self._journal_path(year), 'rb') as f:
+            data = f.read()
+        # A write cut short by a crash leaves a partial cell at the end
+        cells = np.frombuffer(data[:len(data) - len(data) % self.JOURNAL_DTYPE.itemsize], dtype=self.JOURNAL_DTYPE)
+        if not len(cells):
+            return
+        # Keep the last write of each cell
+        rows = self._rows(bitmaps, cells['student'])
+        flat = rows.astype('int64') * bitmaps['marked'].shape[1] + cells['day']
+        _, last = np.unique(flat[::-1], return_index=True)
+        last = len(cells) - 1 - last
+        bitmaps['marked'][rows[last], cells['day'][last]] = cells['marked'][last]
+        bitmaps['present'][rows[last], cells['day'][last]] = cells['present'][last]
+    
+    def _journal(self, year, student_ids, position):
+        """Append the cells of one day for some students, folding the journal in when it grows large"""
+        bitmaps = self._years[year]
+        rows = bitmaps['index'].get_indexer(student_ids)
+        cells = np.empty(len(rows), dtype=self.JOURNAL_DTYPE)
+        cells['student'] = bitmaps['ids'][rows]
+        cells['day'] = position
+        cells['marked'] = bitmaps['marked'][rows, position]
+        cells['present'] = bitmaps['present'][rows, position]
+        with open(self._journal_path(year), 'ab') as f:
+            f.write(cells.tobytes())
+            size = f.tell()
+        self.version += 1
+        if size >= self.compact_bytes:
+            self._save(year)
+    
+    def _save(self, year):
+        """Write a year's bitmaps in full and drop its journal"""
+        bitmaps = self._years[year]
+        with open(self._path(year) + '.tmp', 'wb') as f:
+            np.savez(f, student_ids=bitmaps['ids'], marked=bitmaps['marked'], present=bitmaps['present'])
+        os.replace(self._path(year) + '.tmp', self._path(year))
+        # Replaying a journal left by a crash here only rewrites the same values
+        if os.path.exists(self._journal_path(year)):
+            os.remove(self._journal_path(year))
+        self.version += 1
+    
+    def _rows(self, bitmaps, student_ids):
+        """Row of each student in a year's bitmaps, adding rows for new students"""
+        student_ids = np.asarray(student_ids, dtype='int32')
+        rows = bitmaps['index'].get_indexer(student_ids)
+        new_ids = np.unique(student_ids[rows < 0])
+        if len(new_ids):
+            padding = np.zeros((len(new_ids), bitmaps['marked'].shape[1]), dtype=self.dtype)
+            bitmaps['ids'] = np.concatenate([bitmaps['ids'], new_ids])
+            bitmaps['index'] = pd.Index(bitmaps['ids'])
+            bitmaps['marked'] = np.concatenate([bitmaps['marked'], padding])
+            bitmaps['present'] = np.concatenate([bitmaps['present'], padding])
+            rows = bitmaps['index'].get_indexer(student_ids)
+        return rows
+    
+    def _period_bits(self, periods):
+        if periods is None:
+            periods = range(1, self.periods + 1)
+        return self.dtype.type(sum(1 << (period - 1) for period in periods))
+    
+    def record(self, day, student_ids, present, periods=None):
+        """Take the register for some periods of a school day, or the whole day
+        
+        present holds one flag per student. Raises ValueError for a day
+        school is out.
+        """
+        found = self.day_index(day)
+        if found is None:
+            raise ValueError(f"{pd.Timestamp(day).date()} is not a school day")
+        year, position = found
+        bits = self._period_bits(periods)
+        present = np.asarray(present, dtype=bool)
+        with self._lock:
+            bitmaps = self._load(year)
+            rows = self._rows(bitmaps, student_ids)
+            bitmaps['marked'][rows, position] |= bits
+            bitmaps['present'][rows, position] = np.where(
+                present,
+                bitmaps['present'][rows, position] | bits,
+                bitmaps['present'][rows, position] & ~bits
+            )
+            self._journal(year, np.asarray(student_ids, dtype='int32'), position)
+    
+    def register(self, day, student_ids, periods=None):
+        """(taken, present) flags per student for some periods of a day
+        
+        taken is False where any of the periods has no mark yet, present is
+        True where every one of them was attended.
+        """
+        found = self.day_index(day)
+        n = len(student_ids)
+        if found is None or found[0] not in self.years():
+            return np.zeros(n, dtype=bool), np.zeros(n, dtype=bool)
+        year, position = found
+        bits = self._period_bits(periods)
+        with self._lock:
+            bitmaps = self._load(year)
+            rows = bitmaps['index'].get_indexer(np.asarray(student_ids, dtype='int32'))
+            known = rows >= 0
+            marked = np.zeros(n, dtype=self.dtype)
+            present = np.zeros(n, dtype=self.dtype)
+            marked[known] = bitmaps['marked'][rows[known], position]
+            present[known] = bitmaps['present'][rows[known], position]
+        return (marked & bits) == bits, (present & bits) == bits
+    
+    def _count_bits(self, bitmaps, axis):
+        """Set bits per row (axis=1) or per day (axis=0)"""
+        if axis == 1 and self.dtype.itemsize == 1:
+            # Byte pairs viewed as 16-bit values halve the lookups
+            paired = bitmaps.shape[1] // 2 * 2
+            return (
+                self._popcount[bitmaps[:, :paired].view('uint16')].sum(axis=1, dtype='int64')
+                + self._popcount[bitmaps[:, paired:]].sum(axis=1, dtype='int64')
+            )
+        return self._popcount[bitmaps].sum(axis=axis, dtype='int64')
+    
+    def _window(self, year, student_ids, start, end):
+        """Student IDs and (marked, attended) bitmaps of a date range, for some or all students"""
+        days = self.school_days(year)
+        first = np.searchsorted(days, np.datetime64(start, 'D')) if start is not None else 0
+        last = np.searchsorted(days, np.datetime64(end, 'D'), 'right') if end is not None else len(days)
+        # Rows are looked up under the lock, as marking a new student replaces all four arrays
+        with self._lock:
+            bitmaps = self._load(year)
+            ids, marked, present = bitmaps['ids'], bitmaps['marked'], bitmaps['present']
+            if student_ids is not None:
+                rows = bitmaps['index'].get_indexer(np.asarray(student_ids, dtype='int32'))
+        if student_ids is not None:
+            rows = rows[rows >= 0]
+            ids, marked, present = ids[rows], marked[rows], present[rows]
+        marked = marked[:, first:last]
+        return ids, marked, present[:, first:last] & marked
+    
+    def summary(self, year, student_ids=None, start=None, end=None):
+        """Days and periods attended by each student over a date range of one year
+        
+        Attendance% is periods attended over periods whose register was taken.
+        """
+        ids, marked, attended = self._window(year, student_ids, start, end)
+        with profile('popcount'):
+            periods_marked = self._count_bits(marked, axis=1)
+            periods_present = self._count_bits(attended, axis=1)
+            taken = marked != 0
+            days_taken = taken.sum(axis=1)
+            days_absent = (taken & (attended == 0)).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            percent = np.where(periods_marked > 0, periods_present / periods_marked * 100, np.nan)
+        return pd.DataFrame({
+            'StudentID': ids,
+            'DaysTaken': days_taken,
+            'DaysAbsent': days_absent,
+            'PeriodsMarked': periods_marked,
+            'PeriodsPresent': periods_present,
+            'Attendance%': percent.round(1)
+        })
+    
+    def streaks(self, year, student_ids=None, start=None, end=None):
+        """Current and longest runs of absent days per student
+        
+        Days whose register was not taken neither extend nor break a run.
+        Meant for short lists such as the low-attendance students.
+        """
+        ids, marked, attended = self._window(year, student_ids, start, end)
+        taken = marked != 0
+        absent = taken & (attended == 0)
+        # Running count of absent days, less the count at the last day attended
+        absences = np.cumsum(absent, axis=1, dtype='int16')
+        runs = absences - np.maximum.accumulate(np.where(taken & ~absent, absences, 0), axis=1)
+        return pd.DataFrame({
+            'StudentID': ids,
+            'CurrentStreak': runs[:, -1] if runs.shape[1] else 0,
+            'LongestStreak': runs.max(axis=1) if runs.shape[1] else 0
+        })
+    
+    def daily_rates(self, year, student_ids=None):
+        """Share of marked periods attended on each school day with a register, in percent"""
+        with self._lock:
+            bitmaps = self._load(year)
+            marked, present = bitmaps['marked'], bitmaps['present']
+            if student_ids is not None:
+                rows = bitmaps['index'].get_indexer(np.asarray(student_ids, dtype='int32'))
+        if student_ids is not None:
+            rows = rows[rows >= 0]
+            marked, present = marked[rows], present[rows]
+        with profile('popcount'):
+            periods_marked = self._count_bits(marked, axis=0)
+            periods_present = self._count_bits(present & marked, axis=0)
+        taken = periods_marked > 0
+        return pd.Series(
+            periods_present[taken] / periods_marked[taken] * 100,
+            index=pd.DatetimeIndex(self.school_days(year)[taken], name='Date'),
+            name='Attendance%'
+        )
+    
+    def seed(self, results, until=None, seed=2025):
+        """Fill the current year's registers up to a date from each student's Attendance%
+        
+        Most absences are whole days; a few students miss single periods.
+        """
+        rng = np.random.RandomState(seed)
+        year = int(results['Year'].max())
+        results = results[results['Year'] == year]
+        days = self.school_days(year)
+        if until is not None:
+            days = days[days <= np.datetime64(until, 'D')]
+        rate = results['Attendance%'].to_numpy(dtype='float64')[:, None] / 100
+        n, n_days = len(results), len(days)
+        full = self._period_bits(None)
+        marked = np.zeros((n, len(self.school_days(year))), dtype=self.dtype)
+        present = np.zeros_like(marked)
+        marked[:, :n_days] = full
+        present[:, :n_days] = np.where(rng.random_sample((n, n_days)) < rate, full, 0)
+        elapsed = present[:, :n_days]
+        skipped = (rng.random_sample((n, n_days)) < 0.02) & (elapsed != 0)
+        missed = self.dtype.type(1) << rng.randint(0, self.periods, int(skipped.sum())).astype(self.dtype)
+        elapsed[skipped] &= ~missed
+        with self._lock:
+            self._years[year] = {
+                'ids': results['StudentID'].to_numpy(dtype='int32'),
+                'index': pd.Index(results['StudentID'].to_numpy(dtype='int32')),
+                'marked': marked,
+                'present': present
+            }
+            self._save(year)
+
+# =============================================================================
+# AUDIT LOG
+# =============================================================================
+
+class AuditLog:
+    """Append-only audit trail kept in rotating JSON Lines segments
+    
+    record() hands an entry to a single writer thread, which commits
+    everything queued since its last write with one write and one fsync
+    (group commit) before releasing the callers. Segments rotate at
+    segment_bytes. Each segment keeps its time range, its users and a
+    sparse (time, offset) index, so queries skip whole segments and
+    seek within the rest. The latest entries stay in memory for the
+    dashboard.
+    """
+    
+    INDEX_EVERY = 64
+    
+    def __init__(self, root, segment_bytes=1 << 20, tail_size=200):
+        self.root = root
+        self.segment_bytes = segment_bytes
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._segments = []
+        self._tail = deque(maxlen=tail_size)
+        self._load()
+        self._writer = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._writer.start()
+    
+    def _segment_path(self, number):
+        return os.path.join(self.root, f'audit-{str(number).zfill(6)}.jsonl')
+    
+    def _scan(self, path):
+        """Index a segment file, cutting off a line torn by a crash"""
+        segment = {
+            'path': path, 'first': None, 'last': None, 'users': set(),
+            'marks': [], 'count': 0, 'bytes': 0
+        }
+        entries = []
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                self._index_entry(segment, entry, segment['bytes'])
+                segment['bytes'] += len(line)
+                entries.append(entry)
+        if segment['bytes'] < os.path.getsize(path):
+            with open(path, 'r+b') as f:
+                f.truncate(segment['bytes'])
+        return segment, entries
+    
+    def _index_entry(self, segment, entry, offset):
+        if segment['count'] % self.INDEX_EVERY == 0:
+            segment['marks'].append((entry['time'], offset))
+        segment['first'] = segment['first'] or entry['time']
+        segment['last'] = entry['time']
+        segment['users'].add(entry['user'])
+        segment['count'] += 1
+    
+    def _write_index(self, segment):
+        """Save a closed segment's index so restarts need not rescan it"""
+        index = dict(segment, users=sorted(segment['users'], key=str))
+        with open(segment['path'] + '.idx.tmp', 'w') as f:
+            json.dump(index, f)
+        os.replace(segment['path'] + '.idx.tmp', segment['path'] + '.idx')
+    
+    def _load(self):
+        """Read segment indexes; only the active segment is scanned"""
+        paths = sorted(glob.glob(os.path.join(self.root, 'audit-*.jsonl')))
+        if not paths:
+            paths = [self._segment_path(1)]
+            open(paths[0], 'ab').close()
+        
+        for path in paths[:-1]:
+            if os.path.exists(path + '.idx'):
+                with open(path + '.idx') as f:
+                    segment = json.load(f)
+                segment['users'] = set(segment['users'])
+                segment['marks'] = [tuple(mark) for mark in segment['marks']]
+            else:
+                segment, _ = self._scan(path)
+                self._write_index(segment)
+            self._segments.append(segment)
+        
+        active, entries = self._scan(paths[-1])
+        self._segments.append(active)
+        
+        # Seed the tail from the newest entries, reaching back a segment if needed
+        if len(entries) < self._tail.maxlen and len(paths) > 1:
+            entries = self._read(self._segments[-2]) + entries
+        self._tail.extend(entries[-self._tail.maxlen:])
+    
+    def record(self, user, action, detail='', wait=True):
+        """Append an entry; with wait, return once it is on disk"""
+        done = threading.Event() if wait else None
+        item = {'entry': {'user': user, 'action': action, 'detail': detail}, 'done': done, 'error': None}
+        self._queue.put(item)
+        if wait:
+            done.wait()
+            if item['error'] is not None:
+                raise item['error']
+    
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._commit([item['entry'] for item in batch])
+            except OSError as e:
+                for item in batch:
+                    item['error'] = e
+            for item in batch:
+                if item['done'] is not None:
+                    item['done'].set()
+    
+    def _commit(self, entries):
+        """Write one batch with a single fsync, rotating first if the segment is full"""
+        segment = self._segments[-1]
+        if segment['bytes'] >= self.segment_bytes:
+            self._write_index(segment)
+            number = int(os.path.basename(segment['path'])[len('audit-'):-len('.jsonl')]) + 1
+            segment = {
+                'path': self._segment_path(number), 'first': None, 'last': None, 'users': set(),
+                'marks': [], 'count': 0, 'bytes': 0
+            }
+            with self._lock:
+                self._segments.append(segment)
+        
+        lines = []
+        for entry in entries:
+            entry['time'] = datetime.now().isoformat(timespec='microseconds')
+            lines.append(json.dumps(entry, default=str).encode() + b'\n')
+        with open(segment['path'], 'ab') as f:
+            f.write(b''.join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        
+        with self._lock:
+            offset = segment['bytes']
+            for entry, line in zip(entries, lines):
+                self._index_entry(segment, entry, offset)
+                offset += len(line)
+            segment['bytes'] = offset
+            self._tail.extend(entries)
+    
+    def _read(self, segment, start_key=''):
+        """Committed entries of a segment, seeking past those before start_key"""
+        times = [mark[0] for mark in segment['marks']]
+        i = bisect.bisect_left(times, start_key) - 1
+        offset = segment['marks'][i][1] if i >= 0 else 0
+        with open(segment['path'], 'rb') as f:
+            f.seek(offset)
+            data = f.read(segment['bytes'] - offset)
+        return [json.loads(line) for line in data.splitlines()]
+    
+    def tail(self, n=5):
+        """The n most recent entries, newest first"""
+        with self._lock:
+            return list(self._tail)[-n:][::-1]
+    
+    def query(self, start=None, end=None, user=None, action=None, limit=None):
+        """Entries between two datetimes, optionally for one user or action, oldest first"""
+        start_key = start.isoformat(timespec='microseconds') if start else ''
+        end_key = end.isoformat(timespec='microseconds') if end else '~'
+        with self._lock:
+            segments = [dict(segment) for segment in self._segments if segment['count']]
+        
+        entries = []
+        for segment in segments:
+            if segment['last'] < start_key or segment['first'] > end_key:
+                continue
+            if user is not None and user not in segment['users']:
+                continue
+            for entry in self._read(segment, start_key):
+                if entry['time'] > end_key:
+                    break
+                if (entry['time'] >= start_key
+                        and (user is None or entry['user'] == user)
+                        and (action is None or entry['action'] == action)):
+                    entries.append(entry)
+        return entries[-limit:] if limit else entries
+
+# =============================================================================
+# RENDER PROFILING
+# =============================================================================
+
+class RenderProfiler:
+    """Rolling record of how long each page render and its steps took
+    
+    Spans nest per thread: a render function opens one, and the merges,
+    groupbys, figure builds and table serializations inside it open child
+    spans. When the outermost span closes its whole tree is kept as one
+    sample. Peak memory comes from tracemalloc, which slows every allocation
+    and so only runs while memory tracing is switched on. It is
+    process-wide, so renders running at the same time share their peaks.
+    """
+    
+    def __init__(self, capacity=500, trace_memory=False):
+        self.samples = deque(maxlen=capacity)
+        self.enabled = True
+        self._local = threading.local()
+        self.set_trace_memory(trace_memory)
+    
+    @property
+    def trace_memory(self):
+        return tracemalloc.is_tracing()
+    
+    def set_trace_memory(self, on):
+        if on and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not on and tracemalloc.is_tracing():
+            tracemalloc.stop()
+    
+    @contextlib.contextmanager
+    def span(self, name):
+        """Time the enclosed block as a child of the span open on this thread"""
+        if not self.enabled:
+            yield
+            return
+        stack = self._local.__dict__.setdefault('stack', [])
+        tracing = tracemalloc.is_tracing()
+        current = 0
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            # The parent keeps the peak reached so far; the child measures from here
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+        node = {'name': name, 'base': current, 'peak': current, 'children': []}
+        stack.append(node)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            node['seconds'] = time.perf_counter() - start
+            if tracing and tracemalloc.is_tracing():
+                node['peak'] = max(node['peak'], tracemalloc.get_traced_memory()[1])
+            stack.pop()
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], node['peak'])
+                stack[-1]['children'].append(node)
+            node['peak_bytes'] = max(node.pop('peak') - node.pop('base'), 0) if tracing else None
+            if not stack:
+                node['time'] = datetime.now()
+                self.samples.append(node)
+    
+    def clear(self):
+        self.samples.clear()
+    
+    def _walk(self, node, path=()):
+        path = path + (node['name'],)
+        yield path, node
+        for child in node['children']:
+            yield from self._walk(child, path)
+    
+    def recent(self, n=50):
+        """The last n page renders, newest first"""
+        rows = [
+            {
+                'Time': sample['time'],
+                'Render': sample['name'],
+                'Milliseconds': sample['seconds'] * 1000,
+                'Peak MB': None if sample['peak_bytes'] is None else sample['peak_bytes'] / 2**20
+            }
+            for sample in list(self.samples)[-n:]
+        ]
+        return pd.DataFrame(rows, columns=['Time', 'Render', 'Milliseconds', 'Peak MB']).iloc[::-1]
+    
+    def summary(self):
+        """Calls, wall time and peak memory per span path, slowest total first"""
+        rows = [
+            {
+                'Span': ' > '.join(path),
+                'Seconds': node['seconds'],
+                'Peak MB': None if node['peak_bytes'] is None else node['peak_bytes'] / 2**20
+            }
+            for sample in list(self.samples)
+            for path, node in self._walk(sample)
+        ]
+        if not rows:
+            return pd.DataFrame(columns=['Span', 'Calls', 'Total ms', 'Mean ms', 'P95 ms', 'Max ms', 'Peak MB'])
+        spans = pd.DataFrame(rows)
+        stats = spans.groupby('Span', sort=False).agg(
+            Calls=('Seconds', 'size'),
+            Total=('Seconds', 'sum'),
+            Mean=('Seconds', 'mean'),
+            P95=('Seconds', lambda seconds: seconds.quantile(0.95)),
+            Max=('Seconds', 'max'),
+            Peak=('Peak MB', 'max')
+        )
+        stats[['Total', 'Mean', 'P95', 'Max']] *= 1000
+        stats = stats.rename(columns={
+            'Total': 'Total ms', 'Mean': 'Mean ms', 'P95': 'P95 ms', 'Max': 'Max ms', 'Peak': 'Peak MB'
+        })
+        return stats.sort_values('Total ms', ascending=False).reset_index()
+    
+    def folded(self):
+        """Samples as folded stacks ('a;b;c microseconds'), the input format of
+        flamegraph.pl, speedscope and most other flamegraph viewers
+        
+        Each frame is charged its own time, excluding its children.
+        """
+        totals = defaultdict(int)
+        for sample in list(self.samples):
+            for path, node in self._walk(sample):
+                own = node['seconds'] - sum(child['seconds'] for child in node['children'])
+                totals[';'.join(path)] += max(int(own * 1e6), 0)
+        return ''.join(f"{path} {micros}\n" for path, micros in totals.items() if micros)
+
+# =============================================================================
+# AGGREGATES
+# =============================================================================
+
+class SchoolAggregates:
+    """Materialized dashboard KPIs kept in step with every write
+    
+    Counts and sums are updated from the rows being added, removed or
+    edited, so reading a KPI never touches the tables themselves.
+    """
+    
+    # Table whose rows are counted per value of each column
+    COUNT_COLUMNS = {
+        'students': ['CurrentLevel', 'Class', 'Gender', 'PromotionStatus']
+    }
+    
+    # Table whose columns are averaged
+    MEAN_COLUMNS = {
+        'students': ['AvgScore'],
+        'results': ['AverageScore', 'Attendance%']
+    }
+    
+    def __init__(self, tables):
+        self.totals = {}
+        self.counts = {}
+        self.sums = {}
+        self.non_null = {}
+        for name, df in tables.items():
+            self.rebuild_table(name, df)
+    
+    def rebuild_table(self, name, df):
+        """Recompute every aggregate of one table from scratch"""
+        self.totals[name] = len(df)
+        # Scoped tables may leave some columns out
+        for column in self.COUNT_COLUMNS.get(name, []):
+            if column not in df:
+                continue
+            self.counts[column] = {
+                value: int(count)
+                for value, count in df[column].value_counts().items()
+                if count
+            }
+        for column in self.MEAN_COLUMNS.get(name, []):
+            if column not in df:
+                continue
+            self.sums[(name, column)] = float(df[column].sum())
+            self.non_null[(name, column)] = int(df[column].notna().sum())
+    
+    def _apply(self, name, rows, sign):
+        self.totals[name] = self.totals.get(name, 0) + sign * len(rows)
+        for column in self.COUNT_COLUMNS.get(name, []):
+            counts = self.counts.setdefault(column, {})
+            for value, count in rows[column].value_counts().items():
+                if not count:
+                    continue
+                counts[value] = counts.get(value, 0) + sign * int(count)
+                if counts[value] <= 0:
+                    del counts[value]
+        for column in self.MEAN_COLUMNS.get(name, []):
+            key = (name, column)
+            self.sums[key] = self.sums.get(key, 0.0) + sign * float(rows[column].sum())
+            self.non_null[key] = self.non_null.get(key, 0) + sign * int(rows[column].notna().sum())
+    
+    def add_rows(self, name, rows):
+        """Fold newly inserted rows into the aggregates"""
+        self._apply(name, rows, 1)
+    
+    def remove_rows(self, name, rows):
+        """Take deleted rows back out of the aggregates"""
+        self._apply(name, rows, -1)
+    
+    def update_rows(self, name, old_rows, new_rows):
+        """Replace the contribution of edited rows"""
+        self._apply(name, old_rows, -1)
+        self._apply(name, new_rows, 1)
+    
+    def count(self, column, value):
+        """Number of rows whose column equals value"""
+        return self.counts.get(column, {}).get(value, 0)
+    
+    def value_counts(self, column, order=None):
+        """Counts per value as a Series, in the given order or sorted by value"""
+        counts = self.counts.get(column, {})
+        if order is None:
+            order = sorted(counts, key=str)
+        return pd.Series([counts.get(value, 0) for value in order], index=order, dtype='int64')
+    
+    def mean(self, name, column):
+        """Mean of a column, ignoring missing values"""
+        n = self.non_null.get((name, column), 0)
+        return self.sums.get((name, column), 0.0) / n if n else float('nan')
+
+# =============================================================================
+# RELATIONSHIPS
+# =============================================================================
+
+# Columns referring to another table's ID, as (table, column, referenced table)
+FOREIGN_KEYS = [
+    ('results', 'StudentID', 'students'),
+    ('students', 'ParentID', 'parents'),
+    ('timetable', 'TeacherID', 'teachers')
+]
+
+class KeyIndex:
+    """Row position of every ID in one table
+    
+    IDs come from a sequence, so they are small dense integers and the
+    index is an array of row positions indexed by ID. Finding the rows of
+    many IDs is then one gather instead of hashing the table. IDs far past
+    the table's size, e.g. from a mistyped import, go in a dict instead.
+    """
+    
+    def __init__(self, ids=()):
+        self._positions = np.full(0, -1, dtype='int64')
+        self._sparse = {}
+        self._count = 0
+        self.add(ids, 0)
+    
+    def _set(self, ids, positions):
+        # Sparse IDs always lie past the dense array, so lookups can split on its length
+        dense = (ids >= 0) & (ids < max(len(self._positions), 8 * self._count + 1024))
+        if dense.any():
+            top = int(ids[dense].max()) + 1
+            if top > len(self._positions):
+                grown = np.full(max(top, 2 * len(self._positions)), -1, dtype='int64')
+                grown[:len(self._positions)] = self._positions
+                self._positions = grown
+                for key in [key for key in self._sparse if 0 <= key < len(grown)]:
+                    grown[key] = self._sparse.pop(key)
+            self._positions[ids[dense]] = positions[dense]
+        for key, position in zip(ids[~dense].tolist(), positions[~dense].tolist()):
+            self._sparse[key] = position
+    
+    def add(self, ids, start):
+        """Index IDs whose rows sit at positions start, start + 1, ..."""
+        ids = np.asarray(ids, dtype='int64')
+        if len(ids):
+            self._count += len(ids)
+            self._set(ids, np.arange(start, start + len(ids)))
+    
+    def move(self, old_ids, new_ids, positions):
+        """Re-key rows whose ID was edited"""
+        self._remove(old_ids)
+        self._set(np.asarray(new_ids, dtype='int64'), np.asarray(positions, dtype='int64'))
+    
+    def _remove(self, ids):
+        ids = np.asarray(ids, dtype='int64')
+        dense = (ids >= 0) & (ids < len(self._positions))
+        self._positions[ids[dense]] = -1
+        for key in ids[~dense].tolist():
+            self._sparse.pop(key, None)
+    
+    def get(self, ids):
+        """Row positions of ids, -1 where an ID has no row"""
+        ids = np.asarray(ids)
+        if ids.dtype.kind == 'f':
+            ids = np.where(np.isnan(ids), -1, ids)
+        ids = ids.astype('int64', copy=False)
+        dense = (ids >= 0) & (ids < len(self._positions))
+        positions = np.full(len(ids), -1, dtype='int64')
+        positions[dense] = self._positions[ids[dense]]
+        if self._sparse:
+            for i in np.flatnonzero(~dense):
+                positions[i] = self._sparse.get(int(ids[i]), -1)
+        return positions
+
+class Relationships:
+    """Key indexes of the ID tables and the rows whose foreign key has no match
+    
+    Built once from the tables and then kept in step with every write.
+    Appended or edited rows are checked on their own, and rows added to a
+    referenced table are matched only against the rows left dangling. A
+    key found in the referenced table's archive, such as a graduate's
+    StudentID in alumni, is not dangling.
+    """
+    
+    def __init__(self, tables):
+        self.keys = {}
+        self.indexes = {}
+        self.dangling = {fk: {} for fk in FOREIGN_KEYS}
+        # Each indexed table and the table whose foreign keys it can satisfy
+        self.referenced = {name: name for name in ID_COLUMNS}
+        self.referenced.update({archive: table for table, archive in ARCHIVE_TABLES.items()})
+        for name in self.referenced:
+            self._index_table(name, tables[name])
+        for table, column, _ in FOREIGN_KEYS:
+            self.keys[(table, column)] = tables[table][column].to_numpy(dtype='int64')
+        for fk in FOREIGN_KEYS:
+            self._check(fk)
+    
+    def _index_table(self, name, df):
+        column = ID_COLUMNS[self.referenced[name]]
+        self.keys[(name, column)] = df[column].to_numpy(dtype='int64')
+        self.indexes[name] = KeyIndex(self.keys[(name, column)])
+    
+    def _found(self, parent, keys):
+        """Whether each key has a row in a referenced table or its archive"""
+        found = self.indexes[parent].get(keys) >= 0
+        if parent in ARCHIVE_TABLES:
+            found |= self.indexes[ARCHIVE_TABLES[parent]].get(keys) >= 0
+        return found
+    
+    def _check(self, fk, positions=None):
+        """Record which of a foreign key's rows (all by default) point nowhere"""
+        table, column, parent = fk
+        dangling = self.dangling[fk]
+        if positions is None:
+            dangling.clear()
+            positions = np.arange(len(self.keys[(table, column)]))
+        else:
+            for position in positions.tolist():
+                dangling.pop(position, None)
+        keys = self.keys[(table, column)][positions]
+        missing = ~self._found(parent, keys)
+        dangling.update(zip(positions[missing].tolist(), keys[missing].tolist()))
+    
+    def _resolve(self, parent):
+        """Drop dangling rows whose key a referenced table now has"""
+        for fk in FOREIGN_KEYS:
+            dangling = self.dangling[fk]
+            if fk[2] == parent and dangling:
+                positions = np.fromiter(dangling, dtype='int64', count=len(dangling))
+                found = self._found(parent, list(dangling.values()))
+                for position in positions[found].tolist():
+                    del dangling[position]
+    
+    def _orphan(self, parent, ids):
+        """Check the rows that referred to IDs a referenced table no longer has"""
+        for fk in FOREIGN_KEYS:
+            table, column, referenced = fk
+            if referenced == parent:
+                self._check(fk, np.flatnonzero(np.isin(self.keys[(table, column)], ids)))
+    
+    def rebuild_table(self, name, df):
+        """Re-index a replaced table and recheck every key touching it"""
+        if name in self.referenced:
+            self._index_table(name, df)
+        for fk in FOREIGN_KEYS:
+            table, column, parent = fk
+            if table == name:
+                self.keys[(table, column)] = df[column].to_numpy(dtype='int64')
+            if name == table or self.referenced.get(name) == parent:
+                self._check(fk)
+    
+    def add_rows(self, name, rows, start):
+        """Index rows appended at position start and check their keys"""
+        if name in self.referenced:
+            column = ID_COLUMNS[self.referenced[name]]
+            ids = rows[column].to_numpy(dtype='int64')
+            self.keys[(name, column)] = np.concatenate([self.keys[(name, column)], ids])
+            self.indexes[name].add(ids, start)
+            self._resolve(self.referenced[name])
+        for fk in FOREIGN_KEYS:
+            table, column, _ = fk
+            if table == name:
+                key = (table, column)
+                self.keys[key] = np.concatenate([self.keys[key], rows[column].to_numpy(dtype='int64')])
+                self._check(fk, np.arange(start, start + len(rows)))
+    
+    def update_rows(self, name, positions, rows):
+        """Re-index edited rows and recheck their keys"""
+        positions = np.asarray(positions, dtype='int64')
+        if name in self.referenced:
+            column = ID_COLUMNS[self.referenced[name]]
+            old_ids = self.keys[(name, column)][positions]
+            new_ids = rows[column].to_numpy(dtype='int64')
+            changed = old_ids != new_ids
+            if changed.any():
+                self.keys[(name, column)][positions] = new_ids
+                self.indexes[name].move(old_ids[changed], new_ids[changed], positions[changed])
+                self._orphan(self.referenced[name], old_ids[changed])
+                self._resolve(self.referenced[name])
+        for fk in FOREIGN_KEYS:
+            table, column, _ = fk
+            if table == name:
+                self.keys[(table, column)][positions] = rows[column].to_numpy(dtype='int64')
+                self._check(fk, positions)
+    
+    def positions(self, name, ids):
+        """Row positions in an ID table or archive of ids, -1 where there is no such row"""
+        return self.indexes[name].get(ids)
+    
+    def exists(self, name, ids):
+        """Whether each of ids has a row in an ID table"""
+        return self.positions(name, ids) >= 0
+    
+    def report(self):
+        """Rows whose foreign key matches no row, one line each"""
+        frames = [
+            pd.DataFrame({
+                'Table': table,
+                'Row': list(dangling),
+                'Column': column,
+                'Missing': [format_id(column, key) for key in dangling.values()]
+            })
+            for (table, column, _), dangling in self.dangling.items()
+            if dangling
+        ]
+        if not frames:
+            return pd.DataFrame(columns=['Table', 'Row', 'Column', 'Missing'])
+        return pd.concat(frames, ignore_index=True).sort_values(['Table', 'Row'], ignore_index=True)
+
+# =============================================================================
+# SEARCH INDEX
+# =============================================================================
+
+# Common romanisation variants in Malaysian names, folded to one spelling
+NAME_VARIANTS = {
+    'mohd': 'muhammad', 'muhd': 'muhammad', 'md': 'muhammad',
+    'mohamad': 'muhammad', 'mohammad': 'muhammad', 'mohamed': 'muhammad',
+    'mohammed': 'muhammad', 'muhamad': 'muhammad', 'muhammed': 'muhammad',
+    'ahmed': 'ahmad', 'abd': 'abdul', 'noor': 'nur', 'nor': 'nur',
+    'aishah': 'aisyah', 'aisha': 'aisyah', 'syarifah': 'sharifah',
+    'bt': 'binti', 'bte': 'binti', 'binte': 'binti'
+}
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+@functools.lru_cache(maxsize=65536)
+def _token_trigrams(token, closed):
+    """Trigrams of one padded token; names reuse few tokens, so this caches well"""
+    padded = '  ' + token + (' ' if closed else '')
+    return frozenset(padded[j:j + 3] for j in range(len(padded) - 2))
+
+class SearchIndex:
+    """Trigram index for search-as-you-type over names, plus exact ID lookup
+    
+    Keys are row positions in the indexed table. Each name token is padded
+    so one- and two-letter prefixes still map to a trigram. A query matches
+    when it shares at least `threshold` of its trigrams with a name, and
+    candidates come only from the rarest posting lists that could reach
+    that threshold.
+    """
+    
+    def __init__(self, names=(), ids=(), threshold=0.7):
+        self.threshold = threshold
+        self._postings = {}
+        self._arrays = {}
+        self._names = []
+        self._ids = {}
+        self._stale = set()
+        for name, row_id in zip(names, ids):
+            self.add(name, row_id)
+    
+    def __len__(self):
+        return len(self._names)
+    
+    @staticmethod
+    def normalize(text):
+        """Lowercase, strip accents and punctuation and fold name variants"""
+        text = str(text)
+        if not text.isascii():
+            text = unicodedata.normalize('NFKD', text)
+            text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+        tokens = _NON_ALNUM.sub(' ', text.lower()).split()
+        return [NAME_VARIANTS.get(token, token) for token in tokens]
+    
+    @classmethod
+    def trigrams(cls, text, prefix=False):
+        """Trigrams of every token; with prefix the last token stays open-ended"""
+        tokens = cls.normalize(text)
+        grams = set()
+        for i, token in enumerate(tokens):
+            grams |= _token_trigrams(token, not (prefix and i == len(tokens) - 1))
+        return grams
+    
+    def _posting(self, gram):
+        """Sorted array of keys containing a trigram, rebuilt only after writes"""
+        array = self._arrays.get(gram)
+        if array is None:
+            array = np.unique(np.asarray(self._postings.get(gram, []), dtype=np.int64))
+            self._arrays[gram] = array
+        return array
+    
+    def add(self, name, row_id):
+        """Index a new row at the next position and return its key"""
+        key = len(self._names)
+        self._names.append(name)
+        self._ids[row_id] = key
+        for gram in self.trigrams(name):
+            self._postings.setdefault(gram, []).append(key)
+            self._arrays.pop(gram, None)
+        return key
+    
+    def update(self, key, name, row_id):
+        """Re-index an edited row in place"""
+        old_grams = self.trigrams(self._names[key])
+        grams = self.trigrams(name)
+        for gram in grams - old_grams:
+            self._postings.setdefault(gram, []).append(key)
+            self._arrays.pop(gram, None)
+        if old_grams - grams:
+            self._stale.add(key)
+        self._names[key] = name
+        self._ids[row_id] = key
+    
+    def search(self, query, query_id=None):
+        """Return matching keys, best match first
+        
+        An exact ID hit ranks first; names are ranked by the share of query
+        trigrams they contain, ties keeping table order.
+        """
+        id_key = self._ids.get(query_id) if query_id is not None else None
+        grams = self.trigrams(query, prefix=True)
+        if not grams:
+            return np.array([] if id_key is None else [id_key], dtype=np.int64)
+        
+        postings = sorted((self._posting(gram) for gram in grams), key=len)
+        needed = max(1, math.ceil(self.threshold * len(grams)))
+        candidates = np.unique(np.concatenate(postings[:len(grams) - needed + 1]))
+        
+        counts = np.zeros(len(candidates), dtype=np.int64)
+        for posting in postings:
+            if len(posting):
+                found = np.searchsorted(posting, candidates)
+                found[found == len(posting)] = 0
+                counts += posting[found] == candidates
+        
+        # Edited rows may still sit in postings of their old name
+        if self._stale:
+            for i in np.flatnonzero(np.isin(candidates, list(self._stale))):
+                counts[i] = len(grams & self.trigrams(self._names[candidates[i]]))
+        
+        keep = counts >= needed
+        candidates, counts = candidates[keep], counts[keep]
+        keys = candidates[np.lexsort((candidates, -counts))]
+        if id_key is not None:
+            keys = np.concatenate([[id_key], keys[keys != id_key]])
+        return keys
+
+# =============================================================================
+# TIMETABLE GRIDS
+# =============================================================================
+
+def build_timetable_grids(timetable, teachers, by='Class', teacher_positions=None):
+    """Build the weekly Period x Day grid of every class or teacher in one pass
+    
+    Each lesson is scattered into a flat (key, period, day) array that is
+    reshaped once into the stacked grids. The result is indexed by
+    (key, 'Period N') with one column per day, so one grid is
+    grids.loc[key]. When two lessons share a slot the first one is shown.
+    teacher_positions, each lesson's row in teachers, saves looking the
+    teachers up by ID.
+    """
+    subject = timetable['Subject'].astype(str)
+    room = 'Room ' + timetable['Room'].astype(str)
+    if by == 'Class':
+        if teacher_positions is None:
+            teacher_positions = pd.Index(teachers['TeacherID']).get_indexer(timetable['TeacherID'])
+        teacher_names = pd.Series(
+            teachers['Name'].array.take(teacher_positions, allow_fill=True), index=timetable.index
+        )
+        cells = subject + '\n' + teacher_names.astype(str) + '\n' + room
+    else:
+        cells = subject + '\n' + timetable['Class'].astype(str) + '\n' + room
+    
+    key_codes, keys = pd.factorize(timetable[by], sort=True)
+    period_codes, periods = pd.factorize(timetable['Period'], sort=True)
+    day_codes = pd.Categorical(timetable['Day'].astype(str), categories=DAYS).codes
+    
+    valid = day_codes >= 0
+    flat = ((key_codes * len(periods) + period_codes) * len(DAYS) + day_codes)[valid]
+    grid = np.full(len(keys) * len(periods) * len(DAYS), '—', dtype=object)
+    # Reversed so the first lesson in a slot is the one that sticks
+    grid[flat[::-1]] = cells.to_numpy(dtype=object)[valid][::-1]
+    
+    index = pd.MultiIndex.from_product(
+        [keys, [f'Period {period}' for period in periods]], names=[by, 'Period']
+    )
+    return pd.DataFrame(grid.reshape(len(keys) * len(periods), len(DAYS)), index=index, columns=DAYS)
+
+# =============================================================================
+# TIMETABLE CONFLICTS
+# =============================================================================
+
+class TimetableConflicts:
+    """Hash indexes of who and what is booked in each (Day, Period)
+    
+    Every teacher, room and class maps (value, Day, Period) to the lesson
+    positions booked there. Checking a proposed lesson is one lookup per
+    resource, and a school-wide clash report is one pass over the indexes.
+    """
+    
+    RESOURCES = ('TeacherID', 'Room', 'Class')
+    
+    def __init__(self, timetable):
+        self._bookings = {resource: defaultdict(set) for resource in self.RESOURCES}
+        self._lessons = {}
+        columns = [timetable[column].tolist() for column in self.RESOURCES + ('Day', 'Period')]
+        for position, values in enumerate(zip(*columns)):
+            self._book(position, dict(zip(self.RESOURCES + ('Day', 'Period'), values)))
+    
+    def _book(self, position, lesson):
+        self._lessons[position] = lesson
+        for resource in self.RESOURCES:
+            self._bookings[resource][(lesson[resource], lesson['Day'], lesson['Period'])].add(position)
+    
+    def _unbook(self, position):
+        lesson = self._lessons.pop(position)
+        for resource in self.RESOURCES:
+            key = (lesson[resource], lesson['Day'], lesson['Period'])
+            self._bookings[resource][key].discard(position)
+            if not self._bookings[resource][key]:
+                del self._bookings[resource][key]
+    
+    def add(self, position, row):
+        """Book a newly appended lesson"""
+        self._book(position, {column: row[column] for column in self.RESOURCES + ('Day', 'Period')})
+    
+    def update(self, position, row):
+        """Move an edited lesson to its new bookings"""
+        self._unbook(position)
+        self.add(position, row)
+    
+    def booked(self, resource, value, day, period):
+        """Positions of the lessons booking a resource in one slot"""
+        return set(self._bookings[resource].get((value, day, period), set()))
+    
+    def check(self, lesson, ignore=None):
+        """Clashes a lesson would cause, as (resource, value, positions) tuples
+        
+        ignore is the position of the lesson being edited, so it does not
+        clash with itself.
+        """
+        clashes = []
+        for resource in self.RESOURCES:
+            key = (lesson[resource], lesson['Day'], lesson['Period'])
+            booked = self._bookings[resource].get(key, set()) - {ignore}
+            if booked:
+                clashes.append((resource, lesson[resource], sorted(booked)))
+        return clashes
+    
+    def report(self):
+        """Every double booking in the school, one row per clash"""
+        rows = []
+        for resource, bookings in self._bookings.items():
+            for (value, day, period), positions in bookings.items():
+                if len(positions) > 1:
+                    rows.append({
+                        'Resource': resource,
+                        'Value': value,
+                        'Day': day,
+                        'Period': period,
+                        'Classes': ', '.join(sorted(
+                            str(self._lessons[position]['Class']) for position in positions
+                        )),
+                        'Lessons': len(positions)
+                    })
+        return pd.DataFrame(rows, columns=['Resource', 'Value', 'Day', 'Period', 'Classes', 'Lessons'])
+
+# =============================================================================
+# TIMETABLE SCHEDULER
+# =============================================================================
+
+# Periods per week each class needs in each subject
+SUBJECT_PERIODS = {
+    'Mathematics': 5,
+    'English': 4,
+    'Malay': 4,
+    'Science': 4,
+    'History': 2,
+    'Geography': 2,
+    'ICT': 1,
+    'PE': 1,
+    'Art': 1,
+    'Business': 1
+}
+
+# Seats in a teaching room
+ROOM_SEATS = 40
+
+# Teaching rooms and their seating capacity
+ROOM_CAPACITIES = {f'R{i}': ROOM_SEATS for i in range(1, 25)}
+
+def class_enrolment(students):
+    """Students per timetable class ('7B')"""
+    return class_codes(students['CurrentLevel'], students['Class']).value_counts().to_dict()
+
+def school_rooms(timetable):
+    """The standard teaching rooms plus any others the timetable already uses"""
+    rooms = dict(ROOM_CAPACITIES)
+    for room in timetable['Room'].astype(str).unique():
+        rooms.setdefault(room, ROOM_SEATS)
+    return rooms
+
+def _search_timetable(lesson_teachers, lesson_subjects, n_teachers, n_subjects,
+                      slot_days, max_daily, seed, time_budget, stop=None):
+    """Min-conflicts local search over each class's ordering of its lessons
+    
+    Runs in worker processes, so it only takes arrays. Cost is the number of
+    teacher double bookings plus lessons of one subject beyond max_daily on
+    a day. Returns (cost, clashes, order, iterations) for the best state
+    seen, where order[c, s] is the lesson class c has in slot s.
+    """
+    rng = np.random.default_rng(seed)
+    n_classes, n_slots = lesson_teachers.shape
+    n_days = int(slot_days.max()) + 1
+    free = n_teachers
+    rows = np.arange(n_classes)[:, None]
+    
+    order = np.argsort(rng.random((n_classes, n_slots)), axis=1)
+    teachers = np.where(lesson_teachers < 0, free, lesson_teachers)[rows, order]
+    subjects = np.where(lesson_subjects < 0, n_subjects, lesson_subjects)[rows, order]
+    
+    busy = np.zeros((n_teachers + 1, n_slots), dtype=np.int64)
+    np.add.at(busy, (teachers, np.broadcast_to(np.arange(n_slots), teachers.shape)), 1)
+    daily = np.zeros((n_classes, n_subjects + 1, n_days), dtype=np.int64)
+    np.add.at(daily, (np.broadcast_to(rows, subjects.shape), subjects, slot_days[None, :]), 1)
+    
+    def clash_count():
+        return int(np.maximum(busy[:free] - 1, 0).sum())
+    
+    def spread_count():
+        return int(np.maximum(daily[:, :n_subjects] - max_daily, 0).sum())
+    
+    cost = clash_count() + spread_count()
+    best_cost, best_order = cost, order.copy()
+    iterations = 0
+    deadline = time.perf_counter() + time_budget
+    
+    while cost > 0:
+        iterations += 1
+        if iterations % 512 == 0:
+            if time.perf_counter() > deadline or (stop is not None and stop.is_set()):
+                break
+        
+        # Pick a lesson that is part of a violation
+        clashing = np.argwhere(busy[:free] > 1)
+        if len(clashing):
+            t, s = clashing[rng.integers(len(clashing))]
+            c = rng.choice(np.flatnonzero(teachers[:, s] == t))
+        else:
+            c, a, d = np.argwhere(daily[:, :n_subjects] > max_daily)[rng.integers(
+                int((daily[:, :n_subjects] > max_daily).sum())
+            )]
+            s = rng.choice(np.flatnonzero((subjects[c] == a) & (slot_days == d)))
+        
+        t, a, d = teachers[c, s], subjects[c, s], slot_days[s]
+        other_t, other_a, other_d = teachers[c], subjects[c], slot_days
+        slots = np.arange(n_slots)
+        
+        # Change in teacher clashes if (c, s) swaps with each (c, s2)
+        swap_t = (other_t != t).astype(np.int64)
+        real_other = (other_t != free).astype(np.int64)
+        real_t = int(t != free)
+        delta = swap_t * (
+            real_t * (busy[t, slots] >= 1) - real_t * int(busy[t, s] >= 2)
+            + real_other * (busy[other_t, s] >= 1) - real_other * (busy[other_t, slots] >= 2)
+        )
+        
+        # Change in subject-per-day excess
+        row = daily[c]
+        moves = ((other_d != d) & (other_a != a)).astype(np.int64)
+        real_a = int(a < n_subjects)
+        real_other_a = (other_a < n_subjects).astype(np.int64)
+        delta += moves * (
+            real_a * ((row[a, other_d] >= max_daily) - int(row[a, d] > max_daily))
+            + real_other_a * ((row[other_a, d] >= max_daily).astype(np.int64)
+                              - (row[other_a, other_d] > max_daily))
+        )
+        
+        useless = (other_t == t) & (other_a == a)
+        delta[useless] = np.iinfo(np.int64).max
+        delta[s] = np.iinfo(np.int64).max
+        
+        if rng.random() < 0.1:
+            s2 = rng.choice(np.flatnonzero(~useless & (np.arange(n_slots) != s)))
+        else:
+            s2 = rng.choice(np.flatnonzero(delta == delta.min()))
+        
+        t2, a2, d2 = teachers[c, s2], subjects[c, s2], slot_days[s2]
+        busy[t, s] -= 1
+        busy[t, s2] += 1
+        busy[t2, s2] -= 1
+        busy[t2, s] += 1
+        daily[c, a, d] -= 1
+        daily[c, a, d2] += 1
+        daily[c, a2, d2] -= 1
+        daily[c, a2, d] += 1
+        teachers[c, [s, s2]] = teachers[c, [s2, s]]
+        subjects[c, [s, s2]] = subjects[c, [s2, s]]
+        order[c, [s, s2]] = order[c, [s2, s]]
+        cost += int(delta[s2])
+        
+        if cost < best_cost:
+            best_cost, best_order = cost, order.copy()
+    
+    teachers = np.where(lesson_teachers < 0, free, lesson_teachers)[rows, best_order]
+    busy = np.zeros((n_teachers + 1, n_slots), dtype=np.int64)
+    np.add.at(busy, (teachers, np.broadcast_to(np.arange(n_slots), teachers.shape)), 1)
+    return best_cost, clash_count(), best_order, iterations
+
+class TimetableScheduler:
+    """Build a clash-free weekly timetable for every class
+    
+    Each class gets one specialist teacher per subject, chosen to keep
+    teachers within their AssignedPeriods limit, and a home room large
+    enough for it. Lessons are then ordered over the week by local search,
+    with independent restarts spread over worker processes until one is
+    clash-free or the time budget runs out.
+    """
+    
+    def __init__(self, classes, teachers, rooms=None, requirements=None, days=DAYS,
+                 periods=range(1, 6), class_sizes=None, max_daily=2):
+        self.classes = list(classes)
+        self.teachers = teachers
+        self.rooms = rooms or ROOM_CAPACITIES
+        self.requirements = requirements or SUBJECT_PERIODS
+        self.days = list(days)
+        self.periods = list(periods)
+        self.class_sizes = class_sizes or {}
+        self.max_daily = max_daily
+    
+    @property
+    def n_slots(self):
+        return len(self.days) * len(self.periods)
+    
+    def allocate_teachers(self):
+        """Assign one specialist per (class, subject), most spare capacity first"""
+        capacity = {
+            teacher_id: min(int(limit), self.n_slots)
+            for teacher_id, limit in zip(self.teachers['TeacherID'], self.teachers['AssignedPeriods'])
+        }
+        specialists = defaultdict(list)
+        for teacher_id, subject in zip(self.teachers['TeacherID'], self.teachers['SubjectSpecialty']):
+            specialists[subject].append(teacher_id)
+        
+        allocation = {}
+        demands = sorted(
+            ((periods, class_name, subject)
+             for class_name in self.classes
+             for subject, periods in self.requirements.items() if periods),
+            key=lambda demand: (-demand[0], demand[2], demand[1])
+        )
+        for periods, class_name, subject in demands:
+            candidates = [tid for tid in specialists[subject] if capacity[tid] >= periods]
+            if not candidates:
+                raise ValueError(
+                    f"No {subject} teacher has {periods} free periods left for class {class_name}"
+                )
+            teacher_id = max(candidates, key=lambda tid: (capacity[tid], -tid))
+            capacity[teacher_id] -= periods
+            allocation[(class_name, subject)] = teacher_id
+        return allocation
+    
+    def assign_rooms(self):
+        """Give each class a home room, largest class to largest room"""
+        if len(self.rooms) < len(self.classes):
+            raise ValueError(f"{len(self.classes)} classes need at least as many rooms, found {len(self.rooms)}")
+        rooms = sorted(self.rooms.items(), key=lambda room: -room[1])
+        classes = sorted(self.classes, key=lambda name: -self.class_sizes.get(name, 0))
+        assignment = {}
+        for class_name, (room, capacity) in zip(classes, rooms):
+            size = self.class_sizes.get(class_name, 0)
+            if size > capacity:
+                raise ValueError(f"No free room holds class {class_name} ({size} students)")
+            assignment[class_name] = room
+        return assignment
+    
+    def _lesson_arrays(self, allocation):
+        total = sum(self.requirements.values())
+        if total > self.n_slots:
+            raise ValueError(f"Classes need {total} periods but the week has {self.n_slots}")
+        subjects = list(self.requirements)
+        lesson_teachers = np.full((len(self.classes), self.n_slots), -1, dtype=np.int64)
+        lesson_subjects = np.full((len(self.classes), self.n_slots), -1, dtype=np.int64)
+        teacher_ids = self.teachers['TeacherID'].tolist()
+        teacher_index = {tid: i for i, tid in enumerate(teacher_ids)}
+        for c, class_name in enumerate(self.classes):
+            slot = 0
+            for subject_index, subject in enumerate(subjects):
+                for _ in range(self.requirements[subject]):
+                    lesson_teachers[c, slot] = teacher_index[allocation[(class_name, subject)]]
+                    lesson_subjects[c, slot] = subject_index
+                    slot += 1
+        return lesson_teachers, lesson_subjects
+    
+    def solve(self, time_budget=10.0, workers=1, seed=0):
+        """Return (timetable, stats)
+        
+        workers > 1 runs that many seeded restarts in parallel processes;
+        the first clash-free result wins, otherwise the lowest cost does.
+        """
+        started = time.perf_counter()
+        allocation = self.allocate_teachers()
+        home_rooms = self.assign_rooms()
+        lesson_teachers, lesson_subjects = self._lesson_arrays(allocation)
+        slot_days = np.repeat(np.arange(len(self.days)), len(self.periods))
+        args = (lesson_teachers, lesson_subjects, len(self.teachers), len(self.requirements),
+                slot_days, self.max_daily)
+        
+        results = []
+        if workers > 1:
+            try:
+                with multiprocessing.Manager() as manager:
+                    stop = manager.Event()
+                    with ProcessPoolExecutor(max_workers=workers) as pool:
+                        futures = [
+                            pool.submit(_search_timetable, *args, seed + i, time_budget, stop)
+                            for i in range(workers)
+                        ]
+                        for future in as_completed(futures):
+                            results.append(future.result())
+                            if results[-1][0] == 0:
+                                stop.set()
+            except (BrokenProcessPool, pickle.PicklingError, AttributeError):
+                # Workers could not load the search function; search in-process instead
+                results = []
+        if not results:
+            results = [_search_timetable(*args, seed, time_budget)]
+        
+        cost, clashes, order, iterations = min(results, key=lambda result: result[0])
+        
+        subjects = list(self.requirements)
+        teacher_ids = self.teachers['TeacherID'].to_numpy()
+        rows = np.arange(len(self.classes))[:, None]
+        slot_teachers = lesson_teachers[rows, order]
+        slot_subjects = lesson_subjects[rows, order]
+        class_index, slot_index = np.nonzero(slot_teachers >= 0)
+        classes = np.array(self.classes, dtype=object)[class_index]
+        timetable = pd.DataFrame({
+            'Class': classes,
+            'Subject': np.array(subjects, dtype=object)[slot_subjects[class_index, slot_index]],
+            'TeacherID': teacher_ids[slot_teachers[class_index, slot_index]],
+            'Day': np.array(self.days, dtype=object)[slot_index // len(self.periods)],
+            'Period': np.array(self.periods)[slot_index % len(self.periods)],
+            'Room': [home_rooms[class_name] for class_name in classes]
+        })
+        stats = {
+            'classes': len(self.classes),
+            'lessons': len(timetable),
+            'clashes': clashes,
+            'spread_violations': cost - clashes,
+            'iterations': sum(result[3] for result in results),
+            'seconds': time.perf_counter() - started
+        }
+        return timetable, stats
+
+# =============================================================================
+# SYNTHETIC SCHOOL
+# =============================================================================
+
+# Students in the hand-written sample school; generated schools are multiples of it
+SAMPLE_STUDENTS = 50
+
+# Students per class section when sizing a generated school
+CLASS_SIZE = 30
+
+# Name parts drawn for generated people
+FIRST_NAMES = [
+    'Ahmad', 'Aina', 'Amir', 'Arjun', 'Bryan', 'Chloe', 'Daniel', 'Dinesh', 'Emily', 'Ethan',
+    'Hafiz', 'Hannah', 'Isaac', 'Jason', 'Kavita', 'Liyana', 'Mei Ling', 'Muhammad', 'Nur',
+    'Priya', 'Raj', 'Ryan', 'Sarah', 'Siti', 'Tharani', 'Wei Ming', 'Zul'
+]
+LAST_NAMES = [
+    'Ali', 'Chong', 'Fernandez', 'Goh', 'Hassan', 'Ismail', 'Koh', 'Kumar', 'Lee', 'Lim',
+    'Nair', 'Ng', 'Ong', 'Rahman', 'Tan', 'Wong', 'Yusof'
+]
+
+def section_names(n):
+    """'A', 'B', ..., 'Z', 'AA', 'AB', ... for n class sections per level"""
+    names = []
+    for i in range(n):
+        name = ''
+        i += 1
+        while i:
+            i, remainder = divmod(i - 1, 26)
+            name = chr(65 + remainder) + name
+        names.append(name)
+    return names
+
+def generate_school(scale=1, seed=2025, years=1, year=2025, time_budget=10.0):
+    """Build a seeded synthetic school with every table sized from its students
+    
+    scale multiplies the 50-student sample school. Each level gets enough
+    sections of CLASS_SIZE students (at least two), teachers and rooms follow
+    the timetable's weekly lesson demand, staff follow the number of
+    classes, siblings share parents, and every student has one results row
+    for each of the last `years` years they were at school. The same
+    arguments always build the same school.
+    """
+    rng = np.random.RandomState(seed)
+    n_students = int(SAMPLE_STUDENTS * scale)
+    
+    def names(n):
+        return pd.Series(rng.choice(FIRST_NAMES, n)) + ' ' + pd.Series(rng.choice(LAST_NAMES, n))
+    
+    def digits(n, width):
+        return pd.Series(rng.randint(10 ** (width - 1), 10 ** width, n)).astype(str)
+    
+    # Classes
+    sections = section_names(max(2, math.ceil(n_students / (len(LEVELS) * CLASS_SIZE))))
+    classes = [f'{grade}{section}' for grade in range(1, len(LEVELS) + 1) for section in sections]
+    
+    # Students, spread evenly over levels and sections
+    level_index = rng.randint(0, len(LEVELS), n_students)
+    section = np.array(sections)[rng.randint(0, len(sections), n_students)]
+    ability = rng.normal(70, 12, n_students)
+    score = np.clip(np.round(ability + rng.normal(0, 5, n_students)), 0, 100)
+    attendance = np.clip(np.round(rng.normal(90, 6, n_students)), 40, 100)
+    status = np.where(score < 45, 'Retained', rng.choice(['Promoted', 'Pending'], n_students, p=[0.8, 0.2]))
+    dob = (
+        pd.to_datetime([f'{year - 7 - level}-01-01' for level in range(len(LEVELS))])[level_index]
+        + pd.to_timedelta(rng.randint(0, 365, n_students), unit='D')
+    )
+    
+    # Parents; siblings share one, so there are fewer parents than students
+    n_parents = max(1, math.ceil(n_students / 1.2))
+    parent_ids = np.concatenate([
+        rng.permutation(n_parents),
+        rng.randint(0, n_parents, max(0, n_students - n_parents))
+    ])[:n_students] + 1
+    
+    students = pd.DataFrame({
+        'StudentID': np.arange(1, n_students + 1),
+        'FullName': names(n_students),
+        'IC_Number': '01-' + digits(n_students, 6),
+        'DOB': dob,
+        'Gender': rng.choice(['Male', 'Female'], n_students),
+        'CurrentLevel': np.array(LEVELS)[level_index],
+        'Class': section,
+        'ParentID': parent_ids,
+        'AvgScore': score,
+        'Attendance%': attendance,
+        'PromotionStatus': status,
+        'NextLevel': ''
+    })
+    
+    parents = pd.DataFrame({
+        'ParentID': np.arange(1, n_parents + 1),
+        'ParentName': names(n_parents),
+        'IC': '01-' + digits(n_parents, 6),
+        'Phone': '+6012-' + digits(n_parents, 7),
+        'Email': [f'parent{i}@email.com' for i in range(1, n_parents + 1)],
+        'Address': 'Kuala Lumpur',
+        'Occupation': rng.choice(['Teacher', 'Engineer', 'Doctor', 'Business', 'Government'], n_parents)
+    })
+    
+    # Teachers: each subject staffed with 25% headroom over its weekly periods
+    specialties = np.concatenate([
+        [subject] * math.ceil(periods * len(classes) * 1.25 / 25)
+        for subject, periods in SUBJECT_PERIODS.items()
+    ])
+    n_teachers = len(specialties)
+    teachers = pd.DataFrame({
+        'TeacherID': np.arange(1, n_teachers + 1),
+        'Name': names(n_teachers),
+        'SubjectSpecialty': rng.permutation(specialties),
+        'EmploymentStatus': rng.choice(['Permanent', 'Contract'], n_teachers, p=[0.7, 0.3]),
+        'AssignedPeriods': rng.randint(22, 31, n_teachers),
+        'WorkloadStatus': 'Balanced'
+    })
+    
+    n_staff = math.ceil(18 * len(classes) / 22)
+    staff = pd.DataFrame({
+        'StaffID': np.arange(1, n_staff + 1),
+        'Name': names(n_staff),
+        'Role': rng.choice(['Admin', 'Security', 'Technician', 'Librarian', 'Cleaner'], n_staff),
+        'Phone': '+6012-' + digits(n_staff, 7),
+        'EmploymentStatus': 'Permanent'
+    })
+    
+    # Results: the current year matches the student record, earlier years
+    # are drawn around the same ability at the level the student was then in
+    history = []
+    for years_back in range(years):
+        was_at_school = level_index >= years_back
+        past_score = score if years_back == 0 else np.clip(
+            np.round(ability + rng.normal(0, 5, n_students)), 0, 100
+        )
+        past_attendance = attendance if years_back == 0 else np.clip(
+            np.round(rng.normal(90, 6, n_students)), 40, 100
+        )
+        history.append(pd.DataFrame({
+            'StudentID': students['StudentID'].to_numpy()[was_at_school],
+            'Year': year - years_back,
+            'Level': np.array(LEVELS)[level_index[was_at_school] - years_back],
+            'Class': section[was_at_school],
+            'AverageScore': past_score[was_at_school],
+            'Attendance%': past_attendance[was_at_school]
+        }))
+    results = pd.concat(history, ignore_index=True)
+    
+    rooms = {f'R{i}': ROOM_SEATS for i in range(1, len(classes) + 1)}
+    timetable, _ = TimetableScheduler(
+        classes, teachers, rooms, class_sizes=class_enrolment(students)
+    ).solve(time_budget=time_budget, seed=seed)
+    
+    return {
+        'students': students,
+        'parents': parents,
+        'teachers': teachers,
+        'staff': staff,
+        'results': results,
+        'timetable': timetable
+    }
+
 # =============================================================================
 # DATA MANAGER
 # =============================================================================
 
+class WriteConflict(Exception):
+    """A table changed after the writer last read it"""
+    
+    def __init__(self, name, expected_version, current_version):
+        super().__init__(
+            f"{name} was changed by someone else (version {current_version}, expected {expected_version})"
+        )
+        self.name = name
+        self.expected_version = expected_version
+        self.current_version = current_version
+
+@st.cache_resource
+def _write_conflict_class():
+    """The WriteConflict class of the first run in this process
+    
+    Streamlit runs the script in a new module on every rerun, but the
+    shared data manager raises the class from the run that created it.
+    Pages must catch that same class.
+    """
+    return WriteConflict
+
+WriteConflict = _write_conflict_class()
+
 class DataManager:
     """Handle all data operations"""
     
-    def __init__(self):
+    def __init__(self, seed=2025, backend='memory', storage_path=None, sample_scale=1,
+                 promotion_rules=None):
         self.data_files = {
             'students': 'STUDENTS',
             'parents': 'PARENTS',
             'teachers': 'TEACHERS',
             'staff': 'STAFF',
             'results': 'ACADEMIC_RESULTS',
-            'timetable': 'TIMETABLE'
+            'timetable': 'TIMETABLE',
+            'alumni': 'ALUMNI'
+        }
+        self.seed = seed
+        self.sample_scale = sample_scale
+        self.promotion_rules = promotion_rules or PromotionRules()
+        self.backend = backend
+        if backend == 'columnar':
+            self.storage = ColumnarStore(storage_path, self.data_files)
+        elif backend == 'sqlite':
+            self.storage = SQLiteStore(storage_path, self.data_files)
+        else:
+            self.storage = None
+        self._lock = threading.RLock()
+        self._tables = None
+        self._pending = {}
+        self._next_ids = {}
+        self._aggregates = None
+        self._search_indexes = {}
+        self._conflicts = None
+        self._promotions = None
+        self._relations = None
+        self._derived = {}
+        self._version = 0
+        self._table_versions = dict.fromkeys(self.data_files, 0)
+        self._published = None
+        self._changes = deque(maxlen=200)
+        self._writer = threading.local()
+    
+    @property
+    def version(self):
+        """Data version, bumped on every reload or write"""
+        return self._version
+    
+    def snapshot(self):
+        """Return the in-memory tables, loading them on first use
+        
+        The dict is a shallow copy: callers may rebind keys freely but
+        must treat the DataFrames themselves as read-only.
+        """
+        return self.versioned_snapshot()[0]
+    
+    def versioned_snapshot(self):
+        """Return (tables, version each table last changed at) as one consistent view
+        
+        Writers never modify a published view, they only drop it, so readers
+        take the lock-free path except right after a write.
+        """
+        published = self._published
+        if published is None:
+            with self._lock:
+                self._ensure_loaded()
+                if self._pending:
+                    self._compact_pending()
+                if self._published is None:
+                    self._published = (dict(self._tables), dict(self._table_versions))
+                published = self._published
+        return dict(published[0]), dict(published[1])
+    
+    def set_writer(self, session_id, user):
+        """Name the session whose writes follow on this thread, for change notices"""
+        self._writer.identity = (session_id, user)
+    
+    def changes_since(self, version):
+        """Writes recorded after a data version, oldest first"""
+        return [change for change in list(self._changes) if change['version'] > version]
+    
+    def _check_version(self, name, expected_version):
+        """Raise WriteConflict if a table moved past the version the writer read"""
+        if expected_version is not None and self._table_versions[name] != expected_version:
+            raise WriteConflict(name, expected_version, self._table_versions[name])
+    
+    def _record_change(self, name, action, rows):
+        """Bump the data version, retire the published view and log the write"""
+        self._version += 1
+        self._table_versions[name] = self._version
+        self._published = None
+        session_id, user = getattr(self._writer, 'identity', (None, None))
+        self._changes.append({
+            'version': self._version,
+            'table': name,
+            'action': action,
+            'rows': rows,
+            'session': session_id,
+            'user': user,
+            'time': datetime.now()
+        })
+    
+    def _ensure_loaded(self):
+        """Load the tables and ID sequences on first use"""
+        if self._tables is None:
+            self._tables = self._load_tables()
+            self._aggregates = SchoolAggregates(self._tables)
+            self._next_ids = self._load_sequences()
+            self._version += 1
+            self._table_versions = dict.fromkeys(self.data_files, self._version)
+    
+    def _compact_pending(self):
+        """Fold buffered appends into their tables, one concat per table"""
+        for name, chunks in self._pending.items():
+            self._tables[name] = apply_schema(
+                name, pd.concat([self._tables[name]] + chunks, ignore_index=True)
+            )
+        self._pending = {}
+    
+    def _row_count(self, name):
+        """Rows in a table including buffered appends"""
+        return len(self._tables[name]) + sum(len(chunk) for chunk in self._pending.get(name, []))
+    
+    def _load_sequences(self):
+        """Next free ID per table, past both its largest ID and the saved sequence"""
+        saved = self.storage.read_sequences() if self.storage is not None else {}
+        return {
+            name: max(
+                int(saved.get(name, 1)),
+                int(self._tables[name][column].max()) + 1 if len(self._tables[name]) else 1
+            )
+            for name, column in ID_COLUMNS.items()
+        }
+    
+    def _advance_sequence(self, name, next_id):
+        """Move a table's sequence forward, never back"""
+        if next_id > self._next_ids[name]:
+            self._next_ids[name] = next_id
+            if self.storage is not None:
+                self.storage.write_sequence(name, next_id)
+    
+    def allocate_ids(self, name, count=1):
+        """Reserve new IDs for a table
+        
+        IDs come from a sequence that only moves forward, so they stay
+        unique across sessions and are never reused after a delete.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            start = self._next_ids[name]
+            self._advance_sequence(name, start + count)
+            return np.arange(start, start + count)
+    
+    @property
+    def aggregates(self):
+        """Precomputed KPIs for the current tables"""
+        with self._lock:
+            self.snapshot()
+            return self._aggregates
+    
+    def _load_tables(self):
+        """Read tables from storage, seeding it with sample data when empty"""
+        if self.storage is None:
+            return self._decided_sample_data()
+        if not self.storage.exists():
+            for name, df in self._decided_sample_data().items():
+                # Archives are created by their first rows, typed by them
+                if name not in ARCHIVE_TABLES.values():
+                    self.storage.write_table(name, df)
+        tables = {
+            name: self.storage.read_table(name)
+            for name in self.data_files
+            if self.storage.has_table(name)
+        }
+        for table, archive in ARCHIVE_TABLES.items():
+            if archive not in tables:
+                tables[archive] = empty_archive(archive, tables[table])
+        return tables
+    
+    def _decided_sample_data(self):
+        """Sample tables with each student's promotion decided by the rules, and no alumni yet"""
+        tables = {name: apply_schema(name, df) for name, df in self.load_sample_data().items()}
+        engine = PromotionEngine(self.promotion_rules, tables['students'], tables['results'])
+        tables['students'] = apply_schema('students', engine.apply(tables['students']))
+        tables['alumni'] = empty_archive('alumni', tables['students'])
+        return tables
+    
+    def invalidate(self):
+        """Discard the loaded tables so the next snapshot reloads them"""
+        with self._lock:
+            self._tables = None
+            self._pending = {}
+            self._published = None
+            self._aggregates = None
+            self._search_indexes = {}
+            self._conflicts = None
+            self._promotions = None
+            self._relations = None
+            self._derived = {}
+            self._version += 1
+            # Any table may differ once reloaded
+            self._table_versions = dict.fromkeys(self.data_files, self._version)
+    
+    def update_table(self, name, df, expected_version=None):
+        """Replace a table for every session and bump the data version
+        
+        With expected_version, raise WriteConflict instead if the table has
+        changed since the caller read it.
+        """
+        if name not in self.data_files:
+            raise KeyError(f"Unknown table: {name}")
+        df = apply_schema(name, df)
+        with self._lock:
+            self.snapshot()
+            self._check_version(name, expected_version)
+            self._tables[name] = df
+            self._aggregates.rebuild_table(name, df)
+            self._search_indexes.pop(name, None)
+            if name == 'timetable':
+                self._conflicts = None
+            if name in ('students', 'results'):
+                self._promotions = None
+            if self._relations is not None:
+                self._relations.rebuild_table(name, df)
+            self._derived = {}
+            if self.storage is not None:
+                self.storage.write_table(name, df)
+            self._record_change(name, 'replace', len(df))
+    
+    def append_rows(self, name, rows):
+        """Append rows to a table and return their IDs
+        
+        Rows are buffered and folded into the table on the next read, so a
+        burst of inserts costs one concat instead of one each. Rows without
+        an ID get the next ones from the table's sequence. On disk this adds
+        a chunk, not a rewrite.
+        """
+        if name not in self.data_files:
+            raise KeyError(f"Unknown table: {name}")
+        id_column = ID_COLUMNS.get(name)
+        with self._lock:
+            self._ensure_loaded()
+            if id_column:
+                rows = self._assign_ids(name, rows)
+            rows = apply_schema(name, rows)
+            start = self._row_count(name)
+            self._pending.setdefault(name, []).append(rows)
+            self._aggregates.add_rows(name, rows)
+            self._derived = {}
+            if name == 'timetable' and self._conflicts is not None:
+                for offset, (_, row) in enumerate(rows.iterrows()):
+                    self._conflicts.add(start + offset, row)
+            if self._relations is not None:
+                self._relations.add_rows(name, rows, start)
+            if name in self._search_indexes:
+                name_column, id_column = SEARCH_COLUMNS[name]
+                for row_name, row_id in zip(rows[name_column], rows[id_column]):
+                    self._search_indexes[name].add(row_name, row_id)
+            self._track_promotions(name, rows, appended=True)
+            if self.storage is not None:
+                self.storage.append(name, rows)
+            self._record_change(name, 'append', len(rows))
+            return rows[id_column].to_numpy() if id_column else None
+    
+    def _assign_ids(self, name, rows):
+        """Fill in missing IDs and move the sequence past any given ones"""
+        id_column = ID_COLUMNS[name]
+        rows = rows.copy()
+        if id_column in rows.columns:
+            ids = pd.to_numeric(rows[id_column], errors='coerce').to_numpy(dtype='float64')
+        else:
+            ids = np.full(len(rows), np.nan)
+        missing = np.isnan(ids)
+        if missing.any():
+            ids[missing] = self.allocate_ids(name, int(missing.sum()))
+        if len(ids):
+            self._advance_sequence(name, int(ids.max()) + 1)
+        rows[id_column] = ids.astype('int64')
+        return rows
+    
+    def update_rows(self, name, key_column, rows, expected_version=None):
+        """Overwrite the rows whose key matches those in rows
+        
+        key_column is a column name or a list of columns forming the key,
+        e.g. ['Class', 'Day', 'Period'] for a timetable slot. With
+        expected_version, raise WriteConflict instead if the table has
+        changed since the caller read it.
+        """
+        if name not in self.data_files:
+            raise KeyError(f"Unknown table: {name}")
+        rows = apply_schema(name, rows)
+        with self._lock:
+            self.snapshot()
+            self._check_version(name, expected_version)
+            # Published views share the untouched columns; edited ones are replaced, never written into
+            table = self._tables[name].copy(deep=False)
+            if isinstance(key_column, str):
+                positions = pd.Index(table[key_column]).get_indexer(rows[key_column])
+            else:
+                positions = pd.MultiIndex.from_frame(table[list(key_column)]).get_indexer(
+                    pd.MultiIndex.from_frame(rows[list(key_column)])
+                )
+            if (positions < 0).any():
+                raise KeyError(f"Unknown {key_column} in update")
+            old_rows = table.iloc[positions]
+            for column in rows.columns:
+                values = table[column].copy()
+                if isinstance(values.dtype, pd.CategoricalDtype):
+                    # Edits may introduce new values
+                    new = pd.Index(rows[column].dropna().unique()).difference(values.cat.categories)
+                    if len(new):
+                        values = values.cat.add_categories(new) if not values.cat.ordered else values.astype(object)
+                values.iloc[positions] = rows[column].to_numpy()
+                table[column] = values
+            widened = [column for column in rows.columns if table[column].dtype != self._tables[name][column].dtype]
+            if widened:
+                typed = apply_schema(name, table[widened])
+                for column in widened:
+                    table[column] = typed[column]
+            self._tables[name] = table
+            self._aggregates.update_rows(name, old_rows, table.iloc[positions])
+            self._derived = {}
+            if name == 'timetable' and self._conflicts is not None:
+                for position in positions:
+                    self._conflicts.update(position, table.iloc[position])
+            if self._relations is not None:
+                self._relations.update_rows(name, positions, table.iloc[positions])
+            if name in self._search_indexes:
+                name_column, id_column = SEARCH_COLUMNS[name]
+                for position in positions:
+                    self._search_indexes[name].update(
+                        position, table[name_column].iat[position], table[id_column].iat[position]
+                    )
+            self._track_promotions(name, table.iloc[positions])
+            if self.storage is not None:
+                self.storage.update(name, table, positions, key_column)
+            self._record_change(name, 'update', len(rows))
+    
+    def _track_promotions(self, name, rows, appended=False):
+        """Re-evaluate the promotion of only the students a write touched"""
+        if self._promotions is None:
+            return
+        if name == 'students':
+            if appended:
+                self._promotions.add_students(rows)
+            else:
+                self._promotions.update_students(rows)
+        elif name == 'results' and not self._promotions.update_results(rows):
+            self._promotions = None
+    
+    @property
+    def promotions(self):
+        """Promotion decisions for the current tables, kept current by every write"""
+        with self._lock:
+            if self._promotions is None:
+                tables = self.snapshot()
+                self._promotions = PromotionEngine(self.promotion_rules, tables['students'], tables['results'])
+            return self._promotions
+    
+    def set_promotion_override(self, student_id, status):
+        """Fix one student's promotion decision, or hand it back to the rules with None
+        
+        It changes what apply_promotions() writes, so it counts as a write
+        to students: their version moves on and other sessions are told.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            self.promotion_rules.set_override(student_id, status)
+            if self._promotions is not None:
+                self._promotions.refresh([student_id])
+            self._record_change('students', 'override', 1)
+    
+    def promotion_overrides(self):
+        """A copy of the manual promotion decisions, by StudentID"""
+        with self._lock:
+            return dict(self.promotion_rules.overrides)
+    
+    def apply_promotions(self, expected_version=None):
+        """Write every student's decided PromotionStatus and NextLevel; returns the rows changed"""
+        with self._lock:
+            engine = self.promotions
+            students = self.snapshot()['students']
+            changed = len(engine.diff(students))
+            self.update_table('students', engine.apply(students), expected_version)
+            # The decisions were not changed by writing them
+            self._promotions = engine
+            return changed
+    
+    def rollover(self, expected_version=None):
+        """Move every student into next school year by their decision
+        
+        Graduates move from the students table to the alumni table, where
+        their results still find them, and the rules start deciding the
+        following year with no overrides. Returns counts of students moved,
+        kept back and graduated.
+        """
+        with self._lock:
+            engine = self.promotions
+            students, graduates, counts = engine.rollover(self.snapshot()['students'])
+            self.update_table('students', students, expected_version)
+            if len(graduates):
+                self.append_rows('alumni', graduates)
+            self.promotion_rules.start_year(engine.year + 1)
+            return counts
+    
+    def search_index(self, name):
+        """Return the trigram index for a searchable table, building it on first use"""
+        with self._lock:
+            df = self.snapshot()[name]
+            if name not in self._search_indexes:
+                name_column, id_column = SEARCH_COLUMNS[name]
+                self._search_indexes[name] = SearchIndex(df[name_column], df[id_column])
+            return self._search_indexes[name]
+    
+    def _sort_order(self, name, column, ascending):
+        """Row positions of a table sorted by one column, cached until the next write"""
+        key = ('sort', name, column, ascending)
+        if key not in self._derived:
+            values = self.snapshot()[name][column].reset_index(drop=True)
+            self._derived[key] = values.sort_values(
+                ascending=ascending, kind='stable'
+            ).index.to_numpy()
+        return self._derived[key]
+    
+    def scope_masks(self, scope):
+        """Row masks of a login's scope, compiled once per data version"""
+        with self._lock:
+            key = ('scope_masks', scope.key)
+            if key not in self._derived:
+                self._derived[key] = scope.compile(self.snapshot())
+            return self._derived[key]
+    
+    def scoped_snapshot(self, scope):
+        """versioned_snapshot() cut down to the rows and columns a scope may see
+        
+        Full-access scopes get the shared view itself. Other scopes get their
+        tables filtered once per data version and reused by every rerun.
+        """
+        tables, versions = self.versioned_snapshot()
+        if scope is None or scope.unrestricted:
+            return tables, versions
+        key = ('scoped_view', scope.key)
+        view = self._derived.get(key)
+        if view is None or view[1] != versions:
+            with self._lock:
+                tables, versions = self.versioned_snapshot()
+                masks = self.scope_masks(scope)
+                view = (
+                    {name: scope.apply(name, df, masks.get(name)) for name, df in tables.items()},
+                    versions
+                )
+                self._derived[key] = view
+        return dict(view[0]), dict(view[1])
+    
+    def scoped_aggregates(self, scope):
+        """Dashboard KPIs over the rows a scope may see"""
+        if scope is None or scope.unrestricted:
+            return self.aggregates
+        with self._lock:
+            key = ('scoped_aggregates', scope.key)
+            if key not in self._derived:
+                self._derived[key] = SchoolAggregates(self.scoped_snapshot(scope)[0])
+            return self._derived[key]
+    
+    @property
+    def timetable_conflicts(self):
+        """Booking indexes of the timetable, kept current by every write"""
+        with self._lock:
+            if self._conflicts is None:
+                self._conflicts = TimetableConflicts(self.snapshot()['timetable'])
+            return self._conflicts
+    
+    @property
+    def relations(self):
+        """ID indexes and dangling foreign keys, kept current by every write"""
+        with self._lock:
+            if self._relations is None:
+                self._relations = Relationships(self.snapshot())
+            return self._relations
+    
+    def join(self, df, name, columns, on=None, how='left', scope=None):
+        """df with columns of an ID table added, matched on the table's ID
+        
+        Does what df.merge(table[[ID] + columns], on=ID, how=how) would, but
+        finds each row through the ID index and gathers by position instead
+        of hashing the table. With a scope, rows and columns it may not see
+        come back empty. IDs missing from the table are looked up in its
+        archive, so results of graduates still find their names. The result
+        has a fresh index, as after a merge.
+        """
+        on = on or ID_COLUMNS[name]
+        keys = df[on].to_numpy()
+        with self._lock:
+            tables = self.snapshot()
+            
+            def gather(name):
+                positions = self.relations.positions(name, keys)
+                if scope is not None and not scope.unrestricted:
+                    mask = self.scope_masks(scope).get(name)
+                    if mask is not None:
+                        positions[~mask.take(positions, mode='clip')] = -1
+                return tables[name], positions
+            
+            table, positions = gather(name)
+            archived = None
+            if name in ARCHIVE_TABLES and (positions < 0).any():
+                archive, archived = gather(ARCHIVE_TABLES[name])
+                archived[positions >= 0] = -1
+                if not (archived >= 0).any():
+                    archived = None
+            if scope is not None:
+                hidden = scope.hidden_columns(name)
+                columns = [column for column in columns if column not in hidden]
+        found = positions >= 0 if archived is None else (positions >= 0) | (archived >= 0)
+        if how == 'inner':
+            df, positions = df[found], positions[found]
+            archived = archived[found] if archived is not None else None
+        joined = df.reset_index(drop=True)
+        for column in columns:
+            values = pd.Series(table[column].array.take(positions, allow_fill=True))
+            if archived is not None:
+                retired = pd.Series(archive[column].array.take(archived, allow_fill=True))
+                if isinstance(values.dtype, pd.CategoricalDtype):
+                    # The two tables' categories differ
+                    values, retired = values.astype(object), retired.astype(object)
+                values = values.where(positions >= 0, retired)
+            joined[column] = values.array
+        return joined
+    
+    def timetable_grids(self, by='Class', scope=None):
+        """Weekly grids for every class or teacher, built once per data version"""
+        with self._lock:
+            if scope is None or scope.unrestricted:
+                key = ('timetable_grids', by)
+                tables = self.snapshot()
+            else:
+                key = ('timetable_grids', by, scope.key)
+                tables = self.scoped_snapshot(scope)[0]
+            if key not in self._derived:
+                self._derived[key] = build_timetable_grids(
+                    tables['timetable'], self.snapshot()['teachers'], by,
+                    self.relations.positions('teachers', tables['timetable']['TeacherID'].to_numpy())
+                )
+            return self._derived[key]
+    
+    def _match_positions(self, name, filters=None, search=None, sort_by=None, ascending=True,
+                         scope=None):
+        """Row positions matching a search and equality filters, in display order
+        
+        Search hits are ranked best match first unless sort_by is given.
+        Rows outside the scope are dropped with its precompiled mask.
+        """
+        with self._lock:
+            df = self.snapshot()[name]
+            scope_mask = self.scope_masks(scope).get(name) if scope is not None else None
+            if search:
+                id_column = SEARCH_COLUMNS[name][1]
+                positions = self.search_index(name).search(search, parse_id(id_column, search))
+                if sort_by:
+                    rank = np.empty(len(df), dtype=np.int64)
+                    rank[self._sort_order(name, sort_by, ascending)] = np.arange(len(df))
+                    positions = positions[np.argsort(rank[positions], kind='stable')]
+            elif sort_by:
+                positions = self._sort_order(name, sort_by, ascending)
+            else:
+                positions = np.arange(len(df))
+        if scope_mask is not None:
+            positions = positions[scope_mask[positions]]
+        if filters:
+            mask = np.ones(len(df), dtype=bool)
+            for column, value in filters.items():
+                mask &= (df[column] == value).to_numpy()
+            positions = positions[mask[positions]]
+        return df, positions
+    
+    def _row_scoped(self, name, scope):
+        """Whether a scope hides any rows of a table"""
+        return scope is not None and name in self.scope_masks(scope)
+    
+    def query(self, name, filters=None, search=None, limit=None, offset=0,
+              sort_by=None, ascending=True, scope=None):
+        """Return one page of rows matching equality filters and a search term
+        
+        Only the requested page is materialized; with the SQLite backend it is
+        also the only page fetched, unless a scope hides rows of the table.
+        Returns (page_df, total_matches).
+        """
+        hidden = scope.hidden_columns(name) if scope is not None else []
+        if isinstance(self.storage, SQLiteStore) and not self._row_scoped(name, scope):
+            with self._lock:
+                self.snapshot()
+                page, total = self.storage.query(
+                    name, filters, search, limit, offset, sort_by, ascending
+                )
+            return page.drop(columns=hidden), total
+        df, positions = self._match_positions(name, filters, search, sort_by, ascending, scope)
+        end = None if limit is None else offset + limit
+        return df.iloc[positions[offset:end]].drop(columns=hidden), len(positions)
+    
+    def summarize(self, name, group_column, mean_column, filters=None, search=None, scope=None):
+        """Return the match total, counts per group and mean of one column
+        
+        The mean is NaN when the scope hides the column.
+        """
+        mean_hidden = scope is not None and mean_column in scope.hidden_columns(name)
+        if isinstance(self.storage, SQLiteStore) and not self._row_scoped(name, scope):
+            with self._lock:
+                self.snapshot()
+                summary = self.storage.summarize(name, group_column, mean_column, filters, search)
+            return dict(summary, mean=float('nan')) if mean_hidden else summary
+        df, positions = self._match_positions(name, filters, search, scope=scope)
+        values = df[mean_column].to_numpy(dtype='float64')[positions]
+        return {
+            'total': len(positions),
+            'counts': df[group_column].iloc[positions].value_counts().to_dict(),
+            'mean': values.mean() if len(values) and not mean_hidden else float('nan')
         }
     
     def load_sample_data(self):
         """Load sample data for demonstration"""
         
+        # Larger schools are generated, for trying the app at district scale
+        if self.sample_scale != 1:
+            return generate_school(self.sample_scale, self.seed)
+        
+        # Seeded so every session and reload sees the same school
+        rng = np.random.RandomState(self.seed)
+        
         # Students data
         students = pd.DataFrame({
-            'StudentID': [f'STU{str(i).zfill(4)}' for i in range(1, 51)],
+            'StudentID': np.arange(1, 51),
             'FullName': [
                 'Sarah Ali', 'Liyana Lee', 'Ahmad Tan', 'Emily Ong', 'Daniel Chong',
                 'Nur Aisyah', 'Raj Kumar', 'Tan Wei Ming', 'Siti Nurhaliza', 'Jason Lim',
@@ -404,35 +3937,35 @@ class DataManager:
                 'Amelia Wong', 'Dinesh Kumar', 'Siti Aisyah', 'Isaac Tan', 'Nur Adriana',
                 'Muhammad Amin', 'Tan Shi Hui', 'Raj Gopal', 'Nur Fatihah', 'Wong Jun Kit'
             ][:50],
-            'IC_Number': [f'01-{np.random.randint(100000, 999999)}' for _ in range(50)],
-            'DOB': pd.date_range(start='2010-01-01', periods=50, freq='M').strftime('%d/%m/%Y'),
-            'Gender': np.random.choice(['Male', 'Female'], 50),
-            'CurrentLevel': np.random.choice(
-                ['Year 1', 'Year 2', 'Year 3', 'Year 4', 'Year 5', 'Year 6',
-                 'Year 7', 'Year 8', 'Year 9', 'Year 10', 'Year 11'], 50
-            ),
-            'Class': [f"{np.random.choice(['A', 'B'])}" for _ in range(50)],
-            'ParentID': [f'PAR{str(i).zfill(4)}' for i in range(1, 51)],
-            'AvgScore': np.random.randint(40, 100, 50),
-            'Attendance%': [f"{np.random.randint(75, 100)}%" for _ in range(50)],
-            'PromotionStatus': np.random.choice(['Promoted', 'Retained', 'Pending'], 50, p=[0.7, 0.1, 0.2]),
+            'IC_Number': [f'01-{rng.randint(100000, 999999)}' for _ in range(50)],
+            'DOB': pd.date_range(start='2010-01-01', periods=50, freq='M'),
+            'Gender': rng.choice(['Male', 'Female'], 50),
+            'CurrentLevel': rng.choice(LEVELS, 50),
+            'Class': [f"{rng.choice(['A', 'B'])}" for _ in range(50)],
+            'ParentID': np.arange(1, 51),
+            'AvgScore': rng.randint(40, 100, 50),
+            'Attendance%': rng.randint(75, 100, 50),
+            'PromotionStatus': rng.choice(['Promoted', 'Retained', 'Pending'], 50, p=[0.7, 0.1, 0.2]),
             'NextLevel': ''
         })
         
         # Parents data
         parents = pd.DataFrame({
-            'ParentID': [f'PAR{str(i).zfill(4)}' for i in range(1, 51)],
+            'ParentID': np.arange(1, 51),
             'ParentName': [f"Parent {i}" for i in range(1, 51)],
-            'IC': [f'01-{np.random.randint(100000, 999999)}' for _ in range(50)],
-            'Phone': [f'+6012-{np.random.randint(1000000, 9999999)}' for _ in range(50)],
+            'IC': [f'01-{rng.randint(100000, 999999)}' for _ in range(50)],
+            'Phone': [f'+6012-{rng.randint(1000000, 9999999)}' for _ in range(50)],
             'Email': [f'parent{i}@email.com' for i in range(1, 51)],
             'Address': ['Kuala Lumpur'] * 50,
-            'Occupation': np.random.choice(['Teacher', 'Engineer', 'Doctor', 'Business', 'Government'], 50)
+            'Occupation': rng.choice(['Teacher', 'Engineer', 'Doctor', 'Business', 'Government'], 50)
         })
         
-        # Teachers data
+        # Teachers data, with specialists in proportion to weekly periods
+        shares = np.array(list(SUBJECT_PERIODS.values())) * 35 / sum(SUBJECT_PERIODS.values())
+        specialist_counts = np.floor(shares).astype(int)
+        specialist_counts[np.argsort(specialist_counts - shares, kind='stable')[:35 - specialist_counts.sum()]] += 1
         teachers = pd.DataFrame({
-            'TeacherID': [f'TCH{str(i).zfill(3)}' for i in range(1, 36)],
+            'TeacherID': np.arange(1, 36),
             'Name': [
                 'Emily Ali', 'Bryan Chong', 'Nur Ng', 'Aisyah Lim', 'Chloe Lee',
                 'Nur Rahman', 'Bryan Ali', 'Nur Ismail', 'Hafiz Rahman', 'Emily Ong',
@@ -442,32 +3975,29 @@ class DataManager:
                 'Amir Ismail', 'Siti Lee', 'Chloe Ali', 'Hafiz Tan', 'Mei Ling Lim',
                 'Zul Lee', 'Jason Yusof', 'Hafiz Chong', 'Bryan Ali', 'Ahmad Rahman'
             ],
-            'SubjectSpecialty': np.random.choice(
-                ['Mathematics', 'English', 'Science', 'History', 'Geography', 
-                 'PE', 'ICT', 'Art', 'Malay', 'Business'], 35
-            ),
-            'EmploymentStatus': np.random.choice(['Permanent', 'Contract'], 35, p=[0.7, 0.3]),
-            'AssignedPeriods': np.random.randint(10, 31, 35),
+            'SubjectSpecialty': rng.permutation(np.repeat(list(SUBJECT_PERIODS), specialist_counts)),
+            'EmploymentStatus': rng.choice(['Permanent', 'Contract'], 35, p=[0.7, 0.3]),
+            'AssignedPeriods': rng.randint(22, 31, 35),
             'WorkloadStatus': ['Balanced'] * 35
         })
         
         # Staff data
         staff = pd.DataFrame({
-            'StaffID': [f'STF{str(i).zfill(3)}' for i in range(1, 19)],
+            'StaffID': np.arange(1, 19),
             'Name': [
                 'Aina Ali', 'Adam Rahman', 'Nur Chong', 'Ahmad Rahman', 'Daniel Lim',
                 'Daniel Lim', 'Bryan Ali', 'Adam Chong', 'Emily Ng', 'Hannah Chong',
                 'Siti Aminah', 'Jason Fernandez', 'Kavitha Raj', 'Tan Cheng Hoe', 'Norhayati',
                 'Ramu Gopal', 'Michelle Wong', 'Azman Hashim'
             ],
-            'Role': np.random.choice(['Admin', 'Security', 'Technician', 'Librarian', 'Cleaner'], 18),
-            'Phone': [f'+6012-{np.random.randint(1000000, 9999999)}' for _ in range(18)],
+            'Role': rng.choice(['Admin', 'Security', 'Technician', 'Librarian', 'Cleaner'], 18),
+            'Phone': [f'+6012-{rng.randint(1000000, 9999999)}' for _ in range(18)],
             'EmploymentStatus': ['Permanent'] * 18
         })
         
         # Academic results
         results = pd.DataFrame({
-            'StudentID': [f'STU{str(i).zfill(4)}' for i in range(1, 51)],
+            'StudentID': students['StudentID'].values,
             'Year': [2025] * 50,
             'Level': students['CurrentLevel'].values,
             'Class': students['Class'].values,
@@ -476,25 +4006,11 @@ class DataManager:
         })
         
         # Timetable
-        days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-        periods = range(1, 6)
         classes = ['1A', '1B', '2A', '2B', '3A', '3B', '4A', '4B', '5A', '5B',
                    '6A', '6B', '7A', '7B', '8A', '8B', '9A', '9B', '10A', '10B', '11A', '11B']
-        
-        timetable_rows = []
-        for class_name in classes[:10]:  # Limit for demo
-            for day in days:
-                for period in periods:
-                    timetable_rows.append({
-                        'Class': class_name,
-                        'Subject': np.random.choice(['Math', 'English', 'Science', 'History']),
-                        'TeacherID': np.random.choice(teachers['TeacherID'].values),
-                        'Day': day,
-                        'Period': period,
-                        'Room': f'R{np.random.randint(1, 21)}'
-                    })
-        
-        timetable = pd.DataFrame(timetable_rows)
+        timetable, _ = TimetableScheduler(
+            classes, teachers, class_sizes=class_enrolment(students)
+        ).solve(time_budget=10, seed=self.seed)
         
         return {
             'students': students,
@@ -505,15 +4021,601 @@ class DataManager:
             'timetable': timetable
         }
 
+@st.cache_resource
+def get_data_manager():
+    """Return the process-wide data manager shared by all sessions"""
+    storage = load_config().get('storage', {})
+    backend = storage.get('backend', 'memory')
+    storage_path = os.path.join(APP_DIR, storage.get('path', 'data'))
+    if backend == 'sqlite':
+        storage_path = os.path.join(storage_path, 'school.db')
+    promotion = load_config().get('promotion', {})
+    promotion_rules = PromotionRules(
+        min_score=promotion.get('min_score', 50),
+        min_attendance=promotion.get('min_attendance', 80),
+        levels=promotion.get('levels'),
+        state_path=os.path.join(APP_DIR, promotion.get('state_path', 'data/promotion.json'))
+    )
+    return DataManager(
+        backend=backend, storage_path=storage_path, sample_scale=storage.get('sample_scale', 1),
+        promotion_rules=promotion_rules
+    )
+
+@st.cache_resource
+def get_audit_log():
+    """Return the process-wide audit log"""
+    settings = load_config().get('audit', {})
+    return AuditLog(
+        os.path.join(APP_DIR, settings.get('path', 'data/audit')),
+        segment_bytes=settings.get('segment_bytes', 1 << 20)
+    )
+
+def audit(action, detail=''):
+    """Record an action by the signed-in user, by login rather than display name"""
+    get_audit_log().record(st.session_state.login_user, action, detail)
+
+@st.cache_resource
+def get_results_store():
+    """Return the process-wide term score store, seeded from the results table when empty"""
+    settings = load_config().get('results_history', {})
+    store = ResultsStore(os.path.join(APP_DIR, settings.get('path', 'data/results')))
+    if not store.partitions():
+        store.seed(
+            get_data_manager().snapshot()['results'],
+            years=settings.get('years', 3),
+            current_term=settings.get('current_term', len(TERMS))
+        )
+    return store
+
+@st.cache_resource
+def get_attendance_register():
+    """Return the process-wide attendance register, seeded from the results table when empty"""
+    settings = load_config().get('attendance', {})
+    register = AttendanceRegister(
+        os.path.join(APP_DIR, settings.get('path', 'data/attendance')),
+        periods=settings.get('periods', 5),
+        term_dates=[tuple(term) for term in settings.get('term_dates', DEFAULT_TERM_DATES)],
+        compact_bytes=settings.get('compact_bytes', 1 << 20)
+    )
+    if not register.years():
+        register.seed(get_data_manager().snapshot()['results'], until=date.today())
+    return register
+
+@st.cache_resource
+def get_grading_engine():
+    """Return the process-wide grading engine with the configured schemes"""
+    settings = load_config().get('grading', {})
+    return GradingEngine(
+        schemes=settings.get('schemes'),
+        pass_mark=settings.get('pass_mark', 50),
+        distinction=settings.get('distinction', 80)
+    )
+
+@st.cache_resource
+def get_profiler():
+    """Return the process-wide render profiler"""
+    settings = load_config().get('profiling', {})
+    profiler = RenderProfiler(
+        capacity=settings.get('buffer', 500),
+        trace_memory=settings.get('trace_memory', False)
+    )
+    profiler.enabled = settings.get('enabled', True)
+    return profiler
+
+def profile(name):
+    """Context manager timing one step of a render"""
+    return get_profiler().span(name)
+
+def profiled(func):
+    """Record every call of a render function in the profiler"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with profile(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+# =============================================================================
+# BULK IMPORT
+# =============================================================================
+
+# Columns an import file must provide, and defaults for the ones it may omit.
+# A missing or blank ID is allocated on import.
+IMPORT_SPECS = {
+    'students': {
+        'required': ['FullName', 'IC_Number', 'DOB', 'Gender', 'CurrentLevel', 'Class', 'ParentID'],
+        'defaults': {
+            'StudentID': '', 'AvgScore': 0, 'Attendance%': 0,
+            'PromotionStatus': 'Pending', 'NextLevel': ''
+        }
+    },
+    'parents': {
+        'required': ['ParentName', 'Phone'],
+        'defaults': {'ParentID': '', 'IC': '', 'Email': '', 'Address': '', 'Occupation': ''}
+    },
+    'results': {
+        'required': ['StudentID', 'Year', 'Level', 'Class', 'AverageScore', 'Attendance%'],
+        'defaults': {}
+    }
+}
+
+# Rows read, validated and committed per batch
+IMPORT_CHUNK_ROWS = 5000
+
+def read_import_chunks(file, filename, chunk_rows=IMPORT_CHUNK_ROWS):
+    """Yield DataFrames of raw cell values from a CSV or XLSX upload
+    
+    CSV cells arrive as strings. XLSX cells keep their numbers and
+    dates, with whole floats turned back into ints.
+    """
+    if filename.lower().endswith('.csv'):
+        yield from pd.read_csv(
+            file, dtype=str, keep_default_na=False, chunksize=chunk_rows, skipinitialspace=True
+        )
+        return
+    
+    # Read-only workbooks stream rows instead of loading every cell
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else '' for cell in next(rows, ())]
+        batch = []
+        for row in rows:
+            if all(cell is None for cell in row):
+                continue
+            batch.append([
+                '' if cell is None else int(cell) if isinstance(cell, float) and cell.is_integer() else cell
+                for cell in row[:len(header)]
+            ])
+            if len(batch) == chunk_rows:
+                yield pd.DataFrame(batch, columns=header, dtype=object)
+                batch = []
+        if batch or not header:
+            yield pd.DataFrame(batch, columns=header, dtype=object)
+    finally:
+        workbook.close()
+
+class ImportValidator:
+    """Check import batches against a table's schema and existing rows
+    
+    Each batch is validated with whole-column operations. Rows with any
+    error are rejected and reported by file line number; the rest are
+    returned for DataManager.append_rows(), which allocates blank IDs.
+    """
+    
+    def __init__(self, name, tables):
+        if name not in IMPORT_SPECS:
+            raise KeyError(f"Table {name} cannot be imported")
+        self.name = name
+        self.spec = IMPORT_SPECS[name]
+        self.id_column = {'students': 'StudentID', 'parents': 'ParentID'}.get(name)
+        self.columns = tables[name].columns.tolist()
+        self.seen_ids = set(tables[name][self.id_column]) if self.id_column else set()
+        if name in ARCHIVE_TABLES:
+            # Archived IDs are never handed out again
+            self.seen_ids.update(tables[ARCHIVE_TABLES[name]][self.id_column])
+        self.parent_ids = set(tables['parents']['ParentID'])
+        self.student_ids = set(tables['students']['StudentID'])
+        self.ic_numbers = set(tables['students']['IC_Number']) if name == 'students' else set()
+        self.result_keys = (
+            set(zip(tables['results']['StudentID'], tables['results']['Year']))
+            if name == 'results' else set()
+        )
+    
+    def check_columns(self, chunk):
+        """Raise ValueError if the file lacks required columns"""
+        missing = [column for column in self.spec['required'] if column not in chunk.columns]
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+    
+    def validate(self, chunk, first_line):
+        """Return (valid rows, errors DataFrame) for one batch"""
+        self.check_columns(chunk)
+        chunk = chunk.reset_index(drop=True)
+        for column, default in self.spec['defaults'].items():
+            if column not in chunk.columns:
+                chunk[column] = default
+        chunk = chunk[[column for column in self.columns if column in chunk.columns]]
+        
+        text = {column: chunk[column].astype(str).str.strip() for column in chunk.columns}
+        errors = []
+        
+        def flag(mask, column, message):
+            mask = np.asarray(mask, dtype=bool)
+            if mask.any():
+                errors.append(pd.DataFrame({
+                    'Row': np.flatnonzero(mask) + first_line,
+                    'Column': column,
+                    'Value': text[column][mask].values,
+                    'Error': message
+                }))
+        
+        for column in self.spec['required']:
+            flag(text[column] == '', column, 'Required')
+        
+        # IDs: "STU0012", "12" or blank (allocated below) for the table's own key
+        ids = {}
+        for column in [column for column in chunk.columns if column in ID_FORMATS]:
+            prefix, _ = ID_FORMATS[column]
+            digits = text[column].str.extract(rf'^(?:{prefix})?\s*(\d+)$', flags=re.IGNORECASE)[0]
+            ids[column] = pd.to_numeric(digits, errors='coerce')
+            flag((text[column] != '') & ids[column].isna(), column, f'Expected an ID like {prefix}0001')
+        
+        if self.id_column:
+            own = ids[self.id_column]
+            flag(own.isin(self.seen_ids), self.id_column, 'ID already exists')
+            flag(own.notna() & own.duplicated(keep=False), self.id_column, 'ID repeated in file')
+        if 'ParentID' in ids and self.name == 'students':
+            flag(ids['ParentID'].notna() & ~ids['ParentID'].isin(self.parent_ids), 'ParentID', 'Unknown parent')
+        if self.name == 'results':
+            flag(ids['StudentID'].notna() & ~ids['StudentID'].isin(self.student_ids), 'StudentID', 'Unknown student')
+        
+        if 'DOB' in chunk.columns:
+            dob = parse_dates(chunk['DOB'].where(text['DOB'] != ''), errors='coerce')
+            flag((text['DOB'] != '') & dob.isna(), 'DOB', 'Not a date')
+            flag(dob > pd.Timestamp.now(), 'DOB', 'Date of birth is in the future')
+            chunk['DOB'] = dob
+        if 'Gender' in chunk.columns:
+            chunk['Gender'] = text['Gender'].str.title()
+            flag((text['Gender'] != '') & ~chunk['Gender'].isin(['Male', 'Female']), 'Gender', 'Expected Male or Female')
+        for column in ('CurrentLevel', 'Level'):
+            if column in chunk.columns:
+                flag((text[column] != '') & ~text[column].isin(LEVELS), column, 'Unknown level')
+                chunk[column] = text[column]
+        if 'Class' in chunk.columns:
+            chunk['Class'] = text['Class'].str.upper()
+        if 'IC_Number' in chunk.columns:
+            flag(text['IC_Number'].isin(self.ic_numbers), 'IC_Number', 'IC number already registered')
+            flag(
+                (text['IC_Number'] != '') & text['IC_Number'].duplicated(keep=False),
+                'IC_Number', 'IC number repeated in file'
+            )
+        
+        for column in ('AvgScore', 'AverageScore', 'Attendance%'):
+            if column in chunk.columns:
+                values = pd.to_numeric(text[column].str.rstrip('%'), errors='coerce')
+                flag((text[column] != '') & values.isna(), column, 'Not a number')
+                flag((values < 0) | (values > 100), column, 'Must be between 0 and 100')
+                chunk[column] = values.fillna(0)
+        if 'Year' in chunk.columns:
+            years = pd.to_numeric(text['Year'], errors='coerce')
+            flag((text['Year'] != '') & ~years.between(2000, 2100), 'Year', 'Expected a year like 2025')
+            chunk['Year'] = years
+            if 'StudentID' in ids:
+                keys = pd.Series(list(zip(ids['StudentID'], years)))
+                flag(keys.isin(self.result_keys), 'Year', 'Result already recorded for this student and year')
+                flag(keys.duplicated(keep=False), 'Year', 'Result repeated in file')
+        
+        errors = (
+            pd.concat(errors, ignore_index=True).sort_values('Row', kind='stable')
+            if errors else pd.DataFrame(columns=['Row', 'Column', 'Value', 'Error'])
+        )
+        valid = ~pd.Series(np.arange(len(chunk)) + first_line).isin(errors['Row']).values
+        rows = chunk[valid].copy()
+        
+        for column, values in ids.items():
+            rows[column] = values[valid]
+        if self.id_column:
+            self.seen_ids.update(rows[self.id_column].dropna().astype('int64'))
+        if self.name == 'students':
+            self.ic_numbers.update(rows['IC_Number'])
+        if self.name == 'results':
+            self.result_keys.update(zip(rows['StudentID'], rows['Year']))
+        
+        for column in rows.columns:
+            if rows[column].dtype == object and column not in TABLE_SCHEMAS[self.name]:
+                rows[column] = rows[column].astype(str).str.strip()
+        return rows, errors
+
+def bulk_import(data_manager, name, file, filename, chunk_rows=IMPORT_CHUNK_ROWS):
+    """Validate and append an import file batch by batch
+    
+    Returns a summary dict with the rows read and imported, the seconds
+    taken and a DataFrame of row-level errors. Invalid rows are skipped;
+    each batch of valid rows is committed as soon as it is checked.
+    """
+    started = time.perf_counter()
+    validator = ImportValidator(name, data_manager.snapshot())
+    read = imported = 0
+    errors = []
+    
+    # Line 1 is the header, so the first data row is line 2
+    for chunk in read_import_chunks(file, filename, chunk_rows):
+        rows, chunk_errors = validator.validate(chunk, first_line=read + 2)
+        if not rows.empty:
+            data_manager.append_rows(name, rows)
+        read += len(chunk)
+        imported += len(rows)
+        errors.append(chunk_errors)
+    
+    return {
+        'read': read,
+        'imported': imported,
+        'errors': pd.concat(errors, ignore_index=True),
+        'seconds': time.perf_counter() - started
+    }
+
+# =============================================================================
+# REPORT EXPORT
+# =============================================================================
+
+# Download formats: file extension and MIME type
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'Excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet')
+}
+
+# Rows formatted and written per step, so only one chunk is ever copied
+EXPORT_CHUNK_ROWS = 5000
+
+def iter_export_chunks(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield display-formatted slices of df, at least one even when empty"""
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield format_ids(df.iloc[start:start + chunk_rows])
+
+def export_table(df, fmt, sheet_name='Report', chunk_rows=EXPORT_CHUNK_ROWS):
+    """Write df to a binary buffer as CSV, Excel or Parquet, chunk by chunk"""
+    buffer = io.BytesIO()
+    chunks = iter_export_chunks(df, chunk_rows)
+    
+    if fmt == 'CSV':
+        text = io.TextIOWrapper(buffer, encoding='utf-8', newline='')
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(text, header=i == 0, index=False)
+        text.flush()
+        text.detach()
+    elif fmt == 'Excel':
+        # Write-only workbooks stream rows to the file instead of keeping cells
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet(sheet_name[:31])
+        sheet.append([str(column) for column in df.columns])
+        for chunk in chunks:
+            for row in chunk.itertuples(index=False, name=None):
+                sheet.append([None if pd.isna(value) else value for value in row])
+        workbook.save(buffer)
+    elif fmt == 'Parquet':
+        writer = None
+        for chunk in chunks:
+            if writer is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                writer = pq.ParquetWriter(buffer, table.schema)
+            else:
+                table = pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False)
+            writer.write_table(table)
+        writer.close()
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+    
+    buffer.seek(0)
+    return buffer
+
+# =============================================================================
+# FIGURE CACHE
+# =============================================================================
+
+class FigureCache:
+    """Least-recently-used store of finished Plotly figures
+    
+    A figure is keyed by its chart, the versions of the tables it was drawn
+    from, the viewer's data scope and the page's filter values, so it is
+    reused only while all of them are unchanged. Figures are shared by every
+    session and must not be modified once stored.
+    """
+    
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._figures)
+    
+    def get(self, key, build):
+        """Return the figure stored under key, calling build() to make it if absent"""
+        with self._lock:
+            fig = self._figures.get(key)
+            if fig is not None:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                return fig
+            self.misses += 1
+        
+        # Built outside the lock; two sessions missing together both build
+        with profile('plotly figure'):
+            fig = build()
+        with self._lock:
+            self._figures[key] = fig
+            while len(self._figures) > self.capacity:
+                self._figures.popitem(last=False)
+        return fig
+    
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+
+@st.cache_resource
+def get_figure_cache():
+    """Return the process-wide figure cache"""
+    return FigureCache(load_config().get('figures', {}).get('cache_size', 256))
+
+def cached_figure(chart_id, tables, build, filters=()):
+    """A chart's figure, rebuilt only when its tables, the viewer's scope or filters change"""
+    versions = st.session_state.get('seen_versions') or {}
+    scope = st.session_state.get('data_scope')
+    key = (
+        chart_id,
+        tuple(versions.get(name) for name in tables),
+        scope.key if scope is not None else None,
+        tuple(filters)
+    )
+    return get_figure_cache().get(key, build)
+
+# =============================================================================
+# UI HELPERS
+# =============================================================================
+
+def show_dataframe(data, **kwargs):
+    """st.dataframe, profiled; the table is serialized to Arrow inside the call"""
+    with profile('st.dataframe'):
+        return st.dataframe(data, **kwargs)
+
+def show_chart(fig, **kwargs):
+    """st.plotly_chart, profiled; the figure is serialized to JSON inside the call"""
+    with profile('st.plotly_chart'):
+        return st.plotly_chart(fig, **kwargs)
+
+def results_for_years(data, start_year, end_year):
+    """Results rows, one per student per year, for a year range
+    
+    The current year comes from the live results table. Earlier years are
+    summarised from the term store, reading only the students in view.
+    """
+    current_year = int(data['results']['Year'].max()) if len(data['results']) else date.today().year
+    frames = []
+    if start_year < current_year:
+        scope = st.session_state.data_scope
+        student_ids = None
+        if scope is not None and not scope.unrestricted:
+            student_ids = data['students']['StudentID'].to_numpy()
+        frames.append(get_results_store().yearly_results(
+            start_year, min(end_year, current_year - 1), student_ids
+        ))
+    if end_year >= current_year:
+        frames.append(data['results'])
+    return apply_schema('results', pd.concat(frames, ignore_index=True))
+
+def grade_results(results):
+    """results with grades, ranks and percentiles added from each year's grade book
+    
+    The current year is graded from the live results table, earlier years
+    from the term store.
+    """
+    engine = get_grading_engine()
+    store = get_results_store()
+    tables, versions = get_data_manager().versioned_snapshot()
+    live = tables['results']
+    current_year = int(live['Year'].max()) if len(live) else None
+    books = []
+    for year in sorted(results['Year'].unique().tolist()):
+        if year == current_year:
+            books.append(engine.book(
+                year, ('live', versions['results']), lambda: live[live['Year'] == current_year]
+            ))
+        else:
+            books.append(engine.book(
+                year, ('history', store.version), lambda year=year: store.yearly_results(year, year)
+            ))
+    if not books:
+        return results.reindex(columns=list(results.columns) + engine.columns)
+    grades = pd.concat([book.table for book in books], ignore_index=True)
+    with profile('merge'):
+        return results.merge(grades, on=['StudentID', 'Year'], how='left')
+
+def result_years(data):
+    """Years with results, newest first"""
+    years = set(get_results_store().years()) | set(data['results']['Year'].unique().tolist())
+    return sorted((int(year) for year in years), reverse=True)
+
+def paginate(total, page_size, key):
+    """Render a page picker and return the row offset of the chosen page"""
+    pages = max(1, -(-total // page_size))
+    if pages == 1:
+        return 0
+    # Keyed on the page count so a narrower filter starts back at page 1
+    page = st.number_input(
+        f"Page (1-{pages})", min_value=1, max_value=pages, value=1, step=1,
+        key=f"{key}_{pages}"
+    )
+    offset = (int(page) - 1) * page_size
+    st.caption(f"Showing {offset + 1}-{min(offset + page_size, total)} of {total}")
+    return offset
+
+# Dashboard wording for audit log actions
+ACTIVITY_LABELS = {
+    'login': 'Signed in',
+    'login_failed': 'Failed sign-in',
+    'logout': 'Signed out',
+    'student_added': 'New student enrolled',
+    'bulk_import': 'Bulk import',
+    'report_exported': 'Report exported',
+    'timetable_edited': 'Timetable modified',
+    'timetable_generated': 'Timetable generated',
+    'attendance_taken': 'Attendance taken',
+    'promotion_override': 'Promotion status overridden',
+    'promotions_applied': 'Promotions applied',
+    'year_rollover': 'New school year started',
+    'session_restored': 'Signed in from a saved session'
+}
+
+def time_ago(moment):
+    """Describe a past datetime as e.g. '15 minutes ago'"""
+    seconds = max(0, (datetime.now() - moment).total_seconds())
+    for unit, size in (('day', 86400), ('hour', 3600), ('minute', 60)):
+        if seconds >= size:
+            count = int(seconds // size)
+            return f"{count} {unit}{'s' if count != 1 else ''} ago"
+    return "just now"
+
+@profiled
+def render_export(report_name, df, params=()):
+    """Offer df for download; the file is built only when asked for
+    
+    The prepared file is kept in the session for the current report,
+    filters (params) and data version, so reruns reuse it. Excel files
+    are written cell by cell, so reports past export.excel_max_rows are
+    offered as CSV or Parquet only.
+    """
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        fmt = st.selectbox("Export format", list(EXPORT_FORMATS), key='export_format')
+    
+    excel_max_rows = load_config().get('export', {}).get('excel_max_rows', 10000)
+    if fmt == 'Excel' and len(df) > excel_max_rows:
+        with col2:
+            st.warning(
+                f"This report has {len(df):,} rows; Excel export is limited to {excel_max_rows:,}. "
+                "Choose CSV or Parquet, or narrow the filters."
+            )
+        return
+    
+    key = (report_name, params, fmt, get_data_manager().version, get_results_store().version)
+    prepared = st.session_state.get('report_export')
+    if prepared is not None and prepared[0] != key:
+        prepared = None
+    
+    with col2:
+        st.markdown("<br>", unsafe_allow_html=True)
+        if prepared is None and st.button("📥 Prepare Download", use_container_width=True):
+            prepared = (key, export_table(df, fmt, sheet_name=report_name).getvalue())
+            st.session_state.report_export = prepared
+            audit('report_exported', f"{report_name} ({fmt}, {len(df)} rows)")
+        if prepared is not None:
+            extension, mime = EXPORT_FORMATS[fmt]
+            file_stem = re.sub(r'\W+', '_', report_name.lower()).strip('_')
+            st.download_button(
+                f"⬇️ Download {fmt}",
+                prepared[1],
+                file_name=f"{file_stem}.{extension}",
+                mime=mime,
+                use_container_width=True
+            )
+
 # =============================================================================
 # DASHBOARD COMPONENTS
 # =============================================================================
 
+@profiled
 def render_dashboard(data):
     """Render main dashboard"""
     
     st.markdown('<div class="main-header">📊 Dashboard</div>', unsafe_allow_html=True)
     
+    # KPIs are read from the materialized aggregates, not the raw tables
+    scope = st.session_state.data_scope
+    aggregates = get_data_manager().scoped_aggregates(scope)
+    
     # Key metrics row
     col1, col2, col3, col4, col5 = st.columns(5)
     
@@ -521,7 +4623,7 @@ def render_dashboard(data):
         st.markdown(f"""
         <div class="stat-card">
             <div class="stat-icon">👥</div>
-            <div class="stat-value">{len(data['students'])}</div>
+            <div class="stat-value">{aggregates.totals['students']}</div>
             <div class="stat-label">Total Students</div>
         </div>
         """, unsafe_allow_html=True)
@@ -530,7 +4632,7 @@ def render_dashboard(data):
         st.markdown(f"""
         <div class="stat-card">
             <div class="stat-icon">👨‍🏫</div>
-            <div class="stat-value">{len(data['teachers'])}</div>
+            <div class="stat-value">{aggregates.totals['teachers']}</div>
             <div class="stat-label">Teachers</div>
         </div>
         """, unsafe_allow_html=True)
@@ -539,30 +4641,49 @@ def render_dashboard(data):
         st.markdown(f"""
         <div class="stat-card">
             <div class="stat-icon">👥</div>
-            <div class="stat-value">{len(data['staff'])}</div>
+            <div class="stat-value">{aggregates.totals['staff']}</div>
             <div class="stat-label">Staff</div>
         </div>
         """, unsafe_allow_html=True)
     
-    with col4:
-        promoted = len(data['students'][data['students']['PromotionStatus'] == 'Promoted'])
-        st.markdown(f"""
-        <div class="stat-card">
-            <div class="stat-icon">📈</div>
-            <div class="stat-value">{promoted}</div>
-            <div class="stat-label">Promoted</div>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col5:
-        avg_attendance = data['results']['Attendance%'].str.rstrip('%').astype(float).mean()
-        st.markdown(f"""
-        <div class="stat-card">
-            <div class="stat-icon">📊</div>
-            <div class="stat-value">{avg_attendance:.1f}%</div>
-            <div class="stat-label">Avg Attendance</div>
-        </div>
-        """, unsafe_allow_html=True)
+    if scope.academic:
+        with col4:
+            promoted = aggregates.count('PromotionStatus', 'Promoted')
+            st.markdown(f"""
+            <div class="stat-card">
+                <div class="stat-icon">📈</div>
+                <div class="stat-value">{promoted}</div>
+                <div class="stat-label">Promoted</div>
+            </div>
+            """, unsafe_allow_html=True)
+        
+        with col5:
+            avg_attendance = aggregates.mean('results', 'Attendance%')
+            st.markdown(f"""
+            <div class="stat-card">
+                <div class="stat-icon">📊</div>
+                <div class="stat-value">{avg_attendance:.1f}%</div>
+                <div class="stat-label">Avg Attendance</div>
+            </div>
+            """, unsafe_allow_html=True)
+    else:
+        with col4:
+            st.markdown(f"""
+            <div class="stat-card">
+                <div class="stat-icon">👪</div>
+                <div class="stat-value">{aggregates.totals['parents']}</div>
+                <div class="stat-label">Parents</div>
+            </div>
+            """, unsafe_allow_html=True)
+        
+        with col5:
+            st.markdown(f"""
+            <div class="stat-card">
+                <div class="stat-icon">📅</div>
+                <div class="stat-value">{aggregates.totals['timetable']}</div>
+                <div class="stat-label">Lessons per Week</div>
+            </div>
+            """, unsafe_allow_html=True)
     
     st.markdown('<div class="sub-header">Quick Actions</div>', unsafe_allow_html=True)
     
@@ -584,7 +4705,7 @@ def render_dashboard(data):
             st.rerun()
     
     with col4:
-        if st.button("📝 Enter Results", use_container_width=True):
+        if scope.academic and st.button("📝 Enter Results", use_container_width=True):
             st.session_state.current_page = "Results"
             st.rerun()
     
@@ -593,58 +4714,74 @@ def render_dashboard(data):
     
     with col1:
         st.markdown('<div class="sub-header">Students by Level</div>', unsafe_allow_html=True)
-        level_counts = data['students']['CurrentLevel'].value_counts().sort_index()
-        fig = px.bar(
-            x=level_counts.index,
-            y=level_counts.values,
-            title=None,
-            labels={'x': 'Year Level', 'y': 'Number of Students'},
-            color_discrete_sequence=['#3b82f6']
-        )
-        fig.update_layout(
-            plot_bgcolor='white',
-            paper_bgcolor='white',
-            font_family='Inter',
-            height=400,
-            margin=dict(l=40, r=40, t=40, b=40)
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        level_counts = aggregates.value_counts('CurrentLevel', order=LEVELS)
+        def build_figure():
+            fig = px.bar(
+                x=level_counts.index,
+                y=level_counts.values,
+                title=None,
+                labels={'x': 'Year Level', 'y': 'Number of Students'},
+                color_discrete_sequence=['#3b82f6']
+            )
+            fig.update_layout(
+                plot_bgcolor='white',
+                paper_bgcolor='white',
+                font_family='Inter',
+                height=400,
+                margin=dict(l=40, r=40, t=40, b=40)
+            )
+            return fig
+        
+        fig = cached_figure('dashboard_levels', ['students'], build_figure)
+        show_chart(fig, use_container_width=True)
     
     with col2:
-        st.markdown('<div class="sub-header">Promotion Status</div>', unsafe_allow_html=True)
-        status_counts = data['students']['PromotionStatus'].value_counts()
-        fig = go.Figure(data=[go.Pie(
-            labels=status_counts.index,
-            values=status_counts.values,
-            hole=0.4,
-            marker_colors=['#22c55e', '#ef4444', '#f59e0b']
-        )])
-        fig.update_layout(
-            showlegend=True,
-            plot_bgcolor='white',
-            paper_bgcolor='white',
-            font_family='Inter',
-            height=400,
-            margin=dict(l=40, r=40, t=40, b=40)
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        if scope.academic:
+            st.markdown('<div class="sub-header">Promotion Status</div>', unsafe_allow_html=True)
+            status_counts = aggregates.value_counts('PromotionStatus', order=['Promoted', 'Retained', 'Pending'])
+            colors = ['#22c55e', '#ef4444', '#f59e0b']
+        else:
+            st.markdown('<div class="sub-header">Students by Gender</div>', unsafe_allow_html=True)
+            status_counts = aggregates.value_counts('Gender', order=['Male', 'Female'])
+            colors = ['#3b82f6', '#ec4899']
+        def build_figure():
+            fig = go.Figure(data=[go.Pie(
+                labels=status_counts.index,
+                values=status_counts.values,
+                hole=0.4,
+                marker_colors=colors
+            )])
+            fig.update_layout(
+                showlegend=True,
+                plot_bgcolor='white',
+                paper_bgcolor='white',
+                font_family='Inter',
+                height=400,
+                margin=dict(l=40, r=40, t=40, b=40)
+            )
+            return fig
+        
+        fig = cached_figure('dashboard_status', ['students'], build_figure)
+        show_chart(fig, use_container_width=True)
     
     # Recent activity
     st.markdown('<div class="sub-header">Recent Activity</div>', unsafe_allow_html=True)
     
-    activities = [
-        {"time": "2 minutes ago", "action": "New student enrolled", "user": "Admin"},
-        {"time": "15 minutes ago", "action": "Grades updated for Year 6", "user": "Mr. Chen"},
-        {"time": "1 hour ago", "action": "Timetable modified", "user": "Principal"},
-        {"time": "3 hours ago", "action": "Attendance report generated", "user": "Ms. Lim"},
-        {"time": "5 hours ago", "action": "Parent meeting scheduled", "user": "Admin"}
-    ]
+    activities = get_audit_log().tail(5)
+    if not activities:
+        st.info("No activity recorded yet")
     
+    auth = get_authentication()
     for activity in activities:
+        label = ACTIVITY_LABELS.get(activity['action'], activity['action'].replace('_', ' ').capitalize())
+        detail = f": {html.escape(str(activity['detail']))}" if activity['detail'] else ''
+        # Entries name the login; older ones and removed users show as recorded
+        user = auth.get_user_info(activity['user'])
+        who = user['name'] if user else activity['user'] or 'unknown user'
         st.markdown(f"""
         <div class="data-card">
-            <div class="data-card-title">{activity['action']}</div>
-            <div class="data-card-subtitle">{activity['time']} by {activity['user']}</div>
+            <div class="data-card-title">{label}{detail}</div>
+            <div class="data-card-subtitle">{time_ago(datetime.fromisoformat(activity['time']))} by {html.escape(str(who))}</div>
         </div>
         """, unsafe_allow_html=True)
 
@@ -652,6 +4789,7 @@ def render_dashboard(data):
 # STUDENTS PAGE
 # =============================================================================
 
+@profiled
 def render_students(data):
     """Render students management page"""
     
@@ -671,39 +4809,38 @@ def render_students(data):
         classes = ['All'] + sorted(data['students']['Class'].unique().tolist())
         class_filter = st.selectbox("Class", classes)
     
+    scope = st.session_state.data_scope
     with col4:
-        statuses = ['All'] + sorted(data['students']['PromotionStatus'].unique().tolist())
-        status_filter = st.selectbox("Status", statuses)
-    
-    # Apply filters
-    filtered_df = data['students'].copy()
-    
-    if search:
-        filtered_df = filtered_df[
-            filtered_df['FullName'].str.contains(search, case=False, na=False) |
-            filtered_df['StudentID'].str.contains(search, case=False, na=False)
+        if scope.academic:
+            statuses = ['All'] + sorted(data['students']['PromotionStatus'].unique().tolist())
+            status_filter = st.selectbox("Status", statuses)
+        else:
+            status_filter = 'All'
+    
+    # Filters are pushed down to the data manager, which applies the scope's row mask
+    data_manager = get_data_manager()
+    filters = {
+        column: value
+        for column, value in [
+            ('CurrentLevel', level_filter),
+            ('Class', class_filter),
+            ('PromotionStatus', status_filter)
         ]
-    
-    if level_filter != 'All':
-        filtered_df = filtered_df[filtered_df['CurrentLevel'] == level_filter]
-    
-    if class_filter != 'All':
-        filtered_df = filtered_df[filtered_df['Class'] == class_filter]
-    
-    if status_filter != 'All':
-        filtered_df = filtered_df[filtered_df['PromotionStatus'] == status_filter]
+        if value != 'All'
+    }
     
     # Stats
+    summary = data_manager.summarize('students', 'Gender', 'AvgScore', filters, search, scope)
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("Total Students", len(filtered_df))
+        st.metric("Total Students", summary['total'])
     with col2:
-        st.metric("Male", len(filtered_df[filtered_df['Gender'] == 'Male']))
+        st.metric("Male", summary['counts'].get('Male', 0))
     with col3:
-        st.metric("Female", len(filtered_df[filtered_df['Gender'] == 'Female']))
+        st.metric("Female", summary['counts'].get('Female', 0))
     with col4:
-        avg_score = filtered_df['AvgScore'].mean()
-        st.metric("Avg Score", f"{avg_score:.1f}%")
+        if scope.academic:
+            st.metric("Avg Score", f"{summary['mean']:.1f}%")
     
     # Add student button
     if st.button("➕ Add New Student", use_container_width=True):
@@ -723,9 +4860,7 @@ def render_students(data):
                 new_gender = st.selectbox("Gender *", ["Male", "Female"])
             
             with col2:
-                new_level = st.selectbox("Current Level *", 
-                    ["Year 1", "Year 2", "Year 3", "Year 4", "Year 5", "Year 6",
-                     "Year 7", "Year 8", "Year 9", "Year 10", "Year 11"])
+                new_level = st.selectbox("Current Level *", LEVELS)
                 new_class = st.text_input("Class *", placeholder="e.g., 5A")
                 new_parent = st.text_input("Parent ID *")
                 new_medical = st.text_area("Medical Notes (Optional)")
@@ -738,52 +4873,134 @@ def render_students(data):
                     st.session_state.show_add_form = False
                     st.rerun()
             
-            if submitted and new_name and new_ic and new_parent:
-                new_id = f"STU{str(len(data['students']) + 1).zfill(4)}"
-                
+            parent_id = parse_id('ParentID', new_parent) if new_parent else None
+            parent_known = parent_id is not None and get_data_manager().relations.exists('parents', [parent_id])[0]
+            if submitted and new_parent and parent_id is None:
+                st.error("Parent ID should look like PAR0001")
+            elif submitted and parent_id is not None and not parent_known:
+                st.error(f"No parent has ID {format_id('ParentID', parent_id)}")
+            elif submitted and new_name and new_ic and parent_id is not None:
                 new_row = pd.DataFrame({
-                    'StudentID': [new_id],
                     'FullName': [new_name],
                     'IC_Number': [new_ic],
-                    'DOB': [new_dob.strftime('%d/%m/%Y')],
+                    'DOB': [pd.Timestamp(new_dob)],
                     'Gender': [new_gender],
                     'CurrentLevel': [new_level],
                     'Class': [new_class],
-                    'ParentID': [new_parent],
+                    'ParentID': [parent_id],
                     'AvgScore': [0],
-                    'Attendance%': ['0%'],
+                    'Attendance%': [0],
                     'PromotionStatus': ['Pending'],
                     'NextLevel': ['']
                 })
                 
-                data['students'] = pd.concat([data['students'], new_row], ignore_index=True)
-                st.success(f"✅ Student {new_name} added successfully!")
+                new_id = get_data_manager().append_rows('students', new_row)[0]
+                audit('student_added', f"{format_id('StudentID', new_id)} {new_name}")
+                st.success(f"✅ Student {new_name} added as {format_id('StudentID', new_id)}")
                 st.session_state.show_add_form = False
                 st.rerun()
     
+    # Bulk import of whole rosters and result sheets
+    if st.session_state.user_role == 'admin':
+        with st.expander("📤 Bulk Import"):
+            import_table = st.selectbox(
+                "Import into", list(IMPORT_SPECS), format_func=str.title, key='import_table'
+            )
+            spec = IMPORT_SPECS[import_table]
+            st.caption(
+                f"Required columns: {', '.join(spec['required'])}. "
+                f"Optional: {', '.join(spec['defaults']) or 'none'}"
+            )
+            upload = st.file_uploader("CSV or Excel file", type=['csv', 'xlsx'], key='import_file')
+            
+            if upload is not None and st.button("Import", use_container_width=True):
+                try:
+                    with st.spinner(f"Importing {upload.name}..."):
+                        st.session_state.import_summary = bulk_import(
+                            get_data_manager(), import_table, upload, upload.name
+                        )
+                    audit(
+                        'bulk_import',
+                        f"{st.session_state.import_summary['imported']} {import_table} from {upload.name}"
+                    )
+                except ValueError as e:
+                    st.error(f"Cannot import {upload.name}: {e}")
+            
+            import_summary = st.session_state.get('import_summary')
+            if import_summary:
+                import_errors = import_summary['errors']
+                st.success(
+                    f"Imported {import_summary['imported']:,} of {import_summary['read']:,} rows "
+                    f"in {import_summary['seconds']:.1f}s"
+                )
+                if not import_errors.empty:
+                    st.warning(f"{len(import_errors):,} problems found; those rows were skipped")
+                    show_dataframe(import_errors.head(1000), use_container_width=True, hide_index=True)
+                    st.download_button(
+                        "⬇️ Download error list",
+                        export_table(import_errors, 'CSV').getvalue(),
+                        file_name='import_errors.csv',
+                        mime='text/csv'
+                    )
+    
     # Display students table
     st.markdown('<div class="sub-header">Student Records</div>', unsafe_allow_html=True)
     
-    # Format for display
-    display_df = filtered_df.copy()
-    display_df['IC_Number'] = display_df['IC_Number'].apply(lambda x: f"****{str(x)[-4:]}" if pd.notna(x) else x)
+    sort_columns = {
+        'StudentID': 'ID',
+        'FullName': 'Name',
+        'CurrentLevel': 'Level',
+        'Class': 'Class',
+        'AvgScore': 'Score',
+        'Attendance%': 'Attendance'
+    }
+    for column in scope.hidden_columns('students'):
+        sort_columns.pop(column, None)
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        sort_by = st.selectbox(
+            "Sort by",
+            [None] + list(sort_columns),
+            format_func=lambda column: sort_columns.get(column, 'Best match' if search else 'Default')
+        )
+    with col2:
+        ascending = st.radio("Order", ['Ascending', 'Descending'], horizontal=True) == 'Ascending'
+    with col3:
+        page_size = st.selectbox("Rows per page", [25, 50, 100, 250], index=2)
+    
+    # Filtering, sorting and paging happen server-side; only this page is formatted
+    offset = paginate(summary['total'], page_size, key='students_page')
+    page_df, _ = data_manager.query(
+        'students', filters, search, limit=page_size, offset=offset,
+        sort_by=sort_by, ascending=ascending, scope=scope
+    )
+    
+    display_df = format_ids(page_df)
+    ic_numbers = display_df['IC_Number'].astype(str)
+    display_df['IC_Number'] = ('****' + ic_numbers.str[-4:]).where(display_df['IC_Number'].notna())
     
     # Color coding
-    def color_status(val):
-        if val == 'Promoted':
-            return 'background-color: #d1fae5'
-        elif val == 'Retained':
-            return 'background-color: #fee2e2'
-        elif val == 'Pending':
-            return 'background-color: #fef3c7'
-        return ''
+    status_colors = {
+        'Promoted': 'background-color: #d1fae5',
+        'Retained': 'background-color: #fee2e2',
+        'Pending': 'background-color: #fef3c7'
+    }
     
-    styled_df = display_df.style.applymap(color_status, subset=['PromotionStatus'])
+    formats = {
+        'DOB': '{:%d/%m/%Y}',
+        'AvgScore': '{:.0f}',
+        'Attendance%': '{:.0f}%'
+    }
+    styled_df = display_df.style.apply(
+        lambda column: column.astype(object).map(status_colors).fillna(''),
+        subset=[column for column in ['PromotionStatus'] if column in display_df]
+    ).format({column: fmt for column, fmt in formats.items() if column in display_df})
     
-    st.dataframe(
+    show_dataframe(
         styled_df,
         use_container_width=True,
-        height=500,
+        height=min(500, 38 + 35 * len(display_df)),
+        hide_index=True,
         column_config={
             'StudentID': 'ID',
             'FullName': 'Name',
@@ -804,6 +5021,7 @@ def render_students(data):
 # TEACHERS PAGE
 # =============================================================================
 
+@profiled
 def render_teachers(data):
     """Render teachers management page"""
     
@@ -820,32 +5038,32 @@ def render_teachers(data):
         subject_filter = st.selectbox("Subject", subjects)
     
     # Filter data
-    filtered_df = data['teachers'].copy()
-    
-    if search:
-        filtered_df = filtered_df[
-            filtered_df['Name'].str.contains(search, case=False, na=False) |
-            filtered_df['TeacherID'].str.contains(search, case=False, na=False)
-        ]
-    
-    if subject_filter != 'All':
-        filtered_df = filtered_df[filtered_df['SubjectSpecialty'] == subject_filter]
+    data_manager = get_data_manager()
+    filters = {'SubjectSpecialty': subject_filter} if subject_filter != 'All' else {}
+    scope = st.session_state.data_scope
+    summary = data_manager.summarize(
+        'teachers', 'EmploymentStatus', 'AssignedPeriods', filters, search, scope
+    )
     
     # Statistics
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        st.metric("Total Teachers", len(filtered_df))
+        st.metric("Total Teachers", summary['total'])
     with col2:
-        permanent = len(filtered_df[filtered_df['EmploymentStatus'] == 'Permanent'])
-        st.metric("Permanent", permanent)
+        st.metric("Permanent", summary['counts'].get('Permanent', 0))
     with col3:
-        avg_load = filtered_df['AssignedPeriods'].mean()
-        st.metric("Avg Teaching Load", f"{avg_load:.1f} periods")
+        st.metric("Avg Teaching Load", f"{summary['mean']:.1f} periods")
+    
+    page_size = 50
+    offset = paginate(summary['total'], page_size, key='teachers_page')
+    filtered_df, _ = data_manager.query(
+        'teachers', filters, search, limit=page_size, offset=offset, scope=scope
+    )
     
     # Display table
-    st.dataframe(
-        filtered_df,
+    show_dataframe(
+        format_ids(filtered_df),
         use_container_width=True,
         height=400,
         column_config={
@@ -861,38 +5079,55 @@ def render_teachers(data):
     # Workload distribution chart
     st.markdown('<div class="sub-header">Workload Distribution</div>', unsafe_allow_html=True)
     
-    fig = px.bar(
-        filtered_df,
-        x='Name',
-        y='AssignedPeriods',
-        color='SubjectSpecialty',
-        title='Teacher Workload',
-        labels={'AssignedPeriods': 'Periods per Week', 'Name': 'Teacher'}
-    )
-    fig.update_layout(
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        font_family='Inter',
-        height=400,
-        showlegend=True
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    def build_figure():
+        # Plotly groups by every category, including subjects missing from this page
+        fig = px.bar(
+            filtered_df.astype({'SubjectSpecialty': str}),
+            x='Name',
+            y='AssignedPeriods',
+            color='SubjectSpecialty',
+            title='Teacher Workload',
+            labels={'AssignedPeriods': 'Periods per Week', 'Name': 'Teacher'}
+        )
+        fig.update_layout(
+            plot_bgcolor='white',
+            paper_bgcolor='white',
+            font_family='Inter',
+            height=400,
+            showlegend=True
+        )
+        return fig
+    
+    fig = cached_figure('teacher_workload', ['teachers'], build_figure, (subject_filter, search, offset))
+    show_chart(fig, use_container_width=True)
 
 # =============================================================================
 # ACADEMIC RESULTS PAGE
 # =============================================================================
 
+@profiled
 def render_results(data):
     """Render academic results page"""
     
     st.markdown('<div class="main-header">📚 Academic Results</div>', unsafe_allow_html=True)
     
-    # Merge student names with results
-    results_df = data['results'].merge(
-        data['students'][['StudentID', 'FullName']],
-        on='StudentID',
-        how='left'
-    )
+    # Earlier years are read from the term store only when asked for
+    years = result_years(data)
+    if len(years) > 1:
+        start_year, end_year = st.select_slider(
+            "School Years", options=sorted(years), value=(years[0], years[0])
+        )
+    else:
+        start_year = end_year = years[0]
+    store = get_results_store()
+    scope = st.session_state.data_scope
+    
+    # Student names for the graded results, gathered through the ID index
+    with profile('join'):
+        results_df = get_data_manager().join(
+            grade_results(results_for_years(data, start_year, end_year)),
+            'students', ['FullName'], scope=scope
+        )
     
     # Filters
     col1, col2, col3 = st.columns(3)
@@ -934,50 +5169,116 @@ def render_results(data):
         st.metric("Average Score", f"{avg_score:.1f}%")
     
     with col2:
-        avg_attendance = filtered_df['Attendance%'].str.rstrip('%').astype(float).mean()
+        avg_attendance = filtered_df['Attendance%'].mean()
         st.metric("Average Attendance", f"{avg_attendance:.1f}%")
     
     with col3:
-        passed = len(filtered_df[filtered_df['AverageScore'] >= 50])
+        passed = int(filtered_df['Passed'].sum())
         st.metric("Passed", f"{passed}/{len(filtered_df)}")
     
     with col4:
-        distinction = len(filtered_df[filtered_df['AverageScore'] >= 80])
+        distinction = int(filtered_df['Distinction'].sum())
         st.metric("Distinction", distinction)
     
-    # Charts
+    # Charts are rebuilt only when the results or these filters change
+    chart_filters = (start_year, end_year, store.version, level_filter, class_filter, score_range)
     col1, col2 = st.columns(2)
     
     with col1:
         # Score distribution
-        fig = px.histogram(
-            filtered_df,
-            x='AverageScore',
-            nbins=20,
-            title='Score Distribution',
-            labels={'AverageScore': 'Score (%)', 'count': 'Number of Students'},
-            color_discrete_sequence=['#3b82f6']
-        )
-        fig.update_layout(
-            plot_bgcolor='white',
-            paper_bgcolor='white',
-            font_family='Inter',
-            height=350
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        def build_figure():
+            fig = px.histogram(
+                filtered_df,
+                x='AverageScore',
+                nbins=20,
+                title='Score Distribution',
+                labels={'AverageScore': 'Score (%)', 'count': 'Number of Students'},
+                color_discrete_sequence=['#3b82f6']
+            )
+            fig.update_layout(
+                plot_bgcolor='white',
+                paper_bgcolor='white',
+                font_family='Inter',
+                height=350
+            )
+            return fig
+        
+        fig = cached_figure('results_scores', ['results', 'students'], build_figure, chart_filters)
+        show_chart(fig, use_container_width=True)
     
     with col2:
         # Top performers
-        top_10 = filtered_df.nlargest(10, 'AverageScore')[['FullName', 'AverageScore']]
+        def build_figure():
+            # When whole classes, levels or the school are in view, their ranks give the top 10
+            rank_column = {
+                (True, True): 'ClassRank', (True, False): 'LevelRank', (False, False): 'SchoolRank'
+            }.get((level_filter != 'All', class_filter != 'All'))
+            whole_groups = (
+                (scope is None or scope.unrestricted)
+                and tuple(score_range) == (0, 100)
+                and start_year == end_year
+            )
+            if rank_column and whole_groups:
+                top_10 = filtered_df[filtered_df[rank_column] <= 10].sort_values(rank_column, kind='stable').head(10)
+            else:
+                top_10 = filtered_df.nlargest(10, 'AverageScore')
+            top_10 = top_10[['FullName', 'AverageScore']]
+            fig = px.bar(
+                top_10,
+                x='AverageScore',
+                y='FullName',
+                orientation='h',
+                title='Top 10 Performers',
+                labels={'AverageScore': 'Score (%)', 'FullName': ''},
+                color='AverageScore',
+                color_continuous_scale='viridis'
+            )
+            fig.update_layout(
+                plot_bgcolor='white',
+                paper_bgcolor='white',
+                font_family='Inter',
+                height=350
+            )
+            return fig
+        
+        fig = cached_figure('results_top10', ['results', 'students'], build_figure, chart_filters)
+        show_chart(fig, use_container_width=True)
+    
+    # Results table
+    st.markdown('<div class="sub-header">Detailed Results</div>', unsafe_allow_html=True)
+    
+    show_dataframe(
+        format_ids(filtered_df[[
+            'StudentID', 'FullName', 'Year', 'Level', 'Class', 'AverageScore', 'Grade',
+            'ClassRank', 'LevelRank', 'Percentile', 'Attendance%'
+        ]]),
+        use_container_width=True,
+        height=400,
+        column_config={
+            'Year': st.column_config.NumberColumn(format='%d'),
+            'AverageScore': st.column_config.NumberColumn(format='%.0f'),
+            'Percentile': st.column_config.NumberColumn(format='%.0f'),
+            'Attendance%': st.column_config.NumberColumn(format='%.0f%%')
+        }
+    )
+    
+    # Subject breakdown from the term scores of the selected years
+    st.markdown('<div class="sub-header">Subject Averages</div>', unsafe_allow_html=True)
+    
+    def build_figure():
+        student_ids = filtered_df['StudentID'].unique()
+        scores = store.query(
+            start_year, end_year, student_ids=student_ids, columns=['StudentID', 'Subject', 'Score']
+        )
+        subject_means = scores.groupby(['Year', 'Subject'], observed=True)['Score'].mean().round(1).reset_index()
         fig = px.bar(
-            top_10,
-            x='AverageScore',
-            y='FullName',
-            orientation='h',
-            title='Top 10 Performers',
-            labels={'AverageScore': 'Score (%)', 'FullName': ''},
-            color='AverageScore',
-            color_continuous_scale='viridis'
+            subject_means.astype({'Year': str, 'Subject': str}),
+            x='Subject',
+            y='Score',
+            color='Year',
+            barmode='group',
+            labels={'Score': 'Average Score (%)', 'Subject': ''},
+            color_discrete_sequence=px.colors.sequential.Blues[-len(subject_means['Year'].unique()):]
         )
         fig.update_layout(
             plot_bgcolor='white',
@@ -985,91 +5286,287 @@ def render_results(data):
             font_family='Inter',
             height=350
         )
-        st.plotly_chart(fig, use_container_width=True)
-    
-    # Results table
-    st.markdown('<div class="sub-header">Detailed Results</div>', unsafe_allow_html=True)
-    
-    st.dataframe(
-        filtered_df[['StudentID', 'FullName', 'Level', 'Class', 'AverageScore', 'Attendance%']],
-        use_container_width=True,
-        height=400
-    )
+        return fig
+    
+    fig = cached_figure('results_subjects', ['results', 'students'], build_figure, chart_filters)
+    show_chart(fig, use_container_width=True)
+    
+    # One student's term scores over the years, found by StudentID in each term
+    with st.expander("📜 Student Transcript"):
+        student_names = dict(zip(data['students']['StudentID'], data['students']['FullName']))
+        transcript_id = st.selectbox(
+            "Student",
+            [None] + sorted(student_names, key=lambda sid: (student_names[sid], sid)),
+            format_func=lambda sid: 'Select a student' if sid is None
+            else f"{student_names[sid]} ({format_id('StudentID', sid)})",
+            key='transcript_student'
+        )
+        if transcript_id is not None:
+            transcript = store.transcript(transcript_id)
+            if transcript.empty:
+                st.info("No term scores recorded for this student")
+            else:
+                transcript['Term'] = transcript['Year'].astype(str) + ' T' + transcript['Term'].astype(str)
+                show_dataframe(
+                    transcript.pivot_table(
+                        index='Subject', columns='Term', values='Score', observed=True
+                    ).round(0),
+                    use_container_width=True
+                )
 
 # =============================================================================
 # TIMETABLE PAGE
 # =============================================================================
 
+@profiled
 def render_timetable(data):
     """Render timetable page"""
     
     st.markdown('<div class="main-header">📅 Timetable</div>', unsafe_allow_html=True)
     
+    data_manager = get_data_manager()
+    scope = st.session_state.data_scope
+    class_grids = data_manager.timetable_grids('Class', scope)
+    teacher_names = dict(zip(data['teachers']['TeacherID'], data['teachers']['Name']))
+    
     # Class selector
-    classes = sorted(data['timetable']['Class'].unique().tolist())
+    classes = class_grids.index.get_level_values('Class').unique().tolist()
+    if not classes:
+        st.info(
+            "You have no lessons in the timetable" if scope.role == 'teacher'
+            else "The timetable has no lessons yet"
+        )
+        return
     selected_class = st.selectbox("Select Class", classes)
     
-    # Filter for selected class
-    class_timetable = data['timetable'][data['timetable']['Class'] == selected_class]
+    # Display timetable
+    st.markdown(f"### Class {selected_class} Timetable")
     
-    # Merge with teacher names
-    class_timetable = class_timetable.merge(
-        data['teachers'][['TeacherID', 'Name']],
-        on='TeacherID',
-        how='left'
+    show_dataframe(
+        class_grids.loc[selected_class],
+        use_container_width=True,
+        height=400
     )
     
-    # Create weekly view
-    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-    periods = sorted(class_timetable['Period'].unique())
-    
-    # Create timetable matrix
-    timetable_data = []
-    for period in periods:
-        row = {'Period': f'Period {period}'}
-        for day in days:
-            subject_data = class_timetable[
-                (class_timetable['Day'] == day) & 
-                (class_timetable['Period'] == period)
+    # The register for one period or the whole day, stored in the attendance bitmaps
+    if st.session_state.user_role in ('admin', 'principal', 'teacher'):
+        with st.expander(f"📝 Take Attendance for {selected_class}"):
+            register = get_attendance_register()
+            students = data['students']
+            class_students = students[
+                (class_codes(students['CurrentLevel'], students['Class']) == selected_class).to_numpy()
             ]
-            if not subject_data.empty:
-                row[day] = f"{subject_data.iloc[0]['Subject']}\n{subject_data.iloc[0]['Name']}\nRoom {subject_data.iloc[0]['Room']}"
+            col1, col2 = st.columns(2)
+            with col1:
+                register_day = st.date_input("Date", value=date.today(), key='register_day')
+            with col2:
+                register_period = st.selectbox(
+                    "Period", ['Whole day'] + list(range(1, register.periods + 1)), key='register_period'
+                )
+            periods = None if register_period == 'Whole day' else [register_period]
+            
+            if register.day_index(register_day) is None:
+                st.info("No school on this day")
+            elif class_students.empty:
+                st.info(f"No students are enrolled in {selected_class}")
             else:
-                row[day] = "—"
-        timetable_data.append(row)
+                taken, present = register.register(register_day, class_students['StudentID'], periods)
+                if taken.all():
+                    st.caption("This register has been taken; saving replaces it")
+                sheet = st.data_editor(
+                    format_ids(pd.DataFrame({
+                        'StudentID': class_students['StudentID'].to_numpy(),
+                        'FullName': class_students['FullName'].to_numpy(),
+                        'Present': np.where(taken, present, True)
+                    })),
+                    disabled=['StudentID', 'FullName'],
+                    hide_index=True,
+                    use_container_width=True,
+                    key=f'register_{selected_class}_{register_day}_{register_period}'
+                )
+                if st.button("💾 Save Register"):
+                    register.record(
+                        register_day, class_students['StudentID'].to_numpy(), sheet['Present'].to_numpy(), periods
+                    )
+                    audit('attendance_taken', f"{selected_class} {register_day} {register_period}")
+                    st.success(f"Saved: {int(sheet['Present'].sum())} of {len(sheet)} present")
+    
+    conflicts = data_manager.timetable_conflicts
+    
+    # Lesson editing, checked against the booking indexes as you type
+    if st.session_state.user_role in ('admin', 'principal'):
+        with st.expander(f"✏️ Edit a lesson in {selected_class}"):
+            timetable = data['timetable']
+            periods = sorted(timetable['Period'].unique().tolist())
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                edit_day = st.selectbox("Day", DAYS, key='edit_day')
+            with col2:
+                edit_period = st.selectbox("Period", periods, key='edit_period')
+            
+            booked = conflicts.booked('Class', selected_class, edit_day, edit_period)
+            position = min(booked) if booked else None
+            current = timetable.iloc[position] if position is not None else None
+            
+            def current_index(options, column):
+                if current is None or current[column] not in options:
+                    return 0
+                return options.index(current[column])
+            
+            subjects = timetable['Subject'].cat.categories.tolist()
+            teacher_ids = sorted(teacher_names)
+            rooms = sorted(
+                set(ROOM_CAPACITIES) | set(timetable['Room'].cat.categories),
+                key=lambda room: (len(room), room)
+            )
+            
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                edit_subject = st.selectbox(
+                    "Subject", subjects, index=current_index(subjects, 'Subject'), key='edit_subject'
+                )
+            with col2:
+                edit_teacher = st.selectbox(
+                    "Teacher", teacher_ids, index=current_index(teacher_ids, 'TeacherID'),
+                    format_func=lambda tid: f"{teacher_names[tid]} ({format_id('TeacherID', tid)})",
+                    key='edit_teacher'
+                )
+            with col3:
+                edit_room = st.selectbox(
+                    "Room", rooms, index=current_index(rooms, 'Room'), key='edit_room'
+                )
+            
+            lesson = {
+                'Class': selected_class,
+                'Subject': edit_subject,
+                'TeacherID': edit_teacher,
+                'Day': edit_day,
+                'Period': edit_period,
+                'Room': edit_room
+            }
+            clashes = conflicts.check(lesson, ignore=position)
+            for resource, value, positions in clashes:
+                other_classes = ', '.join(sorted({str(timetable['Class'].iat[p]) for p in positions}))
+                label = teacher_names[value] if resource == 'TeacherID' else value
+                st.warning(f"{label} is already booked on {edit_day} period {edit_period} ({other_classes})")
+            
+            override = st.checkbox("Save despite clashes", key='edit_override') if clashes else False
+            if st.button("💾 Save Lesson", disabled=bool(clashes) and not override):
+                try:
+                    if position is None:
+                        data_manager.append_rows('timetable', pd.DataFrame([lesson]))
+                    else:
+                        data_manager.update_rows(
+                            'timetable', ['Class', 'Day', 'Period'], pd.DataFrame([lesson]),
+                            expected_version=st.session_state.base_versions['timetable']
+                        )
+                except WriteConflict:
+                    st.error("Someone else changed the timetable while you were editing. "
+                             "Check the lesson above and save again.")
+                else:
+                    audit('timetable_edited', f"{selected_class} {edit_day} period {edit_period}")
+                    st.rerun()
     
-    # Display timetable
-    st.markdown(f"### Class {selected_class} Timetable")
+    # School-wide clash report
+    st.markdown('<div class="sub-header">Timetable Clashes</div>', unsafe_allow_html=True)
+    
+    clash_report = conflicts.report()
+    if not scope.unrestricted:
+        visible = set(data['timetable']['Class'].astype(str))
+        shown = np.array([
+            not visible.isdisjoint(classes.split(', ')) for classes in clash_report['Classes']
+        ], dtype=bool)
+        clash_report = clash_report[shown].reset_index(drop=True)
+    if clash_report.empty:
+        st.success("No teacher, room or class is double-booked")
+    else:
+        st.warning(f"{len(clash_report)} double bookings found")
+        clash_report['Value'] = [
+            format_id('TeacherID', value) if resource == 'TeacherID' else value
+            for resource, value in zip(clash_report['Resource'], clash_report['Value'])
+        ]
+        clash_report['Resource'] = clash_report['Resource'].map(
+            {'TeacherID': 'Teacher', 'Room': 'Room', 'Class': 'Class'}
+        )
+        clash_report['Day'] = pd.Categorical(clash_report['Day'], categories=DAYS, ordered=True)
+        show_dataframe(
+            clash_report.sort_values(['Day', 'Period', 'Resource']),
+            use_container_width=True,
+            hide_index=True
+        )
     
-    timetable_df = pd.DataFrame(timetable_data)
-    st.dataframe(
-        timetable_df.set_index('Period'),
-        use_container_width=True,
-        height=400
-    )
+    # Whole-school timetable generation
+    if st.session_state.user_role == 'admin':
+        with st.expander("⚙️ Generate Timetable"):
+            st.caption(
+                "Rebuilds every class timetable from the weekly subject periods, "
+                "teacher specialties and teaching loads"
+            )
+            col1, col2 = st.columns(2)
+            with col1:
+                time_budget = st.slider("Time budget (seconds)", 1, 60, 10)
+            with col2:
+                workers = st.number_input(
+                    "Parallel searches", min_value=1, max_value=os.cpu_count() or 1, value=1
+                )
+            
+            if st.button("🗓️ Generate"):
+                class_names = data['timetable']['Class'].unique().tolist()
+                try:
+                    with st.spinner("Searching for a clash-free timetable..."):
+                        generated, stats = TimetableScheduler(
+                            class_names, data['teachers'], rooms=school_rooms(data['timetable']),
+                            class_sizes=class_enrolment(data['students'])
+                        ).solve(time_budget=time_budget, workers=int(workers))
+                except ValueError as e:
+                    st.error(f"Cannot generate a timetable: {e}")
+                else:
+                    st.session_state.timetable_stats = stats
+                    if stats['clashes'] == 0:
+                        try:
+                            data_manager.update_table(
+                                'timetable', generated,
+                                expected_version=st.session_state.base_versions['timetable']
+                            )
+                        except WriteConflict:
+                            st.error("Someone else changed the timetable during generation; "
+                                     "it was not replaced")
+                        else:
+                            audit('timetable_generated', f"{stats['lessons']} lessons")
+                            st.rerun()
+            
+            stats = st.session_state.get('timetable_stats')
+            if stats:
+                message = (
+                    f"{stats['lessons']} lessons for {stats['classes']} classes in "
+                    f"{stats['seconds']:.2f}s ({stats['iterations']:,} moves tried)"
+                )
+                if stats['clashes']:
+                    st.error(f"{message}: {stats['clashes']} clashes remain, timetable not saved")
+                elif stats['spread_violations']:
+                    st.warning(f"{message}: {stats['spread_violations']} days exceed the daily subject limit")
+                else:
+                    st.success(message)
     
     # Teacher schedule view
     st.markdown('<div class="sub-header">Teacher Schedule</div>', unsafe_allow_html=True)
     
-    teacher_name = st.selectbox(
+    teacher_id = st.selectbox(
         "View teacher schedule",
-        ['Select a teacher'] + sorted(data['teachers']['Name'].tolist())
+        [None] + sorted(teacher_names, key=lambda tid: (teacher_names[tid], tid)),
+        format_func=lambda tid: 'Select a teacher' if tid is None
+        else f"{teacher_names[tid]} ({format_id('TeacherID', tid)})"
     )
     
-    if teacher_name != 'Select a teacher':
-        teacher_id = data['teachers'][data['teachers']['Name'] == teacher_name]['TeacherID'].iloc[0]
-        teacher_schedule = data['timetable'][data['timetable']['TeacherID'] == teacher_id]
+    if teacher_id is not None:
+        teacher_grids = data_manager.timetable_grids('TeacherID', scope)
         
-        if not teacher_schedule.empty:
-            teacher_schedule = teacher_schedule.merge(
-                data['teachers'][['TeacherID', 'Name']],
-                on='TeacherID',
-                how='left'
-            )
-            
-            st.dataframe(
-                teacher_schedule[['Day', 'Period', 'Class', 'Subject', 'Room']].sort_values(['Day', 'Period']),
-                use_container_width=True
+        if teacher_id in teacher_grids.index.get_level_values('TeacherID'):
+            show_dataframe(
+                teacher_grids.loc[teacher_id],
+                use_container_width=True,
+                height=400
             )
         else:
             st.info("No schedule found for this teacher")
@@ -1078,6 +5575,7 @@ def render_timetable(data):
 # REPORTS PAGE
 # =============================================================================
 
+@profiled
 def render_reports(data):
     """Render reports generation page"""
     
@@ -1085,14 +5583,14 @@ def render_reports(data):
     
     report_type = st.selectbox(
         "Select Report Type",
-        [
+        st.session_state.data_scope.reports([
             "Student Performance Report",
             "Class List Report",
             "Teacher Workload Report",
             "Attendance Summary",
             "Promotion Summary",
             "School Statistics"
-        ]
+        ])
     )
     
     if report_type == "Student Performance Report":
@@ -1108,74 +5606,82 @@ def render_reports(data):
     elif report_type == "School Statistics":
         render_statistics_report(data)
 
+@profiled
 def render_performance_report(data):
     """Render performance report"""
     
     st.markdown("### Student Performance Report")
     
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
     
     with col1:
+        year = st.selectbox("School Year", result_years(data))
+    
+    with col2:
         level = st.selectbox(
             "Select Level",
             ['All'] + sorted(data['results']['Level'].unique().tolist())
         )
     
-    with col2:
+    with col3:
         format_type = st.radio("Report Format", ['Summary', 'Detailed'])
     
     # Filter data
-    results_df = data['results'].copy()
+    results_df = grade_results(results_for_years(data, year, year))
     if level != 'All':
         results_df = results_df[results_df['Level'] == level]
     
-    # Merge with student names
-    results_df = results_df.merge(
-        data['students'][['StudentID', 'FullName', 'Class']],
-        on='StudentID',
-        how='left'
-    )
+    # Student names, gathered through the ID index
+    with profile('join'):
+        results_df = get_data_manager().join(
+            results_df, 'students', ['FullName'], scope=st.session_state.data_scope
+        )
     
     if format_type == 'Summary':
         # Summary by class
-        summary = results_df.groupby('Class').agg({
-            'AverageScore': ['mean', 'min', 'max', 'count'],
-            'Attendance%': lambda x: x.str.rstrip('%').astype(float).mean()
-        }).round(1)
+        with profile('groupby'):
+            summary = results_df.groupby('Class', observed=True).agg({
+                'AverageScore': ['mean', 'min', 'max', 'count'],
+                'Attendance%': 'mean'
+            }).round(1)
         
         summary.columns = ['Avg Score', 'Min Score', 'Max Score', 'Students', 'Avg Attendance']
-        st.dataframe(summary, use_container_width=True)
+        show_dataframe(summary, use_container_width=True)
         
-        # Performance bands
-        results_df['Performance Band'] = pd.cut(
-            results_df['AverageScore'],
-            bins=[0, 40, 50, 60, 70, 80, 90, 100],
-            labels=['<40%', '40-50%', '50-60%', '60-70%', '70-80%', '80-90%', '90-100%']
-        )
+        # Performance bands come from the grade book
+        def build_figure():
+            band_dist = results_df['Performance Band'].value_counts().sort_index()
+            fig = px.bar(
+                x=band_dist.index,
+                y=band_dist.values,
+                title='Performance Distribution',
+                labels={'x': 'Score Range', 'y': 'Number of Students'}
+            )
+            return fig
         
-        band_dist = results_df['Performance Band'].value_counts().sort_index()
-        fig = px.bar(
-            x=band_dist.index,
-            y=band_dist.values,
-            title='Performance Distribution',
-            labels={'x': 'Score Range', 'y': 'Number of Students'}
+        fig = cached_figure(
+            'performance_bands', ['results'], build_figure, (year, get_results_store().version, level)
         )
-        st.plotly_chart(fig, use_container_width=True)
+        show_chart(fig, use_container_width=True)
     
     else:
         # Detailed view
-        st.dataframe(
-            results_df[['StudentID', 'FullName', 'Class', 'AverageScore', 'Attendance%']],
-            use_container_width=True
+        show_dataframe(
+            format_ids(results_df[[
+                'StudentID', 'FullName', 'Class', 'AverageScore', 'Grade', 'LevelRank', 'Percentile', 'Attendance%'
+            ]]),
+            use_container_width=True,
+            column_config={
+                'AverageScore': st.column_config.NumberColumn(format='%.0f'),
+                'Percentile': st.column_config.NumberColumn(format='%.0f'),
+                'Attendance%': st.column_config.NumberColumn(format='%.0f%%')
+            }
         )
     
-    # Download button
-    if st.button("📥 Download Report", use_container_width=True):
-        csv = results_df.to_csv(index=False)
-        b64 = base64.b64encode(csv.encode()).decode()
-        href = f'<a href="data:file/csv;base64,{b64}" download="performance_report.csv">Download CSV</a>'
-        st.markdown(href, unsafe_allow_html=True)
+    # Download
+    render_export("Student Performance Report", results_df, (year, level, format_type))
 
+@profiled
 def render_class_list(data):
     """Render class list report"""
     
@@ -1191,8 +5697,8 @@ def render_class_list(data):
             with st.expander(f"Class {class_name}"):
                 class_students = level_students[level_students['Class'] == class_name]
                 
-                st.dataframe(
-                    class_students[['StudentID', 'FullName', 'Gender']].sort_values('FullName'),
+                show_dataframe(
+                    format_ids(class_students[['StudentID', 'FullName', 'Gender']].sort_values('FullName')),
                     use_container_width=True,
                     hide_index=True
                 )
@@ -1204,7 +5710,14 @@ def render_class_list(data):
                     boys = len(class_students[class_students['Gender'] == 'Male'])
                     girls = len(class_students[class_students['Gender'] == 'Female'])
                     st.metric("Boys/Girls", f"{boys}/{girls}")
+        
+        render_export(
+            "Class List Report",
+            level_students[['StudentID', 'FullName', 'Gender', 'Class']].sort_values(['Class', 'FullName']),
+            (level,)
+        )
 
+@profiled
 def render_workload_report(data):
     """Render teacher workload report"""
     
@@ -1217,7 +5730,7 @@ def render_workload_report(data):
         workload_df['AssignedPeriods'],
         bins=[0, 15, 25, 50],
         labels=['Underloaded', 'Balanced', 'Overloaded']
-    )
+    ).astype(str)
     
     # Summary
     col1, col2, col3 = st.columns(3)
@@ -1235,77 +5748,135 @@ def render_workload_report(data):
         st.metric("Underloaded", underloaded)
     
     # Distribution chart
-    fig = px.bar(
-        workload_df.sort_values('AssignedPeriods'),
-        x='Name',
-        y='AssignedPeriods',
-        color='Status',
-        title='Teacher Workload Distribution',
-        color_discrete_map={
-            'Underloaded': '#f59e0b',
-            'Balanced': '#22c55e',
-            'Overloaded': '#ef4444'
-        }
-    )
-    fig.update_layout(
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        font_family='Inter',
-        height=500,
-        xaxis_tickangle=-45
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    def build_figure():
+        fig = px.bar(
+            workload_df.sort_values('AssignedPeriods'),
+            x='Name',
+            y='AssignedPeriods',
+            color='Status',
+            title='Teacher Workload Distribution',
+            color_discrete_map={
+                'Underloaded': '#f59e0b',
+                'Balanced': '#22c55e',
+                'Overloaded': '#ef4444'
+            }
+        )
+        fig.update_layout(
+            plot_bgcolor='white',
+            paper_bgcolor='white',
+            font_family='Inter',
+            height=500,
+            xaxis_tickangle=-45
+        )
+        return fig
+    
+    fig = cached_figure('workload_report', ['teachers'], build_figure)
+    show_chart(fig, use_container_width=True)
     
     # Detailed table
-    st.dataframe(
-        workload_df[['TeacherID', 'Name', 'SubjectSpecialty', 'AssignedPeriods', 'Status']],
-        use_container_width=True
-    )
+    workload_table = workload_df[['TeacherID', 'Name', 'SubjectSpecialty', 'AssignedPeriods', 'Status']]
+    show_dataframe(format_ids(workload_table), use_container_width=True)
+    
+    render_export("Teacher Workload Report", workload_table)
 
+@profiled
 def render_attendance_report(data):
     """Render attendance report"""
     
     st.markdown("### Attendance Summary Report")
     
-    results_df = data['results'].copy()
-    results_df['Attendance'] = results_df['Attendance%'].str.rstrip('%').astype(float)
+    year = st.selectbox("School Year", result_years(data))
+    results_df = grade_results(results_for_years(data, year, year))
+    register = get_attendance_register()
+    data_manager = get_data_manager()
+    scope = st.session_state.data_scope
+    low_threshold = load_config().get('attendance', {}).get('low_threshold', 85)
+    
+    # Years with daily registers are counted from them; other years keep the results figure
+    daily = year in register.years()
+    if daily:
+        attendance = register.summary(year, results_df['StudentID'])
+        with profile('merge'):
+            results_df = results_df.drop(columns=['Attendance%']).merge(attendance, on='StudentID', how='left')
+        results_df['Attendance Band'] = get_grading_engine().scheme('Attendance Band').assign(
+            results_df['Attendance%']
+        )
+    results_df['Attendance'] = results_df['Attendance%']
     
     # Summary by level
-    level_attendance = results_df.groupby('Level')['Attendance'].agg(['mean', 'min', 'max']).round(1)
+    with profile('groupby'):
+        level_attendance = results_df.groupby('Level', observed=True)['Attendance'].agg(['mean', 'min', 'max']).round(1)
     level_attendance.columns = ['Avg Attendance', 'Min', 'Max']
     
-    st.dataframe(level_attendance, use_container_width=True)
-    
-    # Attendance distribution
-    results_df['Attendance Band'] = pd.cut(
-        results_df['Attendance'],
-        bins=[0, 70, 80, 85, 90, 95, 100],
-        labels=['<70%', '70-80%', '80-85%', '85-90%', '90-95%', '95-100%']
-    )
-    
-    band_counts = results_df['Attendance Band'].value_counts().sort_index()
-    fig = px.pie(
-        values=band_counts.values,
-        names=band_counts.index,
-        title='Attendance Distribution'
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    show_dataframe(level_attendance, use_container_width=True)
     
-    # Low attendance students
-    st.markdown("### Students with Low Attendance (<85%)")
-    low_attendance = results_df[results_df['Attendance'] < 85].merge(
-        data['students'][['StudentID', 'FullName', 'Class']],
-        on='StudentID'
-    )
+    # Attendance distribution, banded by the grade book
+    def build_figure():
+        band_counts = results_df['Attendance Band'].value_counts().sort_index()
+        fig = px.pie(
+            values=band_counts.values,
+            names=band_counts.index,
+            title='Attendance Distribution'
+        )
+        return fig
+    
+    chart_filters = (year, get_results_store().version, register.version)
+    fig = cached_figure('attendance_bands', ['results'], build_figure, chart_filters)
+    show_chart(fig, use_container_width=True)
+    
+    if daily:
+        def build_figure():
+            rates = register.daily_rates(year, results_df['StudentID'])
+            fig = px.line(
+                rates.reset_index(),
+                x='Date',
+                y='Attendance%',
+                title='Daily Attendance',
+                labels={'Attendance%': 'Periods Attended (%)', 'Date': ''}
+            )
+            fig.update_layout(
+                plot_bgcolor='white',
+                paper_bgcolor='white',
+                font_family='Inter',
+                height=300
+            )
+            return fig
+        
+        fig = cached_figure('attendance_daily', ['results'], build_figure, chart_filters)
+        show_chart(fig, use_container_width=True)
+    
+    # Low attendance students, with their runs of absent days when registers are kept
+    st.markdown(f"### Students with Low Attendance (<{low_threshold}%)")
+    low_attendance = results_df[results_df['Attendance'] < low_threshold]
+    absence_columns = []
+    if daily:
+        low_attendance = low_attendance.merge(
+            register.streaks(year, low_attendance['StudentID']), on='StudentID', how='left'
+        )
+        absence_columns = ['DaysAbsent', 'CurrentStreak', 'LongestStreak']
+    with profile('join'):
+        low_attendance = data_manager.join(low_attendance, 'students', ['FullName'], how='inner', scope=scope)
     
     if not low_attendance.empty:
-        st.dataframe(
-            low_attendance[['StudentID', 'FullName', 'Class', 'Attendance']].sort_values('Attendance'),
-            use_container_width=True
+        show_dataframe(
+            format_ids(
+                low_attendance[['StudentID', 'FullName', 'Class', 'Attendance'] + absence_columns]
+                .sort_values('Attendance')
+            ),
+            use_container_width=True,
+            column_config={'Attendance': st.column_config.NumberColumn(format='%.1f%%')}
         )
     else:
         st.success("No students with low attendance!")
+    
+    with profile('join'):
+        attendance_table = data_manager.join(results_df, 'students', ['FullName'], scope=scope)[
+            ['StudentID', 'FullName', 'Level', 'Class', 'Attendance', 'Attendance Band']
+            + (['DaysTaken', 'DaysAbsent'] if daily else [])
+        ]
+    render_export("Attendance Summary", attendance_table, (year, register.version))
 
+@profiled
 def render_promotion_report(data):
     """Render promotion summary report"""
     
@@ -1314,34 +5885,40 @@ def render_promotion_report(data):
     students_df = data['students'].copy()
     
     # Summary by level
-    promotion_summary = pd.crosstab(
-        students_df['CurrentLevel'],
-        students_df['PromotionStatus'],
-        margins=True,
-        margins_name='Total'
-    )
+    with profile('groupby'):
+        promotion_summary = pd.crosstab(
+            students_df['CurrentLevel'],
+            students_df['PromotionStatus'],
+            margins=True,
+            margins_name='Total'
+        )
     
-    st.dataframe(promotion_summary, use_container_width=True)
+    show_dataframe(promotion_summary, use_container_width=True)
     
     # Promotion rate chart
-    promotion_rate = (students_df['PromotionStatus'] == 'Promoted').groupby(
-        students_df['CurrentLevel']
-    ).mean() * 100
+    with profile('groupby'):
+        promotion_rate = (students_df['PromotionStatus'] == 'Promoted').groupby(
+            students_df['CurrentLevel'], observed=True
+        ).mean() * 100
     
-    fig = px.bar(
-        x=promotion_rate.index,
-        y=promotion_rate.values,
-        title='Promotion Rate by Level',
-        labels={'x': 'Level', 'y': 'Promotion Rate (%)'},
-        color_discrete_sequence=['#22c55e']
-    )
-    fig.update_layout(
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        font_family='Inter',
-        yaxis_range=[0, 100]
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    def build_figure():
+        fig = px.bar(
+            x=promotion_rate.index,
+            y=promotion_rate.values,
+            title='Promotion Rate by Level',
+            labels={'x': 'Level', 'y': 'Promotion Rate (%)'},
+            color_discrete_sequence=['#22c55e']
+        )
+        fig.update_layout(
+            plot_bgcolor='white',
+            paper_bgcolor='white',
+            font_family='Inter',
+            yaxis_range=[0, 100]
+        )
+        return fig
+    
+    fig = cached_figure('promotion_rates', ['students'], build_figure)
+    show_chart(fig, use_container_width=True)
     
     # Retained students list
     st.markdown("### Students to be Retained")
@@ -1350,10 +5927,101 @@ def render_promotion_report(data):
     ]
     
     if not retained.empty:
-        st.dataframe(retained, use_container_width=True)
+        show_dataframe(format_ids(retained), use_container_width=True)
     else:
         st.success("No students to be retained!")
+    
+    # Dry run of the promotion rules against the recorded statuses
+    st.markdown("### Promotion Decisions")
+    data_manager = get_data_manager()
+    engine = data_manager.promotions
+    rules = engine.rules
+    exceptions = ''.join(
+        f"; {level}: {rule.get('min_score', rules.min_score)}% score, "
+        f"{rule.get('min_attendance', rules.min_attendance)}% attendance"
+        for level, rule in rules.levels.items()
+    )
+    st.caption(
+        f"{engine.year} school year. Students move up with an average score of at least "
+        f"{rules.min_score}% and attendance of at least {rules.min_attendance}%{exceptions}."
+    )
+    
+    changes = engine.diff(students_df)
+    if changes.empty:
+        st.success("Every student's status already matches the promotion rules")
+    else:
+        st.info(f"Applying the rules would change {len(changes):,} students")
+        show_dataframe(format_ids(changes), use_container_width=True, hide_index=True)
+    
+    if st.session_state.user_role in ('admin', 'principal'):
+        overrides = data_manager.promotion_overrides()
+        with st.expander("✋ Override a decision"):
+            student_names = dict(zip(students_df['StudentID'], students_df['FullName']))
+            col1, col2 = st.columns(2)
+            with col1:
+                override_id = st.selectbox(
+                    "Student",
+                    sorted(student_names, key=lambda sid: (student_names[sid], sid)),
+                    format_func=lambda sid: f"{student_names[sid]} ({format_id('StudentID', sid)})",
+                    key='override_student'
+                )
+            with col2:
+                current = overrides.get(override_id, 'By the rules')
+                choices = ['By the rules'] + PROMOTION_STATUSES
+                override_status = st.selectbox(
+                    "Decision", choices, index=choices.index(current), key='override_status'
+                )
+            if st.button("💾 Save Override", disabled=override_id is None):
+                data_manager.set_promotion_override(
+                    override_id, None if override_status == 'By the rules' else override_status
+                )
+                audit('promotion_override', f"{format_id('StudentID', override_id)} {override_status}")
+                st.rerun()
+            if overrides:
+                st.caption("Current overrides: " + ', '.join(
+                    f"{format_id('StudentID', sid)} {status}" for sid, status in sorted(overrides.items())
+                ))
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("✅ Apply Decisions", disabled=changes.empty, use_container_width=True):
+                try:
+                    changed = data_manager.apply_promotions(
+                        expected_version=st.session_state.base_versions['students']
+                    )
+                except WriteConflict:
+                    st.error("Someone else changed the students while you were reviewing. "
+                             "Check the decisions above and apply again.")
+                else:
+                    audit('promotions_applied', f"{changed} students for {engine.year}")
+                    st.rerun()
+        with col2:
+            if st.session_state.user_role == 'admin':
+                confirm = st.checkbox(f"Move every student into {engine.year + 1}", key='confirm_rollover')
+                if st.button(f"🎓 Start {engine.year + 1}", disabled=not confirm, use_container_width=True):
+                    start = time.perf_counter()
+                    try:
+                        counts = data_manager.rollover(
+                            expected_version=st.session_state.base_versions['students']
+                        )
+                    except WriteConflict:
+                        st.error("Someone else changed the students while you were reviewing; "
+                                 "nobody was moved")
+                    else:
+                        audit(
+                            'year_rollover',
+                            f"{engine.year + 1}: {counts['promoted']} promoted, {counts['stayed']} stayed, "
+                            f"{counts['graduated']} graduated in {time.perf_counter() - start:.1f}s"
+                        )
+                        st.rerun()
+    
+    render_export(
+        "Promotion Summary",
+        students_df[['StudentID', 'FullName', 'CurrentLevel', 'Class', 'PromotionStatus', 'NextLevel',
+                     'AvgScore', 'Attendance%']]
+    )
 
+@profiled
 def render_statistics_report(data):
     """Render school statistics report"""
     
@@ -1373,30 +6041,151 @@ def render_statistics_report(data):
     with col3:
         avg_score = data['results']['AverageScore'].mean()
         st.metric("School Avg Score", f"{avg_score:.1f}%")
-        avg_attendance = data['results']['Attendance%'].str.rstrip('%').astype(float).mean()
+        avg_attendance = data['results']['Attendance%'].mean()
         st.metric("School Avg Attendance", f"{avg_attendance:.1f}%")
     
     # Gender distribution
     col1, col2 = st.columns(2)
     
     with col1:
-        gender_dist = data['students']['Gender'].value_counts()
-        fig = go.Figure(data=[go.Pie(
-            labels=gender_dist.index,
-            values=gender_dist.values,
-            hole=0.4
-        )])
-        fig.update_layout(title='Gender Distribution')
-        st.plotly_chart(fig, use_container_width=True)
+        def build_figure():
+            gender_dist = data['students']['Gender'].value_counts()
+            fig = go.Figure(data=[go.Pie(
+                labels=gender_dist.index,
+                values=gender_dist.values,
+                hole=0.4
+            )])
+            fig.update_layout(title='Gender Distribution')
+            return fig
+        
+        fig = cached_figure('statistics_gender', ['students'], build_figure)
+        show_chart(fig, use_container_width=True)
     
     with col2:
-        level_dist = data['students']['CurrentLevel'].value_counts().sort_index()
-        fig = px.bar(
-            x=level_dist.index,
-            y=level_dist.values,
-            title='Students by Level'
+        def build_figure():
+            level_dist = data['students']['CurrentLevel'].value_counts().sort_index()
+            fig = px.bar(
+                x=level_dist.index,
+                y=level_dist.values,
+                title='Students by Level'
+            )
+            return fig
+        
+        fig = cached_figure('statistics_levels', ['students'], build_figure)
+        show_chart(fig, use_container_width=True)
+    
+    statistics_table = pd.DataFrame({
+        'Metric': [
+            'Total Enrollment', 'Student-Teacher Ratio', 'Total Staff',
+            'Classes', 'School Avg Score', 'School Avg Attendance'
+        ],
+        'Value': [
+            len(data['students']),
+            round(len(data['students']) / len(data['teachers']), 1),
+            len(data['teachers']) + len(data['staff']),
+            len(data['students']['Class'].unique()),
+            round(float(avg_score), 1),
+            round(float(avg_attendance), 1)
+        ]
+    })
+    render_export("School Statistics", statistics_table)
+
+# =============================================================================
+# DIAGNOSTICS PAGE
+# =============================================================================
+
+def render_diagnostics():
+    """Render page timing and memory collected by the profiler"""
+    
+    st.markdown('<div class="main-header">🩺 Diagnostics</div>', unsafe_allow_html=True)
+    
+    profiler = get_profiler()
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        profiler.enabled = st.toggle("Record render timings", value=profiler.enabled)
+    with col2:
+        trace_memory = st.toggle(
+            "Trace peak memory", value=profiler.trace_memory,
+            help="Uses tracemalloc, which slows every render while it is on"
         )
-        st.plotly_chart(fig, use_container_width=True)
+        if trace_memory != profiler.trace_memory:
+            profiler.set_trace_memory(trace_memory)
+    with col3:
+        if st.button("🗑️ Clear samples", use_container_width=True):
+            profiler.clear()
+    
+    # Rows whose StudentID, ParentID or TeacherID matches nothing, checked as writes land
+    dangling = get_data_manager().relations.report()
+    if dangling.empty:
+        st.caption("Referential integrity: every result, student and lesson points at an existing record")
+    else:
+        with st.expander(f"⚠️ {len(dangling)} records point at missing students, parents or teachers"):
+            st.dataframe(dangling, use_container_width=True, hide_index=True)
+    
+    samples = profiler.recent(profiler.samples.maxlen)
+    if samples.empty:
+        st.info("No renders recorded yet. Open some pages and come back.")
+        return
+    
+    figures = get_figure_cache()
+    lookups = figures.hits + figures.misses
+    st.caption(
+        f"{len(samples)} renders kept, newest {time_ago(samples['Time'].iloc[0])}. "
+        f"Figure cache: {len(figures)} charts, "
+        f"{figures.hits / lookups if lookups else 0:.0%} of {lookups:,} lookups reused"
+    )
+    
+    # Slowest steps across every kept render
+    st.markdown('<div class="sub-header">Time by Step</div>', unsafe_allow_html=True)
+    summary = profiler.summary()
+    st.dataframe(
+        summary,
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            column: st.column_config.NumberColumn(format='%.1f')
+            for column in ['Total ms', 'Mean ms', 'P95 ms', 'Max ms', 'Peak MB']
+        }
+    )
+    
+    renders = summary[~summary['Span'].str.contains(' > ', regex=False)]
+    fig = px.bar(
+        renders.sort_values('Mean ms'),
+        x='Mean ms',
+        y='Span',
+        orientation='h',
+        title='Mean Render Time',
+        labels={'Span': '', 'Mean ms': 'Milliseconds'},
+        color_discrete_sequence=['#3b82f6']
+    )
+    fig.update_layout(
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        font_family='Inter',
+        height=max(250, 40 * len(renders))
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    
+    st.markdown('<div class="sub-header">Recent Renders</div>', unsafe_allow_html=True)
+    st.dataframe(
+        samples.head(50),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            'Time': st.column_config.DatetimeColumn(format='HH:mm:ss'),
+            'Milliseconds': st.column_config.NumberColumn(format='%.1f'),
+            'Peak MB': st.column_config.NumberColumn(format='%.2f')
+        }
+    )
+    
+    # Folded stacks open directly in speedscope or flamegraph.pl
+    st.download_button(
+        "⬇️ Download flamegraph profile",
+        profiler.folded(),
+        file_name=f"render_profile_{datetime.now():%Y%m%d_%H%M%S}.folded",
+        mime='text/plain'
+    )
 
 # =============================================================================
 # MAIN APPLICATION
@@ -1405,14 +6194,49 @@ def render_statistics_report(data):
 def main():
     """Main application entry point"""
     
-    # Initialize data manager
-    data_manager = DataManager()
-    
-    # Load sample data
-    data = data_manager.load_sample_data()
-    
-    # Authentication
-    auth = Authentication()
+    # Authentication; users are loaded and hashed once per process
+    auth = get_authentication()
+    
+    # A new browser session may carry a signed cookie from an earlier login
+    if not st.session_state.authenticated and not st.session_state.get('cookie_checked'):
+        st.session_state.cookie_checked = True
+        token = read_cookie(auth.cookie_name)
+        username = auth.verify_token(token) if token else None
+        if username:
+            start_session(auth, username, token)
+            audit('session_restored', username)
+    
+    # Reruns check the session token's signature, never the password
+    if st.session_state.authenticated and auth.verify_token(st.session_state.auth_token) != st.session_state.login_user:
+        end_session()
+        st.warning("Your session has expired. Please log in again.")
+    
+    if st.session_state.cookie_action == 'set':
+        write_cookie(auth.cookie_name, st.session_state.auth_token, auth.expiry_seconds)
+    elif st.session_state.cookie_action == 'clear':
+        write_cookie(auth.cookie_name, '', 0)
+    st.session_state.cookie_action = None
+    
+    # Shared data manager; tables are loaded once per process
+    # Pages get only the rows and columns this login may see
+    data_manager = get_data_manager()
+    scope = st.session_state.data_scope
+    data, table_versions = data_manager.scoped_snapshot(scope)
+    data_manager.set_writer(st.session_state.session_id, st.session_state.username)
+    
+    # Table versions this session last displayed; edits are checked against them
+    st.session_state.base_versions = st.session_state.get('seen_versions', table_versions)
+    st.session_state.seen_versions = table_versions
+    
+    # Tell this session about changes other users made since its last run
+    last_seen = max(st.session_state.base_versions.values())
+    if st.session_state.authenticated:
+        notices = {}
+        for change in data_manager.changes_since(last_seen):
+            if change['session'] != st.session_state.session_id:
+                notices[(change['user'] or 'Another user', change['table'])] = change
+        for (user, table), change in notices.items():
+            st.toast(f"{user} updated {table} at {change['time']:%H:%M}", icon="🔔")
     
     # Sidebar
     with st.sidebar:
@@ -1430,19 +6254,17 @@ def main():
                 if submitted:
                     authenticated, user_info = auth.authenticate(username, password)
                     if authenticated:
-                        st.session_state.authenticated = True
-                        st.session_state.user_role = user_info['role']
-                        st.session_state.username = user_info['name']
-                        st.session_state.user_email = user_info['email']
-                        st.session_state.login_time = datetime.now()
+                        start_session(auth, username)
+                        audit('login', username)
                         st.rerun()
                     else:
+                        get_audit_log().record(None, 'login_failed', username)
                         st.error("Invalid username or password")
         else:
             # User profile
             st.markdown(f"""
             <div style="text-align: center; padding: 1rem;">
-                <div style="font-size: 3rem;">{auth.get_user_info(st.session_state.username.split()[-1].lower())['avatar']}</div>
+                <div style="font-size: 3rem;">{auth.get_user_info(st.session_state.login_user)['avatar']}</div>
                 <div style="font-weight: 600;">{st.session_state.username}</div>
                 <div style="color: #666; font-size: 0.9rem;">{st.session_state.user_role}</div>
             </div>
@@ -1450,10 +6272,15 @@ def main():
             
             st.markdown("---")
             
+            if st.session_state.user_role == 'admin':
+                if st.button("🔄 Reload Data", use_container_width=True):
+                    data_manager.invalidate()
+                    st.rerun()
+                st.caption(f"Data version {data_manager.version}")
+            
             if st.button("🚪 Logout", use_container_width=True):
-                st.session_state.authenticated = False
-                st.session_state.user_role = None
-                st.session_state.username = None
+                audit('logout')
+                end_session()
                 st.rerun()
         
         st.markdown("---")
@@ -1466,10 +6293,12 @@ def main():
                 "Teachers": "👨‍🏫",
                 "Results": "📚",
                 "Timetable": "📅",
-                "Reports": "📑"
+                "Reports": "📑",
+                "Diagnostics": "🩺"
             }
             
-            for page, icon in pages.items():
+            for page in scope.pages(pages):
+                icon = pages[page]
                 if st.sidebar.button(
                     f"{icon} {page}",
                     use_container_width=True,
@@ -1500,6 +6329,9 @@ def main():
             """, unsafe_allow_html=True)
     else:
         # Render selected page
+        if st.session_state.current_page not in scope.pages([st.session_state.current_page]):
+            st.session_state.current_page = "Dashboard"
+        
         if st.session_state.current_page == "Dashboard":
             render_dashboard(data)
         elif st.session_state.current_page == "Students":
@@ -1512,6 +6344,8 @@ def main():
             render_timetable(data)
         elif st.session_state.current_page == "Reports":
             render_reports(data)
+        elif st.session_state.current_page == "Diagnostics":
+            render_diagnostics()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,316 @@
+"""
+Benchmarks for St. George's School Management System
+
+Usage:
+    python benchmark.py timetable [--classes 22 60 150] [--budget 60] [--workers 1]
+    python benchmark.py render [--scales 10 100 1000] [--repeat 3] [--role admin]
+                               [--output results.json] [--baseline results.json]
+    python benchmark.py promotion [--scales 100 1000 10000]
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+
+import app
+from app import DAYS, SUBJECT_PERIODS, TimetableScheduler
+
+# Page and report renderers timed by the render suite
+RENDER_PAGES = {
+    'Dashboard': 'render_dashboard',
+    'Students': 'render_students',
+    'Teachers': 'render_teachers',
+    'Results': 'render_results',
+    'Timetable': 'render_timetable'
+}
+RENDER_REPORTS = {
+    'Student Performance Report': 'render_performance_report',
+    'Class List Report': 'render_class_list',
+    'Teacher Workload Report': 'render_workload_report',
+    'Attendance Summary': 'render_attendance_report',
+    'Promotion Summary': 'render_promotion_report',
+    'School Statistics': 'render_statistics_report'
+}
+
+# Script run headlessly for one render; the app module is imported once per
+# process, so every run shares the data manager set up in bench_render()
+RENDER_SCRIPT = """
+import time
+import streamlit as st
+import app
+
+app.init_session_state()
+scope = st.session_state.data_scope
+data, st.session_state.base_versions = app.get_data_manager().scoped_snapshot(scope)
+st.session_state.seen_versions = st.session_state.base_versions
+if st.session_state.bench_cold:
+    app.get_figure_cache().clear()
+render = getattr(app, st.session_state.bench_render)
+start = time.perf_counter()
+render(data)
+st.session_state.bench_seconds = time.perf_counter() - start
+"""
+
+# Users each role renders as; the teacher is timetable teacher TCH001
+BENCH_USERS = {
+    'admin': ('System Administrator', None),
+    'principal': ('Principal', None),
+    'teacher': ('Teacher', 1),
+    'staff': ('Staff', None)
+}
+
+
+def synthetic_school(n_classes, seed=0):
+    """Build class names, teachers and rooms for a school of n_classes"""
+
+    rng = np.random.RandomState(seed)
+    classes = [f'{grade}{section}' for grade in range(1, 12) for section in 'ABCDEFGHIJKLMNOP']
+    classes = sorted(classes, key=lambda name: (name[-1], int(name[:-1])))[:n_classes]
+
+    # Staff each subject with 25% headroom over its weekly demand
+    teacher_subjects = []
+    for subject, periods in SUBJECT_PERIODS.items():
+        demand = periods * n_classes
+        teacher_subjects += [subject] * int(np.ceil(demand * 1.25 / 25))
+
+    teachers = pd.DataFrame({
+        'TeacherID': np.arange(1, len(teacher_subjects) + 1),
+        'SubjectSpecialty': teacher_subjects,
+        'AssignedPeriods': 25
+    })
+    rooms = {f'R{i}': int(capacity) for i, capacity in enumerate(rng.randint(30, 46, n_classes), 1)}
+    class_sizes = dict(zip(classes, rng.randint(25, 41, n_classes)))
+
+    return classes, teachers, rooms, class_sizes
+
+
+def bench_timetable(args):
+    """Time whole-school timetable generation for each school size"""
+
+    print(f"{'Classes':>8} {'Lessons':>8} {'Clashes':>8} {'Spread':>7} {'Moves':>10} {'Seconds':>8}")
+    for n_classes in args.classes:
+        classes, teachers, rooms, class_sizes = synthetic_school(n_classes, args.seed)
+        scheduler = TimetableScheduler(classes, teachers, rooms, days=DAYS, class_sizes=class_sizes)
+        _, stats = scheduler.solve(time_budget=args.budget, workers=args.workers, seed=args.seed)
+        print(
+            f"{stats['classes']:>8} {stats['lessons']:>8} {stats['clashes']:>8} "
+            f"{stats['spread_violations']:>7} {stats['iterations']:>10,} {stats['seconds']:>8.2f}"
+        )
+
+
+def render_once(function, role, timeout, cold=False):
+    """Render one page headlessly and return its wall time in seconds"""
+    username, teacher_id = BENCH_USERS[role]
+    at = AppTest.from_string(RENDER_SCRIPT, default_timeout=timeout)
+    at.session_state.authenticated = True
+    at.session_state.user_role = role
+    at.session_state.username = username
+    at.session_state.data_scope = app.DataScope(role, teacher_id)
+    at.session_state.bench_render = function
+    at.session_state.bench_cold = cold
+    at.run()
+    if at.exception:
+        raise RuntimeError(f"{function} failed: {at.exception[0].message}")
+    return at.session_state.bench_seconds
+
+
+def bench_render(args):
+    """Time every page and report against generated schools of each scale"""
+
+    profiler = app.RenderProfiler(capacity=100000)
+    audit_log = app.AuditLog(tempfile.mkdtemp(prefix='bench_audit_'))
+    app.get_profiler = lambda: profiler
+    app.get_audit_log = lambda: audit_log
+
+    scope = app.DataScope(args.role, BENCH_USERS[args.role][1])
+    paths = {
+        name: RENDER_PAGES.get(name) or RENDER_REPORTS[name]
+        for name in scope.pages(list(RENDER_PAGES)) + scope.reports(list(RENDER_REPORTS))
+    }
+
+    record = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'role': args.role,
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'cold_figures': args.cold_figures,
+        'scales': {}
+    }
+    for scale in args.scales:
+        start = time.perf_counter()
+        data_manager = app.DataManager(seed=args.seed, sample_scale=scale)
+        tables = data_manager.snapshot()
+        generate_seconds = time.perf_counter() - start
+        app.get_data_manager = lambda: data_manager
+        # Versions restart with each data manager, so cached figures and grades must not carry over
+        figure_cache = app.FigureCache()
+        grading_engine = app.GradingEngine()
+        app.get_figure_cache = lambda: figure_cache
+        app.get_grading_engine = lambda: grading_engine
+        # Term scores and registers for this school, kept out of the app's data directory
+        results_store = app.ResultsStore(tempfile.mkdtemp(prefix='bench_results_'))
+        results_store.seed(tables['results'])
+        attendance_register = app.AttendanceRegister(tempfile.mkdtemp(prefix='bench_attendance_'))
+        attendance_register.seed(tables['results'])
+        app.get_results_store = lambda: results_store
+        app.get_attendance_register = lambda: attendance_register
+        print(
+            f"\nScale {scale}x: " + ', '.join(f"{len(df):,} {name}" for name, df in tables.items())
+            + f" (generated in {generate_seconds:.1f}s)"
+        )
+        print(f"{'Render':<28} {'Median ms':>10} {'Min ms':>9}  Slowest step")
+
+        timings = {}
+        for name, function in paths.items():
+            # The first render builds cached indexes, grids and masks
+            render_once(function, args.role, args.timeout)
+            profiler.clear()
+            seconds = [
+                render_once(function, args.role, args.timeout, args.cold_figures)
+                for _ in range(args.repeat)
+            ]
+            steps = profiler.summary()
+            steps = steps[steps['Span'].str.contains(' > ', regex=False)]
+            timings[name] = {
+                'median_ms': statistics.median(seconds) * 1000,
+                'min_ms': min(seconds) * 1000,
+                # Time spent in each step per render, over all its calls
+                'steps': {
+                    span.split(' > ', 1)[1]: round(total_ms / args.repeat, 3)
+                    for span, total_ms in zip(steps['Span'], steps['Total ms'])
+                }
+            }
+            slowest = max(timings[name]['steps'].items(), key=lambda step: step[1], default=None)
+            print(
+                f"{name:<28} {timings[name]['median_ms']:>10.1f} {timings[name]['min_ms']:>9.1f}  "
+                + (f"{slowest[0]} ({slowest[1]:.1f} ms)" if slowest else '')
+            )
+        record['scales'][str(scale)] = {
+            'rows': {name: len(df) for name, df in tables.items()},
+            'generate_seconds': generate_seconds,
+            'renders': timings
+        }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(record, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        regressions = compare_runs(record, args.baseline, args.tolerance, args.min_ms)
+        if regressions:
+            sys.exit(1)
+
+
+def compare_runs(record, baseline_path, tolerance, min_ms):
+    """Print renders slower than the baseline run and return them"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    regressions = []
+    for scale, results in record['scales'].items():
+        base_renders = baseline.get('scales', {}).get(scale, {}).get('renders', {})
+        for name, timing in results['renders'].items():
+            if name not in base_renders:
+                continue
+            before, after = base_renders[name]['median_ms'], timing['median_ms']
+            # Small absolute changes are noise, however large the ratio
+            if after > before * (1 + tolerance) and after - before > min_ms:
+                regressions.append((scale, name, before, after))
+
+    print(f"\nCompared with {baseline_path} ({baseline.get('created', 'unknown date')}):")
+    if not regressions:
+        print(f"no render is more than {tolerance:.0%} slower")
+    for scale, name, before, after in regressions:
+        print(f"REGRESSION {scale}x {name}: {before:.1f} ms -> {after:.1f} ms ({after / before - 1:+.0%})")
+    return regressions
+
+
+def bench_promotion(args):
+    """Time promotion decisions and the year-end rollover for each school size"""
+
+    print(
+        f"{'Students':>9} {'Evaluate ms':>12} {'One result ms':>14} {'Dry run ms':>11} "
+        f"{'Apply ms':>9} {'Rollover ms':>12}"
+    )
+    for scale in args.scales:
+        data_manager = app.DataManager(seed=args.seed, sample_scale=scale)
+        tables = data_manager.snapshot()
+
+        start = time.perf_counter()
+        engine = data_manager.promotions
+        evaluate_seconds = time.perf_counter() - start
+
+        # Editing one result re-evaluates just that student
+        result = tables['results'].iloc[[len(tables['results']) // 2]].copy()
+        result['AverageScore'] = 100 - result['AverageScore']
+        start = time.perf_counter()
+        data_manager.update_rows('results', ['StudentID', 'Year'], result)
+        update_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        engine.diff(data_manager.snapshot()['students'])
+        diff_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        data_manager.apply_promotions()
+        apply_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        data_manager.rollover()
+        rollover_seconds = time.perf_counter() - start
+
+        print(
+            f"{len(tables['students']):>9,} {evaluate_seconds * 1000:>12.1f} {update_seconds * 1000:>14.2f} "
+            f"{diff_seconds * 1000:>11.1f} {apply_seconds * 1000:>9.1f} {rollover_seconds * 1000:>12.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    timetable = subparsers.add_parser('timetable', help='timetable generation time')
+    timetable.add_argument('--classes', type=int, nargs='+', default=[22, 60, 150])
+    timetable.add_argument('--budget', type=float, default=60.0, help='time budget per school in seconds')
+    timetable.add_argument('--workers', type=int, default=1, help='parallel searches')
+    timetable.add_argument('--seed', type=int, default=0)
+    timetable.set_defaults(func=bench_timetable)
+
+    render = subparsers.add_parser('render', help='page and report render times on generated schools')
+    render.add_argument('--scales', type=int, nargs='+', default=[10, 100, 1000],
+                        help='school sizes as multiples of the 50-student sample')
+    render.add_argument('--repeat', type=int, default=3, help='timed renders per page')
+    render.add_argument('--role', choices=list(BENCH_USERS), default='admin', help='render as this role')
+    render.add_argument('--cold-figures', action='store_true',
+                        help='rebuild every chart instead of reusing cached figures')
+    render.add_argument('--seed', type=int, default=2025)
+    render.add_argument('--timeout', type=float, default=600.0, help='seconds allowed per render')
+    render.add_argument('--output', help='write results to this JSON file')
+    render.add_argument('--baseline', help='flag renders slower than in this results file')
+    render.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown, 0.25 = 25%%')
+    render.add_argument('--min-ms', type=float, default=5.0, help='ignore slowdowns smaller than this')
+    render.set_defaults(func=bench_render)
+
+    promotion = subparsers.add_parser('promotion', help='promotion decisions and year-end rollover')
+    promotion.add_argument('--scales', type=int, nargs='+', default=[100, 1000, 10000],
+                           help='school sizes as multiples of the 50-student sample')
+    promotion.add_argument('--seed', type=int, default=2025)
+    promotion.set_defaults(func=bench_promotion)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
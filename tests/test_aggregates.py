@@ -0,0 +1,42 @@
+import math
+
+import app
+
+
+def assert_matches_tables(aggregates, tables):
+    rebuilt = app.SchoolAggregates(tables)
+    assert aggregates.totals == rebuilt.totals
+    assert aggregates.counts == rebuilt.counts
+    for key, total in rebuilt.sums.items():
+        assert math.isclose(aggregates.sums[key], total, abs_tol=1e-6)
+    assert aggregates.non_null == rebuilt.non_null
+
+
+def test_aggregates_follow_appends_and_edits():
+    data_manager = app.DataManager()
+    students = data_manager.snapshot()['students']
+    data_manager.append_rows('students', students.iloc[:3].drop(columns='StudentID'))
+    data_manager.update_rows('students', 'StudentID', students.iloc[[0, 1]].assign(
+        PromotionStatus='Retained', AvgScore=[10.0, float('nan')], Class='Z'
+    ))
+    results = data_manager.snapshot()['results']
+    data_manager.update_rows('results', ['StudentID', 'Year'], results.iloc[[0]].assign(AverageScore=99.0))
+    
+    tables = data_manager.snapshot()
+    aggregates = data_manager.aggregates
+    assert_matches_tables(aggregates, tables)
+    assert aggregates.totals['students'] == len(students) + 3
+    assert aggregates.count('Class', 'Z') == 2
+    assert math.isclose(aggregates.mean('results', 'AverageScore'), tables['results']['AverageScore'].mean(), rel_tol=1e-6)
+
+
+def test_removed_rows_drop_out_of_counts():
+    students = app.DataManager().snapshot()['students']
+    aggregates = app.SchoolAggregates({'students': students})
+    level = students['CurrentLevel'].iat[0]
+    rows = students[students['CurrentLevel'] == level]
+    aggregates.remove_rows('students', rows)
+    assert aggregates.count('CurrentLevel', level) == 0
+    assert level not in aggregates.counts['CurrentLevel']
+    assert aggregates.totals['students'] == len(students) - len(rows)
+    assert math.isnan(app.SchoolAggregates({}).mean('results', 'AverageScore'))
@@ -0,0 +1,121 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import app
+
+
+def seeded(tmp_path, **kwargs):
+    register = app.AttendanceRegister(str(tmp_path), **kwargs)
+    results = pd.DataFrame({'StudentID': [1, 2, 3], 'Year': 2025, 'Attendance%': [100.0, 100.0, 100.0]})
+    register.seed(results, until='2025-01-31')
+    return register
+
+
+def test_record_appends_to_journal_not_bitmaps(tmp_path):
+    register = seeded(tmp_path)
+    bitmaps = os.path.join(str(tmp_path), '2025.npz')
+    before = os.stat(bitmaps).st_mtime_ns
+    register.record('2025-02-03', [1, 2], [True, False])
+    register.record('2025-02-03', [3], [True], periods=[1])
+    assert os.stat(bitmaps).st_mtime_ns == before
+    journal = os.path.join(str(tmp_path), '2025.journal')
+    assert os.path.getsize(journal) == 3 * app.AttendanceRegister.JOURNAL_DTYPE.itemsize
+    
+    reloaded = app.AttendanceRegister(str(tmp_path))
+    taken, present = reloaded.register('2025-02-03', [1, 2, 3, 4])
+    assert taken.tolist() == [True, True, False, False]
+    assert present.tolist() == [True, False, False, False]
+    taken, present = reloaded.register('2025-02-03', [3], periods=[1])
+    assert taken.tolist() == [True] and present.tolist() == [True]
+
+
+def test_later_marks_win_on_replay(tmp_path):
+    register = seeded(tmp_path)
+    register.record('2025-02-03', [1], [False])
+    register.record('2025-02-03', [1], [True])
+    taken, present = app.AttendanceRegister(str(tmp_path)).register('2025-02-03', [1])
+    assert present.tolist() == [True]
+
+
+def test_journal_folds_into_bitmaps_past_limit(tmp_path):
+    register = seeded(tmp_path, compact_bytes=50)
+    journal = os.path.join(str(tmp_path), '2025.journal')
+    register.record('2025-02-03', [1, 2], [True, True])
+    assert os.path.exists(journal)
+    register.record('2025-02-04', [1, 2, 3], [False, True, True])
+    assert not os.path.exists(journal)
+    taken, present = app.AttendanceRegister(str(tmp_path)).register('2025-02-04', [1, 2, 3])
+    assert taken.all() and present.tolist() == [False, True, True]
+
+
+def test_torn_journal_tail_is_ignored(tmp_path):
+    register = seeded(tmp_path)
+    register.record('2025-02-03', [2], [False])
+    with open(os.path.join(str(tmp_path), '2025.journal'), 'ab') as f:
+        f.write(b'\x01\x02\x03')
+    taken, present = app.AttendanceRegister(str(tmp_path)).register('2025-02-03', [2])
+    assert taken.tolist() == [True] and present.tolist() == [False]
+
+
+def test_journal_only_year_is_listed(tmp_path):
+    register = app.AttendanceRegister(str(tmp_path))
+    register.record('2026-01-07', [5], [True])
+    assert register.years() == [2026]
+    assert app.AttendanceRegister(str(tmp_path)).summary(2026)['DaysTaken'].tolist() == [1]
+
+
+def test_summary_and_streaks(tmp_path):
+    register = app.AttendanceRegister(str(tmp_path))
+    days = register.school_days(2025)[:5]
+    # Student 1: present, absent, absent, (no register), absent
+    for day, present in zip(days, [True, False, False, None, False]):
+        if present is not None:
+            register.record(day, [1], [present])
+    register.record(days[0], [1], [False], periods=[2])
+    summary = register.summary(2025).iloc[0]
+    assert summary['DaysTaken'] == 4 and summary['DaysAbsent'] == 3
+    assert summary['PeriodsMarked'] == 20 and summary['PeriodsPresent'] == 4
+    assert summary['Attendance%'] == 20.0
+    streaks = register.streaks(2025, [1]).iloc[0]
+    assert streaks['CurrentStreak'] == 3 and streaks['LongestStreak'] == 3
+
+
+def test_popcount_matches_bit_count(tmp_path):
+    register = app.AttendanceRegister(str(tmp_path))
+    bitmaps = np.random.RandomState(0).randint(0, 32, (4, 7)).astype('uint8')
+    expected = [sum(bin(value).count('1') for value in row) for row in bitmaps.tolist()]
+    assert register._count_bits(bitmaps, axis=1).tolist() == expected
+
+
+class MarkOnRelease:
+    """A lock that runs one hook right after it is released, as a racing writer would"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hook = None
+    
+    def __enter__(self):
+        self._lock.acquire()
+    
+    def __exit__(self, *exc):
+        self._lock.release()
+        hook, self.hook = self.hook, None
+        if hook is not None:
+            hook()
+
+
+def test_readers_keep_rows_and_arrays_from_one_moment(tmp_path):
+    register = seeded(tmp_path)
+    register._lock = MarkOnRelease()
+    register._lock.hook = lambda: register.record('2025-01-31', [4, 5], [True, False])
+    summary = register.summary(2025, student_ids=[1, 2, 4, 5])
+    assert summary['StudentID'].tolist() == [1, 2]
+    
+    register._lock.hook = lambda: register.record('2025-01-31', [6, 7], [False, False])
+    rates = register.daily_rates(2025, student_ids=[1, 6, 7])
+    assert (rates == 100).all()
+    
+    assert register.summary(2025, student_ids=[4, 5])['StudentID'].tolist() == [4, 5]
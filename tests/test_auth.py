@@ -0,0 +1,50 @@
+import time
+
+import app
+
+COOKIE = {'name': 'test_auth', 'key': 'test-key', 'expiry_days': 1}
+
+
+def authentication(**users):
+    credentials = {'usernames': {
+        username: dict({'password': 'secret', 'role': 'teacher', 'teacher_id': 'TCH007'}, **info)
+        for username, info in users.items()
+    }}
+    return app.Authentication(credentials, COOKIE, kdf_iterations=1000)
+
+
+def test_plain_passwords_are_hashed_and_verified():
+    auth = authentication(ana={}, ben={'password': app.Authentication({}, COOKIE)._hash_password('pw', iterations=2000)})
+    assert auth.users['ana']['password'].startswith('pbkdf2_sha256$1000$')
+    assert auth.users['ana']['teacher_id'] == 7
+    assert auth.authenticate('ana', 'secret') == (True, auth.users['ana'])
+    assert auth.authenticate('ana', 'wrong') == (False, None)
+    assert auth.authenticate('nobody', 'secret') == (False, None)
+    # Hashes keep the iteration count they were made with
+    assert auth.authenticate('ben', 'pw')[0]
+
+
+def test_tokens_are_signed_and_expire(monkeypatch):
+    auth = authentication(ana={}, ben={})
+    token = auth.issue_token('ana')
+    assert auth.verify_token(token) == 'ana'
+    
+    encoded, signature = token.split('.')
+    ben_payload = auth.issue_token('ben').split('.')[0]
+    assert auth.verify_token(f'{ben_payload}.{signature}') is None
+    assert auth.verify_token(encoded) is None
+    assert auth.verify_token('not a token') is None
+    # Another process reading the same hashed credentials accepts the token
+    assert authentication(ana={'password': auth.users['ana']['password']}).verify_token(token) == 'ana'
+    assert app.Authentication({'usernames': {'ana': {'password': 'secret'}}}, dict(COOKIE, key='other')).verify_token(token) is None
+    
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 2 * 86400)
+    assert auth.verify_token(token) is None
+
+
+def test_password_change_ends_sessions():
+    auth = authentication(ana={})
+    token = auth.issue_token('ana')
+    auth.users['ana']['password'] = auth._hash_password('new secret')
+    assert auth.verify_token(token) is None
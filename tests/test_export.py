@@ -0,0 +1,32 @@
+import openpyxl
+import pandas as pd
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize('fmt', ['CSV', 'Excel', 'Parquet'])
+def test_chunked_export_round_trips(fmt):
+    students = app.DataManager().snapshot()['students']
+    buffer = app.export_table(students, fmt, sheet_name='Class List', chunk_rows=7)
+    if fmt == 'CSV':
+        exported = pd.read_csv(buffer)
+    elif fmt == 'Excel':
+        assert openpyxl.load_workbook(buffer).sheetnames == ['Class List']
+        buffer.seek(0)
+        exported = pd.read_excel(buffer)
+    else:
+        exported = pd.read_parquet(buffer)
+    
+    assert list(exported.columns) == list(students.columns)
+    assert len(exported) == len(students)
+    assert list(exported['StudentID']) == list(app.format_ids(students)['StudentID'])
+    assert list(exported['FullName']) == list(students['FullName'])
+
+
+def test_empty_tables_still_export_a_header():
+    students = app.DataManager().snapshot()['students'].iloc[:0]
+    assert list(pd.read_csv(app.export_table(students, 'CSV')).columns) == list(students.columns)
+    assert list(pd.read_parquet(app.export_table(students, 'Parquet')).columns) == list(students.columns)
+    with pytest.raises(ValueError, match='Unknown export format'):
+        app.export_table(students, 'PDF')
@@ -0,0 +1,26 @@
+import app
+
+
+def test_figures_are_reused_and_least_recent_evicted():
+    cache = app.FigureCache(capacity=2)
+    built = []
+    
+    def build(name):
+        built.append(name)
+        return {'figure': name}
+    
+    first = cache.get(('a', 1), lambda: build('a'))
+    assert cache.get(('a', 1), lambda: build('again')) is first
+    cache.get(('b', 1), lambda: build('b'))
+    cache.get(('a', 1), lambda: build('again'))
+    cache.get(('c', 1), lambda: build('c'))
+    
+    assert built == ['a', 'b', 'c']
+    assert (cache.hits, cache.misses, len(cache)) == (2, 3, 2)
+    # b was the least recently used
+    cache.get(('b', 1), lambda: build('b'))
+    cache.get(('a', 2), lambda: build('a at version 2'))
+    assert built == ['a', 'b', 'c', 'b', 'a at version 2']
+    
+    cache.clear()
+    assert len(cache) == 0
@@ -0,0 +1,32 @@
+import pandas as pd
+
+import app
+
+
+def test_generated_schools_are_seeded_and_sized_by_scale():
+    school = app.generate_school(4, seed=3, years=2)
+    again = app.generate_school(4, seed=3, years=2)
+    for name, df in school.items():
+        pd.testing.assert_frame_equal(df, again[name])
+    assert not app.generate_school(4, seed=4)['students'].equals(school['students'])
+    
+    students = school['students']
+    assert len(students) == 4 * app.SAMPLE_STUDENTS
+    assert students['StudentID'].is_unique and students['IC_Number'].is_unique
+    assert len(school['parents']) < len(students)
+    assert set(school['results']['Year']) == {2024, 2025}
+    assert not school['results'].duplicated(['StudentID', 'Year']).any()
+
+
+def test_generated_schools_hold_together():
+    school = app.generate_school(6, seed=5)
+    data_manager = app.DataManager()
+    for name, df in school.items():
+        data_manager.update_table(name, df)
+    assert data_manager.relations.report().empty
+    assert data_manager.timetable_conflicts.report().empty
+    
+    students, timetable = school['students'], school['timetable']
+    classes = set(app.class_codes(students['CurrentLevel'], students['Class']))
+    assert classes == set(timetable['Class'].astype(str))
+    assert students.groupby(['CurrentLevel', 'Class'], observed=True).size().max() <= app.CLASS_SIZE
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+import app
+
+
+def results(n=300, seed=1):
+    rng = np.random.default_rng(seed)
+    scores = rng.integers(30, 100, n).astype('float64')
+    scores[::17] = np.nan
+    return pd.DataFrame({
+        'StudentID': np.arange(1, n + 1),
+        'Year': 2025,
+        'Level': pd.Categorical(rng.choice(app.LEVELS[:3], n), categories=app.LEVELS),
+        'Class': pd.Categorical(rng.choice(list('AB'), n)),
+        'AverageScore': scores,
+        'Attendance%': rng.uniform(60, 100, n)
+    })
+
+
+def test_ranks_match_pandas_min_ranks():
+    df = results()
+    book = app.GradingEngine().book(2025, 1, lambda: df).table
+    expected = {
+        'SchoolRank': df['AverageScore'].rank(method='min', ascending=False),
+        'LevelRank': df.groupby('Level', observed=True)['AverageScore'].rank(method='min', ascending=False),
+        'ClassRank': df.groupby(['Level', 'Class'], observed=True)['AverageScore'].rank(method='min', ascending=False)
+    }
+    for column, ranks in expected.items():
+        assert book[column].astype('float64').equals(ranks), column
+    
+    level_size = df.groupby('Level', observed=True)['AverageScore'].transform('size')
+    percentile = np.round((level_size - expected['LevelRank'] + 1) / level_size * 100, 1)
+    assert np.allclose(book['Percentile'], percentile, equal_nan=True)
+    assert book['Passed'].equals(df['AverageScore'] >= 50)
+
+
+def test_schemes_label_bands():
+    scheme = app.GradeScheme('Grade', 'AverageScore', {'B': 70, 'A': 80, 'F': 0})
+    labels = scheme.assign([95, 80, 79.9, 70, 12, -5, np.nan])
+    assert list(labels.categories) == ['F', 'B', 'A'] and labels.ordered
+    assert list(labels.astype(object)) == ['A', 'A', 'B', 'B', 'F', 'F', np.nan]
+
+
+def test_books_rebuild_only_when_the_version_moves():
+    engine = app.GradingEngine(pass_mark=40)
+    loads = []
+    
+    def load():
+        loads.append(1)
+        return results(20)
+    
+    first = engine.book(2025, 1, load)
+    assert engine.book(2025, 1, load) is first
+    assert engine.book(2025, 2, load) is not first
+    assert engine.book(2024, 2, load) is not first
+    assert len(loads) == 3
+    assert list(first.table.columns) == ['StudentID', 'Year'] + engine.columns
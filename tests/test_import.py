@@ -0,0 +1,63 @@
+import io
+
+import app
+
+HEADER = 'FullName,IC_Number,DOB,Gender,CurrentLevel,Class,ParentID\n'
+
+
+def import_csv(data_manager, name, text, chunk_rows=2):
+    return app.bulk_import(data_manager, name, io.StringIO(text), f'{name}.csv', chunk_rows=chunk_rows)
+
+
+def test_students_import_keeps_valid_rows_and_reports_the_rest():
+    data_manager = app.DataManager()
+    tables = data_manager.snapshot()
+    parent = app.format_id('ParentID', tables['parents']['ParentID'].iat[0])
+    taken_ic = tables['students']['IC_Number'].iat[0]
+    next_id = tables['students']['StudentID'].max() + 1
+    summary = import_csv(data_manager, 'students', HEADER + '\n'.join([
+        f'Aina Rahman,150101-14-0001,01/01/2015,female,Year 5,5a,{parent}',
+        f'Ryan Tan,150101-14-0002,2015-02-03,Male,Year 5,5A,PAR9999',
+        f'Siti Nur,{taken_ic},01/01/2015,Female,Year 5,5A,{parent}',
+        f'Jason Ng,150101-14-0003,31/02/2015,Male,Year 5,5A,{parent}',
+        f'Amir Ali,150101-14-0001,01/01/2015,Male,Year 9,5A,{parent}',
+        f'Zul Hassan,150101-14-0004,01/01/2099,Male,Year 12,5A,{parent}',
+        f',150101-14-0005,01/01/2015,Male,Year 5,5A,{parent}'
+    ]))
+    
+    assert summary['read'] == 7 and summary['imported'] == 1
+    errors = summary['errors']
+    assert set(zip(errors['Row'], errors['Error'])) == {
+        (3, 'Unknown parent'),
+        (4, 'IC number already registered'),
+        (5, 'Not a date'),
+        (6, 'IC number already registered'),
+        (7, 'Date of birth is in the future'),
+        (7, 'Unknown level'),
+        (8, 'Required')
+    }
+    added = data_manager.snapshot()['students'].iloc[-1]
+    assert added['StudentID'] == next_id
+    assert (added['FullName'], added['Gender'], added['Class']) == ('Aina Rahman', 'Female', '5A')
+
+
+def test_results_import_rejects_unknown_students_and_repeats():
+    data_manager = app.DataManager()
+    results = data_manager.snapshot()['results']
+    student, year = results['StudentID'].iat[0], int(results['Year'].iat[0])
+    header = 'StudentID,Year,Level,Class,AverageScore,Attendance%\n'
+    summary = import_csv(data_manager, 'results', header + '\n'.join([
+        f'{student},{year - 1},Year 4,4A,71.5,95%',
+        f'STU{student:04d},{year},Year 5,5A,80,90',
+        f'99999,{year - 1},Year 4,4A,70,90',
+        f'{student},{year - 1},Year 4,4A,101,90'
+    ]), chunk_rows=10)
+    
+    assert summary['imported'] == 0
+    assert set(zip(summary['errors']['Row'], summary['errors']['Error'])) == {
+        (2, 'Result repeated in file'),
+        (3, 'Result already recorded for this student and year'),
+        (4, 'Unknown student'),
+        (5, 'Result repeated in file'),
+        (5, 'Must be between 0 and 100')
+    }
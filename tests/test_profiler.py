@@ -0,0 +1,65 @@
+import threading
+import time
+
+import app
+
+
+def render(profiler, pause=0.002):
+    with profiler.span('page'):
+        with profiler.span('merge'):
+            time.sleep(pause)
+        with profiler.span('figure'):
+            with profiler.span('merge'):
+                time.sleep(pause)
+
+
+def test_spans_nest_into_one_sample_per_render():
+    profiler = app.RenderProfiler(capacity=3)
+    for _ in range(4):
+        render(profiler)
+    assert len(profiler.samples) == 3
+    
+    sample = profiler.samples[-1]
+    assert [child['name'] for child in sample['children']] == ['merge', 'figure']
+    assert sample['seconds'] >= sum(child['seconds'] for child in sample['children'])
+    assert sample['peak_bytes'] is None
+    
+    summary = profiler.summary().set_index('Span')
+    assert summary.loc['page', 'Calls'] == 3
+    assert set(summary.index) == {'page', 'page > merge', 'page > figure', 'page > figure > merge'}
+    assert list(profiler.recent(2)['Render']) == ['page', 'page']
+    
+    folded = dict(line.rsplit(' ', 1) for line in profiler.folded().splitlines())
+    assert int(folded['page;figure;merge']) >= 3 * 2000
+    
+    profiler.clear()
+    assert profiler.summary().empty and profiler.folded() == ''
+
+
+def test_threads_keep_separate_stacks_and_disabled_spans_record_nothing():
+    profiler = app.RenderProfiler()
+    threads = [threading.Thread(target=render, args=(profiler,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(profiler.samples) == 4
+    assert all(len(sample['children']) == 2 for sample in profiler.samples)
+    
+    profiler.enabled = False
+    render(profiler)
+    assert len(profiler.samples) == 4
+
+
+def test_memory_peaks_are_measured_while_tracing():
+    profiler = app.RenderProfiler(trace_memory=True)
+    try:
+        with profiler.span('page'):
+            with profiler.span('allocate'):
+                block = bytearray(4 << 20)
+                del block
+        sample = profiler.samples[-1]
+        assert sample['children'][0]['peak_bytes'] >= 4 << 20
+        assert sample['peak_bytes'] >= sample['children'][0]['peak_bytes']
+    finally:
+        profiler.set_trace_memory(False)
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+
+
+def test_rules_decide_each_student():
+    manager = app.DataManager()
+    tables = manager.snapshot()
+    decisions = manager.promotions.decisions().set_index('StudentID')
+    results = tables['results'].set_index('StudentID')
+    passed = (results['AverageScore'] >= 50) & (results['Attendance%'] >= 80)
+    expected = np.where(passed, 'Promoted', 'Retained')
+    assert (decisions.loc[results.index, 'PromotionStatus'].astype(str).to_numpy() == expected).all()
+
+
+def test_override_beats_the_rules():
+    manager = app.DataManager()
+    student_id = int(manager.snapshot()['students']['StudentID'].iloc[0])
+    manager.set_promotion_override(student_id, 'Retained')
+    decisions = manager.promotions.decisions().set_index('StudentID')
+    assert decisions.loc[student_id, 'PromotionStatus'] == 'Retained'
+    assert decisions.loc[student_id, 'Reason'] == 'Manual override'
+
+
+@pytest.mark.parametrize('backend', ['memory', 'columnar', 'sqlite'])
+def test_rollover_keeps_graduates_as_alumni(backend, tmp_path):
+    path = str(tmp_path / ('school.db' if backend == 'sqlite' else 'data'))
+    manager = app.DataManager(backend=backend, storage_path=path)
+    students = manager.snapshot()['students']
+    engine = manager.promotions
+    graduating = students['StudentID'].to_numpy()[engine.next_codes == len(app.LEVELS)]
+    assert len(graduating)
+    
+    counts = manager.rollover()
+    tables = manager.snapshot()
+    assert counts['graduated'] == len(graduating)
+    assert not tables['students']['StudentID'].isin(graduating).any()
+    assert sorted(tables['alumni']['StudentID']) == sorted(graduating)
+    assert (tables['alumni']['GraduationYear'] == engine.year).all()
+    
+    # Their results still join to a name and are not integrity errors
+    results = tables['results'][tables['results']['StudentID'].isin(graduating)]
+    joined = manager.join(results, 'students', ['FullName'])
+    assert joined['FullName'].notna().all()
+    assert manager.relations.report().empty
+    assert app.Relationships(tables).report().empty
+    
+    if backend != 'memory':
+        reloaded = app.DataManager(backend=backend, storage_path=path).snapshot()
+        assert sorted(reloaded['alumni']['StudentID']) == sorted(graduating)
+
+
+def test_store_without_alumni_loads_empty_archive(tmp_path):
+    path = str(tmp_path / 'data')
+    app.DataManager(backend='columnar', storage_path=path).snapshot()
+    store = app.ColumnarStore(path, {'alumni': 'ALUMNI'})
+    for chunk in store._chunks('alumni'):
+        (tmp_path / 'data' / 'ALUMNI' / chunk.rsplit('/', 1)[-1]).unlink()
+    tables = app.DataManager(backend='columnar', storage_path=path).snapshot()
+    assert tables['alumni'].empty
+    assert len(tables['students']) == 50
+
+
+def test_scoped_join_hides_alumni_from_teachers():
+    manager = app.DataManager()
+    manager.rollover()
+    tables = manager.snapshot()
+    scope = app.DataScope('teacher', int(tables['timetable']['TeacherID'].iloc[0]))
+    alumni_results = tables['results'][tables['results']['StudentID'].isin(tables['alumni']['StudentID'])]
+    assert manager.join(alumni_results, 'students', ['FullName'], scope=scope)['FullName'].isna().all()
+    pd.testing.assert_series_equal(
+        manager.join(alumni_results, 'students', ['FullName'])['FullName'],
+        alumni_results.merge(tables['alumni'][['StudentID', 'FullName']], on='StudentID')['FullName']
+    )
+
+
+def test_level_thresholds_replace_the_school_wide_ones():
+    rules = app.PromotionRules(min_score=50, min_attendance=80, levels={'Year 6': {'min_score': 70}})
+    scores, attendance = rules.thresholds(np.array([app.LEVELS.index('Year 6'), 0, -1]))
+    assert list(scores) == [70, 50, 50] and list(attendance) == [80, 80, 80]
+
+
+def test_incremental_decisions_match_a_rebuild():
+    manager = app.DataManager()
+    tables = manager.snapshot()
+    students, results = tables['students'], tables['results']
+    manager.append_rows('students', students.iloc[:2].drop(columns='StudentID'))
+    manager.update_rows('students', 'StudentID', students.iloc[[3]].assign(CurrentLevel='Year 11'))
+    manager.update_rows('results', ['StudentID', 'Year'], results.iloc[[0, 1]].assign(AverageScore=[10.0, 95.0]))
+    
+    tables = manager.snapshot()
+    rebuilt = app.PromotionEngine(app.PromotionRules(), tables['students'], tables['results'])
+    pd.testing.assert_frame_equal(manager.promotions.decisions(), rebuilt.decisions())
+    decisions = rebuilt.decisions().set_index('StudentID')
+    assert decisions['Reason'].iloc[-1] == f'No {rebuilt.year} results'
+    assert decisions['PromotionStatus'].iloc[-1] == 'Pending'
+
+
+def test_overrides_and_year_survive_restarts(tmp_path):
+    path = str(tmp_path / 'promotion' / 'state.json')
+    rules = app.PromotionRules(state_path=path)
+    rules.start_year(2025)
+    rules.set_override(7, 'Promoted')
+    rules.set_override(8, 'Retained')
+    rules.set_override(8, None)
+    
+    reloaded = app.PromotionRules(state_path=path)
+    assert (reloaded.year, reloaded.overrides) == (2025, {7: 'Promoted'})
+    reloaded.start_year(2026)
+    assert app.PromotionRules(state_path=path).overrides == {}
+
+
+def test_override_is_a_students_write():
+    manager = app.DataManager()
+    tables, versions = manager.versioned_snapshot()
+    student_id = int(tables['students']['StudentID'].iloc[0])
+    manager.set_writer('session-b', 'admin.b')
+    seen = manager.promotion_overrides()
+    manager.set_promotion_override(student_id, 'Retained')
+    
+    assert seen == {} and manager.promotion_overrides() == {student_id: 'Retained'}
+    change = manager.changes_since(versions['students'])[-1]
+    assert (change['table'], change['action'], change['user']) == ('students', 'override', 'admin.b')
+    # A decision reviewed before the override cannot be applied over it
+    with pytest.raises(app.WriteConflict):
+        manager.apply_promotions(expected_version=versions['students'])
+    manager.apply_promotions(expected_version=manager.versioned_snapshot()[1]['students'])
+    assert manager.snapshot()['students'].set_index('StudentID').loc[student_id, 'PromotionStatus'] == 'Retained'
@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+
+import app
+
+
+def manager(backend, tmp_path):
+    if backend == 'memory':
+        return app.DataManager()
+    return app.DataManager(backend='sqlite', storage_path=str(tmp_path / 'school.db'))
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_pages_cover_the_sorted_table(backend, tmp_path):
+    data_manager = manager(backend, tmp_path)
+    students = data_manager.snapshot()['students']
+    pages = []
+    for offset in range(0, len(students), 7):
+        page, total = data_manager.query('students', limit=7, offset=offset, sort_by='CurrentLevel', ascending=False)
+        assert total == len(students)
+        pages.append(page)
+    ordered = pd.concat(pages, ignore_index=True)
+    
+    levels = ordered['CurrentLevel'].astype(str).str[5:].astype(int)
+    assert levels.is_monotonic_decreasing
+    assert sorted(ordered['StudentID']) == sorted(students['StudentID'])
+    # Ties keep table order
+    for _, group in ordered.groupby(levels):
+        assert group['StudentID'].is_monotonic_increasing
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_filters_and_summary_agree_with_pandas(backend, tmp_path):
+    data_manager = manager(backend, tmp_path)
+    students = data_manager.snapshot()['students']
+    level = students['CurrentLevel'].iat[0]
+    expected = students[students['CurrentLevel'] == level]
+    
+    page, total = data_manager.query('students', filters={'CurrentLevel': level}, limit=3)
+    assert total == len(expected)
+    assert list(page['StudentID']) == list(expected['StudentID'][:3])
+    
+    summary = data_manager.summarize('students', 'Class', 'AvgScore', filters={'CurrentLevel': level})
+    assert summary['total'] == len(expected)
+    assert summary['counts'] == {key: value for key, value in expected['Class'].value_counts().items() if value}
+    assert summary['mean'] == pytest.approx(expected['AvgScore'].mean(), rel=1e-5)
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+import app
+
+
+def test_key_index_gathers_positions():
+    index = app.KeyIndex([3, 1, 2])
+    assert index.get([1, 2, 3, 4, -1]).tolist() == [1, 2, 0, -1, -1]
+
+
+def test_key_index_sparse_id_survives_growth():
+    index = app.KeyIndex([1, 2, 3])
+    index.add([5000], 3)
+    assert 5000 in index._sparse
+    # Enough new IDs to grow the dense array past the sparse one
+    index.add(np.r_[10:4000, 6000], 4)
+    assert len(index._positions) > 5000
+    assert index.get([5000]).tolist() == [3]
+    index.move([5000], [6], [3])
+    assert index.get([5000, 6]).tolist() == [-1, 3]
+
+
+def test_key_index_negative_and_missing_ids():
+    index = app.KeyIndex([1, 2])
+    index.add([-7], 2)
+    assert index.get([-7, np.nan, 10 ** 9]).tolist() == [2, -1, -1]
+    assert index.get([2]).tolist() == [1]
+
+
+def test_incremental_dangling_matches_full_check():
+    manager = app.DataManager()
+    tables = manager.snapshot()
+    relations = manager.relations
+    assert relations.report().empty
+    
+    result = tables['results'].iloc[[0]].assign(StudentID=999, Year=2030)
+    manager.append_rows('results', result)
+    assert relations.report()['Missing'].tolist() == ['STU0999']
+    
+    student = tables['students'].iloc[[0]].assign(StudentID=999, ParentID=777)
+    manager.append_rows('students', student)
+    assert relations.report()['Missing'].tolist() == ['PAR0777']
+    assert relations.report().equals(app.Relationships(manager.snapshot()).report())
+    
+    manager.update_rows('students', 'StudentID', student.assign(ParentID=1))
+    assert relations.report().empty
+
+
+def test_join_matches_merge():
+    manager = app.DataManager()
+    tables = manager.snapshot()
+    results = tables['results']
+    expected = results.merge(tables['students'][['StudentID', 'FullName']], on='StudentID', how='left')
+    assert manager.join(results, 'students', ['FullName']).equals(expected)
+    
+    missing = pd.concat([results.iloc[:2], results.iloc[:1].assign(StudentID=999)], ignore_index=True)
+    assert len(manager.join(missing, 'students', ['FullName'], how='inner')) == 2
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+import app
+
+
+def scores(student_ids, subjects=('Mathematics', 'English'), score=70.0, level='Year 5'):
+    return pd.DataFrame({
+        'StudentID': np.repeat(student_ids, len(subjects)),
+        'Level': level,
+        'Class': 'A',
+        'Subject': list(subjects) * len(student_ids),
+        'Score': score,
+        'Attendance%': 90.0
+    })
+
+
+def test_partitions_are_read_only_inside_the_year_range(tmp_path):
+    store = app.ResultsStore(str(tmp_path / 'results'))
+    assert store.current() is None and store.query().empty
+    store.write_term(2023, 1, scores([3, 1, 2], level='Year 4'))
+    store.write_term(2024, 1, scores([1, 2], score=60.0))
+    store.write_term(2024, 2, scores([2, 5], score=80.0))
+    
+    assert store.partitions() == [(2023, 1), (2024, 1), (2024, 2)]
+    assert store.partitions(2024) == [(2024, 1), (2024, 2)]
+    assert store.current() == (2024, 2)
+    assert store.years() == [2023, 2024]
+    
+    history = store.query(2023, 2023)
+    assert set(history['Year']) == {2023}
+    assert list(history['StudentID']) == [1, 1, 2, 2, 3, 3]
+    combined = store.query(terms=[1])
+    assert list(combined['Level'].cat.categories) == ['Year 4', 'Year 5']
+    assert len(store.query(2024, 2024, terms=[2])) == 4
+
+
+def test_transcripts_and_yearly_results(tmp_path):
+    store = app.ResultsStore(str(tmp_path / 'results'))
+    store.write_term(2024, 1, scores([1, 2, 3], score=60.0))
+    store.write_term(2024, 2, scores([2, 3, 4], score=80.0))
+    version = store.version
+    
+    transcript = store.transcript(2)
+    assert list(zip(transcript['Term'], transcript['Score'])) == [(1, 60.0), (1, 60.0), (2, 80.0), (2, 80.0)]
+    assert store.transcript(9).empty
+    
+    yearly = store.yearly_results(student_ids=[1, 2])
+    assert list(yearly['StudentID']) == [1, 2]
+    assert list(yearly['AverageScore']) == [60.0, 70.0]
+    
+    store.record_scores(2024, 2, scores([4], subjects=('Mathematics',), score=50.0))
+    assert store.version == version + 1
+    term = store.query(2024, 2024, terms=[2], student_ids=[4]).set_index('Subject')['Score']
+    assert term.to_dict() == {'English': 80.0, 'Mathematics': 50.0}
+    assert len(store.query(2024, 2024, terms=[2])) == 6
+
+
+def test_seeded_history_follows_each_students_levels(tmp_path):
+    results = app.DataManager().snapshot()['results']
+    store = app.ResultsStore(str(tmp_path / 'results'))
+    store.seed(results, years=2, current_term=2)
+    current = int(results['Year'].max())
+    assert store.partitions() == [(current - 1, 1), (current - 1, 2), (current - 1, 3), (current, 1), (current, 2)]
+    
+    yearly = store.yearly_results(current, current).set_index('StudentID')
+    expected = results[results['Year'] == current].set_index('StudentID')['AverageScore']
+    assert np.allclose(yearly['AverageScore'].reindex(expected.index), expected.clip(0, 100), atol=8)
+    first_years = results.loc[(results['Year'] == current) & (results['Level'] == 'Year 1'), 'StudentID']
+    assert store.query(current - 1, current - 1, student_ids=first_years).empty
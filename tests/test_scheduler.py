@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+
+import app
+
+REQUIREMENTS = {'Mathematics': 5, 'English': 4, 'Science': 4, 'History': 2}
+CLASSES = ['1A', '1B', '2A', '2B']
+
+
+def staff(per_subject=2, periods=20):
+    subjects = [subject for subject in REQUIREMENTS for _ in range(per_subject)]
+    return pd.DataFrame({
+        'TeacherID': range(1, len(subjects) + 1), 'SubjectSpecialty': subjects, 'AssignedPeriods': periods
+    })
+
+
+def test_solve_builds_a_clash_free_week():
+    scheduler = app.TimetableScheduler(CLASSES, staff(), requirements=REQUIREMENTS)
+    timetable, stats = scheduler.solve(time_budget=5, seed=1)
+    
+    assert stats['clashes'] == 0 and stats['spread_violations'] == 0
+    assert stats['lessons'] == len(timetable) == len(CLASSES) * sum(REQUIREMENTS.values())
+    counts = timetable.groupby(['Class', 'Subject']).size()
+    assert all(counts[(name, subject)] == periods for name in CLASSES for subject, periods in REQUIREMENTS.items())
+    assert not timetable.duplicated(['TeacherID', 'Day', 'Period']).any()
+    assert not timetable.duplicated(['Class', 'Day', 'Period']).any()
+    assert timetable.groupby(['Class', 'Subject', 'Day']).size().max() <= scheduler.max_daily
+    assert app.TimetableConflicts(timetable).report().empty
+    
+    again, _ = scheduler.solve(time_budget=5, seed=1)
+    pd.testing.assert_frame_equal(timetable, again)
+
+
+def test_allocation_respects_teacher_limits():
+    allocation = app.TimetableScheduler(CLASSES, staff(periods=10), requirements=REQUIREMENTS).allocate_teachers()
+    load = pd.Series(
+        [REQUIREMENTS[subject] for (_, subject) in allocation], index=list(allocation.values())
+    ).groupby(level=0).sum()
+    assert load.max() <= 10
+    with pytest.raises(ValueError, match='No Mathematics teacher'):
+        app.TimetableScheduler(CLASSES, staff(per_subject=1, periods=10), requirements=REQUIREMENTS).allocate_teachers()
+
+
+def test_impossible_schools_are_rejected():
+    with pytest.raises(ValueError, match='rooms'):
+        app.TimetableScheduler(CLASSES, staff(), rooms={'R1': 40}, requirements=REQUIREMENTS).solve(time_budget=1)
+    with pytest.raises(ValueError, match='holds class 1A'):
+        app.TimetableScheduler(CLASSES, staff(), requirements=REQUIREMENTS, class_sizes={'1A': 50}).solve(time_budget=1)
+    with pytest.raises(ValueError, match='week has'):
+        app.TimetableScheduler(['1A'], staff(), requirements=dict(REQUIREMENTS, Mathematics=16)).solve(time_budget=1)
+
+
+def test_classes_get_rooms_that_hold_their_enrolment():
+    tables = app.DataManager().snapshot()
+    enrolment = app.class_enrolment(tables['students'])
+    classes = tables['timetable']['Class'].astype(str).unique().tolist()
+    # One room per class, each only just big enough for some class
+    seats = sorted(enrolment.get(name, 0) for name in classes)
+    rooms = {f'S{i}': size for i, size in enumerate(seats[::-1])}
+    
+    timetable, _ = app.TimetableScheduler(
+        classes, tables['teachers'], rooms=rooms, class_sizes=enrolment
+    ).solve(time_budget=5)
+    homes = timetable.drop_duplicates('Class').set_index('Class')['Room']
+    assert all(rooms[homes[name]] >= enrolment.get(name, 0) for name in classes)
+    
+    current = tables['timetable'].drop_duplicates('Class')
+    school = app.school_rooms(tables['timetable'])
+    assert all(school[str(room)] >= enrolment.get(str(name), 0) for name, room in zip(current['Class'], current['Room']))
+    with pytest.raises(ValueError, match='No free room holds'):
+        app.TimetableScheduler(classes, tables['teachers'], rooms=dict(rooms, S0=1), class_sizes=enrolment).solve(time_budget=1)
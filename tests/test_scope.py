@@ -0,0 +1,49 @@
+import app
+
+
+def test_teacher_sees_only_the_classes_they_teach():
+    data_manager = app.DataManager()
+    tables = data_manager.snapshot()
+    timetable = tables['timetable']
+    teacher_id = int(timetable['TeacherID'].iat[0])
+    taught = set(timetable.loc[timetable['TeacherID'] == teacher_id, 'Class'].astype(str))
+    
+    scope = app.DataScope('teacher', teacher_id)
+    view, _ = data_manager.scoped_snapshot(scope)
+    assert set(view['timetable']['Class'].astype(str)) == taught
+    students = view['students']
+    assert set(app.class_codes(students['CurrentLevel'], students['Class'])) <= taught
+    assert len(students) == app.class_codes(tables['students']['CurrentLevel'], tables['students']['Class']).isin(taught).sum()
+    assert set(view['parents']['ParentID']) == set(students['ParentID'])
+    assert set(app.class_codes(view['results']['Level'], view['results']['Class'])) <= taught
+    assert view['alumni'].empty
+    assert len(view['teachers']) == len(tables['teachers'])
+    
+    assert data_manager.scoped_aggregates(scope).totals['students'] == len(students)
+    page, total = data_manager.query('students', scope=scope, limit=5)
+    assert total == len(students) and set(page['StudentID']) <= set(students['StudentID'])
+
+
+def test_staff_lose_academic_records_and_pages():
+    data_manager = app.DataManager()
+    scope = app.DataScope('staff')
+    view, _ = data_manager.scoped_snapshot(scope)
+    assert view['results'].empty
+    assert not set(app.ACADEMIC_COLUMNS['students']) & set(view['students'].columns)
+    assert len(view['students']) == len(data_manager.snapshot()['students'])
+    page, _ = data_manager.query('students', scope=scope, limit=5)
+    assert 'AvgScore' not in page.columns
+    assert scope.pages(['Dashboard', 'Results', 'Reports', 'Diagnostics']) == ['Dashboard', 'Reports']
+    assert scope.reports(['Class List Report', 'Attendance Summary']) == ['Class List Report']
+
+
+def test_views_are_reused_until_the_next_write():
+    data_manager = app.DataManager()
+    scope = app.DataScope('teacher', int(data_manager.snapshot()['timetable']['TeacherID'].iat[0]))
+    first, _ = data_manager.scoped_snapshot(scope)
+    assert data_manager.scoped_snapshot(scope)[0]['students'] is first['students']
+    
+    data_manager.update_rows('students', 'StudentID', first['students'].iloc[[0]].assign(FullName='Renamed'))
+    assert data_manager.scoped_snapshot(scope)[0]['students']['FullName'].iat[0] == 'Renamed'
+    assert app.DataScope('admin').pages(['Diagnostics']) == ['Diagnostics']
+    assert data_manager.scoped_snapshot(app.DataScope('admin'))[0]['students'] is data_manager.snapshot()['students']
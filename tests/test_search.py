@@ -0,0 +1,59 @@
+import sqlite3
+
+import pytest
+
+import app
+
+
+def manager(backend, tmp_path):
+    if backend == 'memory':
+        return app.DataManager()
+    path = str(tmp_path / ('school.db' if backend == 'sqlite' else 'data'))
+    return app.DataManager(backend=backend, storage_path=path)
+
+
+def names(data_manager, search):
+    page, total = data_manager.query('students', search=search)
+    assert total == len(page)
+    return set(page['FullName'])
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_name_variants_and_edits_are_searchable(backend, tmp_path):
+    data_manager = manager(backend, tmp_path)
+    students = data_manager.snapshot()['students']
+    data_manager.update_rows('students', 'StudentID', students.iloc[[4]].assign(FullName='Mohd Ali Zainal'))
+    data_manager.update_rows('students', 'StudentID', students.iloc[[5]].assign(FullName='Noor Aishah Ramli'))
+    data_manager.update_rows('students', 'StudentID', students.iloc[[6]].assign(FullName='Qistina Yusof'))
+    data_manager.update_rows('students', 'StudentID', students.iloc[[6]].assign(FullName='Xavier Ong'))
+    
+    assert 'Mohd Ali Zainal' in names(data_manager, 'muhammad ali')
+    assert 'Mohd Ali Zainal' in names(data_manager, 'Muhamad Al')
+    assert 'Noor Aishah Ramli' in names(data_manager, 'nur aisyah')
+    assert names(data_manager, 'qistina yusof') == set()
+    assert names(data_manager, 'xavier ong') == {'Xavier Ong'}
+
+
+def test_search_ranks_best_match_first():
+    index = app.SearchIndex(['Tan Wei Ming', 'Tan Mei Ling', 'Wei Tan'], [1, 2, 3])
+    assert list(index.search('tan wei')) == [0, 2]
+    assert list(index.search('S0002', query_id=2))[0] == 1
+    index.update(0, 'Lim Kah Seng', 1)
+    assert list(index.search('tan wei')) == [2]
+    assert list(index.search('lim kah')) == [0]
+
+
+def test_sqlite_reindexes_names_saved_before_normalization(tmp_path):
+    path = str(tmp_path / 'school.db')
+    data_manager = manager('sqlite', tmp_path)
+    students = data_manager.snapshot()['students']
+    data_manager.update_rows('students', 'StudentID', students.iloc[[2]].assign(FullName='Muhd Hafiz'))
+    conn = sqlite3.connect(path)
+    conn.execute('DROP TRIGGER "students_fts_update"')
+    conn.execute('DROP TABLE "students_fts"')
+    conn.execute('CREATE VIRTUAL TABLE "students_fts" USING fts5("FullName", content="students", content_rowid="rowid")')
+    conn.commit()
+    conn.close()
+    
+    reloaded = app.DataManager(backend='sqlite', storage_path=path)
+    assert names(reloaded, 'muhammad hafiz') == {'Muhd Hafiz'}
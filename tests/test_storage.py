@@ -0,0 +1,113 @@
+import os
+
+import pandas as pd
+import pytest
+
+import app
+
+
+def manager(backend, tmp_path):
+    path = str(tmp_path / ('school.db' if backend == 'sqlite' else 'data'))
+    return app.DataManager(backend=backend, storage_path=path), path
+
+
+@pytest.mark.parametrize('backend', ['columnar', 'sqlite'])
+def test_edits_persist(backend, tmp_path):
+    data_manager, path = manager(backend, tmp_path)
+    students = data_manager.snapshot()['students']
+    edited = students.iloc[[3]].assign(FullName='Renamed Student', Class='Z')
+    data_manager.update_rows('students', 'StudentID', edited)
+    lesson = data_manager.snapshot()['timetable'].iloc[[0]].assign(Room='R99')
+    data_manager.update_rows('timetable', ['Class', 'Day', 'Period'], lesson)
+    
+    reloaded = app.DataManager(backend=backend, storage_path=path).snapshot()
+    pd.testing.assert_frame_equal(reloaded['students'], data_manager.snapshot()['students'], check_categorical=False)
+    assert reloaded['students']['FullName'].iat[3] == 'Renamed Student'
+    assert reloaded['timetable']['Room'].astype(str).iat[0] == 'R99'
+    assert len(reloaded['timetable']) == len(data_manager.snapshot()['timetable'])
+
+
+def test_columnar_edit_rewrites_only_its_chunk(tmp_path, monkeypatch):
+    monkeypatch.setattr(app.ColumnarStore, 'CHUNK_ROWS', 10)
+    data_manager, path = manager('columnar', tmp_path)
+    students = data_manager.snapshot()['students']
+    store = data_manager.storage
+    chunks = store._chunks('students')
+    assert len(chunks) == 5
+    before = {chunk: os.stat(chunk).st_mtime_ns for chunk in chunks}
+    
+    data_manager.update_rows('students', 'StudentID', students.iloc[[23]].assign(FullName='Edited'))
+    changed = [chunk for chunk in chunks if os.stat(chunk).st_mtime_ns != before[chunk]]
+    assert changed == [chunks[2]]
+    assert store.read_table('students')['FullName'].iat[23] == 'Edited'
+
+
+def test_edit_leaves_published_snapshot_alone():
+    data_manager = app.DataManager()
+    before = data_manager.snapshot()['students']
+    name = before['FullName'].iat[0]
+    data_manager.update_rows('students', 'StudentID', before.iloc[[0]].assign(FullName='Someone Else'))
+    assert before['FullName'].iat[0] == name
+    assert data_manager.snapshot()['students']['FullName'].iat[0] == 'Someone Else'
+
+
+def test_columnar_compacts_only_small_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(app.ColumnarStore, 'CHUNK_ROWS', 10)
+    monkeypatch.setattr(app.ColumnarStore, 'MAX_CHUNKS', 3)
+    data_manager, path = manager('columnar', tmp_path)
+    students = data_manager.snapshot()['students']
+    store = data_manager.storage
+    assert len(store._chunks('students')) == 5
+    
+    for number in range(2):
+        data_manager.append_rows('students', students.iloc[[0]].drop(columns='StudentID').assign(IC_Number=f'X{number}'))
+    assert len(store._chunks('students')) == 7
+    data_manager.append_rows('students', students.iloc[[0]].drop(columns='StudentID').assign(IC_Number='X2'))
+    # Three appended chunks fold back into full ones: 53 rows in 6 chunks
+    assert store._chunk_rows(store._chunks('students')) == [10, 10, 10, 10, 10, 3]
+    assert len(app.DataManager(backend='columnar', storage_path=path).snapshot()['students']) == 53
+
+
+def test_dates_parse_iso_and_legacy_day_first():
+    df = pd.DataFrame({'DOB': ['2010-09-28 00:00:00', '2010-01-12 00:00:00', '31/01/2010', '05/03/2011', None]})
+    assert app.apply_schema('students', df)['DOB'].dt.strftime('%Y-%m-%d').fillna('').tolist() == [
+        '2010-09-28', '2010-01-12', '2010-01-31', '2011-03-05', ''
+    ]
+
+
+
+def test_legacy_formatted_values_load_into_compact_types():
+    df = pd.DataFrame({
+        'StudentID': ['STU0001', 'STU0012'], 'ParentID': ['PAR0003', 'PAR0004'],
+        'CurrentLevel': ['Year 10', 'Year 2'], 'Attendance%': ['87%', '92.5%'], 'AvgScore': [71, 64.5]
+    })
+    typed = app.apply_schema('students', df)
+    assert typed['StudentID'].tolist() == [1, 12] and typed['StudentID'].dtype == 'int32'
+    assert typed['Attendance%'].tolist() == [87.0, 92.5] and typed['Attendance%'].dtype == 'float32'
+    assert typed['CurrentLevel'].cat.ordered and typed['CurrentLevel'].max() == 'Year 10'
+    assert list(df['StudentID']) == ['STU0001', 'STU0012']
+    
+    students = app.DataManager().snapshot()['students']
+    assert students.memory_usage(deep=True).sum() < students.astype(object).memory_usage(deep=True).sum() / 2
+
+
+@pytest.mark.parametrize('backend', ['columnar', 'sqlite'])
+def test_ids_are_never_reused(backend, tmp_path):
+    data_manager, path = manager(backend, tmp_path)
+    students = data_manager.snapshot()['students']
+    first = students['StudentID'].max() + 1
+    reserved = data_manager.allocate_ids('students', 2)
+    assert list(reserved) == [first, first + 1]
+    
+    ids = data_manager.append_rows('students', students.iloc[:2].drop(columns='StudentID'))
+    assert list(ids) == [first + 2, first + 3]
+    data_manager.append_rows('students', students.iloc[[0]].assign(StudentID=first + 10))
+    
+    # Buffered rows show up on the next read, in order
+    tail = data_manager.snapshot()['students']['StudentID'].iloc[-3:]
+    assert list(tail) == [first + 2, first + 3, first + 10]
+    data_manager.update_table('students', students)
+    
+    reloaded = app.DataManager(backend=backend, storage_path=path)
+    assert len(reloaded.snapshot()['students']) == len(students)
+    assert list(reloaded.allocate_ids('students')) == [first + 11]
@@ -0,0 +1,63 @@
+import pandas as pd
+
+import app
+
+
+def test_grids_place_every_lesson_in_its_slot():
+    tables = app.DataManager().snapshot()
+    timetable, teachers = tables['timetable'], tables['teachers']
+    names = dict(zip(teachers['TeacherID'], teachers['Name']))
+    first = timetable.drop_duplicates(['Class', 'Day', 'Period'])
+    
+    grids = app.build_timetable_grids(timetable, teachers)
+    assert list(grids.columns) == app.DAYS
+    for lesson in first.itertuples(index=False):
+        cell = grids.loc[(lesson.Class, f'Period {lesson.Period}'), lesson.Day]
+        assert cell == f"{lesson.Subject}\n{names[lesson.TeacherID]}\nRoom {lesson.Room}"
+    assert (grids != '—').to_numpy().sum() == len(first)
+    
+    by_teacher = app.build_timetable_grids(timetable, teachers, by='TeacherID')
+    lesson = timetable.iloc[0]
+    assert by_teacher.loc[(lesson['TeacherID'], f"Period {lesson['Period']}"), lesson['Day']].split('\n')[1] == str(lesson['Class'])
+
+
+def test_first_lesson_in_a_shared_slot_is_shown():
+    teachers = pd.DataFrame({'TeacherID': [1, 2], 'Name': ['Ms A', 'Mr B']})
+    timetable = pd.DataFrame({
+        'Class': ['1A', '1A', '1A'], 'Day': ['Monday', 'Monday', 'Friday'], 'Period': [1, 1, 2],
+        'Subject': ['Maths', 'Art', 'Science'], 'TeacherID': [1, 2, 2], 'Room': ['R1', 'R2', 'R3']
+    })
+    grid = app.build_timetable_grids(timetable, teachers).loc['1A']
+    assert grid.loc['Period 1', 'Monday'] == 'Maths\nMs A\nRoom R1'
+    assert grid.loc['Period 2', 'Friday'] == 'Science\nMr B\nRoom R3'
+    assert grid.loc['Period 2', 'Monday'] == '—'
+
+
+def lesson(**values):
+    return dict({'TeacherID': 1, 'Room': 'R1', 'Class': '1A', 'Day': 'Monday', 'Period': 1}, **values)
+
+
+def test_conflicts_follow_bookings_and_edits():
+    timetable = pd.DataFrame([lesson(), lesson(Class='1B', Room='R2'), lesson(TeacherID=2, Room='R3', Class='2A', Period=2)])
+    conflicts = app.TimetableConflicts(timetable)
+    report = conflicts.report()
+    assert report[['Resource', 'Value', 'Classes', 'Lessons']].values.tolist() == [['TeacherID', 1, '1A, 1B', 2]]
+    
+    assert conflicts.check(lesson(Room='R3', Class='2A', Period=2)) == [
+        ('Room', 'R3', [2]), ('Class', '2A', [2])
+    ]
+    assert conflicts.check(lesson(TeacherID=2, Room='R3', Class='2A', Period=2), ignore=2) == []
+    
+    conflicts.update(1, lesson(Class='1B', Room='R2', Period=3))
+    assert conflicts.report().empty
+    assert conflicts.booked('Class', '1B', 'Monday', 3) == {1}
+    conflicts.add(3, lesson(TeacherID=3, Class='1B', Room='R2', Period=3))
+    assert set(conflicts.report()['Resource']) == {'Room', 'Class'}
+
+
+def test_data_manager_keeps_conflicts_current():
+    data_manager = app.DataManager()
+    timetable = data_manager.snapshot()['timetable']
+    assert data_manager.timetable_conflicts.report().empty
+    data_manager.append_rows('timetable', timetable.iloc[[0]].assign(Class='Z'))
+    assert set(data_manager.timetable_conflicts.report()['Resource']) == {'TeacherID', 'Room'}
@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+
+import app
+
+
+def test_stale_writes_raise_and_fresh_ones_land():
+    data_manager = app.DataManager()
+    tables, versions = data_manager.versioned_snapshot()
+    students = tables['students']
+    data_manager.set_writer('session-a', 'alice')
+    data_manager.update_rows('students', 'StudentID', students.iloc[[0]].assign(Class='Z'),
+                             expected_version=versions['students'])
+    
+    with pytest.raises(app.WriteConflict) as conflict:
+        data_manager.update_rows('students', 'StudentID', students.iloc[[1]].assign(Class='Y'),
+                                 expected_version=versions['students'])
+    assert conflict.value.name == 'students'
+    assert conflict.value.current_version > versions['students']
+    assert data_manager.snapshot()['students']['Class'].iat[1] == students['Class'].iat[1]
+    
+    # Other tables keep their own versions
+    data_manager.update_table('teachers', tables['teachers'], expected_version=versions['teachers'])
+    
+    changes = data_manager.changes_since(data_manager.version - 2)
+    assert [(change['table'], change['action'], change['user']) for change in changes] == [
+        ('students', 'update', 'alice'), ('teachers', 'replace', 'alice')
+    ]
+
+
+def test_readers_see_whole_writes_only():
+    data_manager = app.DataManager()
+    students = data_manager.snapshot()['students']
+    failures = []
+    done = threading.Event()
+    
+    def read():
+        while not done.is_set():
+            tables, versions = data_manager.versioned_snapshot()
+            # Every write below appends two rows at once
+            if (len(tables['students']) - len(students)) % 2:
+                failures.append(len(tables['students']))
+    
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    for reader in readers:
+        reader.start()
+    for _ in range(20):
+        data_manager.append_rows('students', students.iloc[:2].drop(columns='StudentID'))
+    done.set()
+    for reader in readers:
+        reader.join()
+    
+    assert not failures
+    assert len(data_manager.snapshot()['students']) == len(students) + 40